@@ -0,0 +1,372 @@
+#
+#  Copyright (C) 2026
+#    Smithsonian Astrophysical Observatory
+#
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program; if not, write to the Free Software Foundation, Inc.,
+#  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+A cache for the intermediate products - such as aspect histograms,
+instrument maps, and exposure maps - created by fluximage and the
+scripts that use it.
+
+The cache is opt in: it is only used when the CIAO_CONTRIB_CACHE
+environment variable is set to the directory to use. The maximum size
+of the cache, in MB, can be set with the CIAO_CONTRIB_CACHE_SIZE
+environment variable (the default is 10240). The least-recently used
+entries are removed when the cache is too large.
+
+Entries are keyed by a hash of the tool name, its parameter values,
+the size and modification time of the input files, and the CALDB
+version. Outputs are copied into, and out of, the cache, rather than
+linked, since the outputs are often edited in place (e.g. to add
+history records), and this must not change the cached version.
+
+The number of hits and misses are recorded in a file so that the
+counts are available even when the tools are run in separate
+processes.
+
+"""
+
+import functools
+import hashlib
+import os
+import shutil
+
+import ciao_contrib.logger_wrapper as lw
+
+__all__ = ("ProductCache", "get_product_cache")
+
+lgr = lw.initialize_module_logger('_tools.cache')
+v1 = lgr.verbose1
+v2 = lgr.verbose2
+v3 = lgr.verbose3
+
+CACHE_ENV = "CIAO_CONTRIB_CACHE"
+CACHE_SIZE_ENV = "CIAO_CONTRIB_CACHE_SIZE"
+
+DEFAULT_CACHE_SIZE = 10240
+
+
+@functools.lru_cache(maxsize=None)
+def get_caldb_version():
+    """The installed CALDB version, or "unknown" if it can not be found."""
+
+    try:
+        from ciao_contrib.caldb import get_caldb_installed_version
+        return get_caldb_installed_version()
+    except Exception:
+        return "unknown"
+
+
+def strip_filter(infile):
+    """Remove any DM filter or block specifier from the file name.
+
+    >>> strip_filter("evt2.fits[ccd_id=7][bin sky=1]")
+    'evt2.fits'
+
+    """
+
+    idx = infile.find('[')
+    if idx < 0:
+        return infile
+
+    return infile[:idx]
+
+
+def expand_stack(infile):
+    """Return the files in a stack (@file or comma-separated list).
+
+    Names with a DM filter are not expanded, since the filter can
+    contain commas.
+    """
+
+    if not infile.startswith('@') and \
+       (',' not in infile or '[' in infile):
+        return [infile]
+
+    import stk
+    return stk.build(infile)
+
+
+def copy_file(src, dest):
+    """Copy src to dest, so that the two files are independent.
+
+    Any existing dest file is removed first, so that a link to
+    another file is not written through.
+    """
+
+    if os.path.lexists(dest):
+        os.remove(dest)
+
+    shutil.copy2(src, dest)
+
+
+class ProductCache:
+    """A size-limited, least-recently-used, cache of tool outputs.
+
+    Parameters
+    ----------
+    cachedir : str
+        The directory containing the cache. It is created if needed.
+    maxsize : int or None, optional
+        The maximum size of the cache, in bytes. If None then there
+        is no limit.
+
+    """
+
+    def __init__(self, cachedir, maxsize=None):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        os.makedirs(cachedir, exist_ok=True)
+
+        self._statsfile = os.path.join(cachedir, "stats")
+
+    def __str__(self):
+        return f"ProductCache({self.cachedir}, maxsize={self.maxsize})"
+
+    def key(self, toolname, params, infiles):
+        """Return the cache key for this tool run.
+
+        Parameters
+        ----------
+        toolname : str
+        params : sequence of str
+            The parameter settings that change the output. The
+            output file names should not be included.
+        infiles : sequence of str
+            The input files, which can be stacks. Any DM filters are
+            included in the hash but are not used when finding the
+            file size and modification time. Entries of "", "NONE",
+            or "CALDB" are ignored.
+
+        Returns
+        -------
+        key : str
+
+        """
+
+        h = hashlib.sha256()
+        h.update(toolname.encode())
+        h.update(get_caldb_version().encode())
+        for param in params:
+            h.update(b"\0")
+            h.update(str(param).encode())
+
+        for infile in infiles:
+            h.update(b"\1")
+            h.update(str(infile).encode())
+            for fname in expand_stack(infile):
+                if fname in ["", "NONE", "CALDB"]:
+                    continue
+
+                fname = strip_filter(fname)
+                st = os.stat(fname)
+                h.update(f"{os.path.realpath(fname)}:{st.st_size}:{st.st_mtime_ns}".encode())
+
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cachedir, key)
+
+    def _record(self, label, toolname):
+        """Record a hit or miss."""
+
+        with open(self._statsfile, "a") as fh:
+            fh.write(f"{label} {toolname}\n")
+
+    def fetch(self, key, toolname, outfiles):
+        """Copy the cached outputs to outfiles, if they exist.
+
+        Parameters
+        ----------
+        key : str
+            The value from the key method.
+        toolname : str
+            Used for the statistics and screen output.
+        outfiles : sequence of str
+            The output files (with no DM filter or block name).
+
+        Returns
+        -------
+        flag : bool
+            True if the outputs were found in the cache.
+
+        """
+
+        entry = self._entry(key)
+        cached = [os.path.join(entry, str(i)) for i in range(len(outfiles))]
+        if not all(os.path.exists(c) for c in cached):
+            v3(f"Cache miss for {toolname}: {key}")
+            self._record("miss", toolname)
+            return False
+
+        for src, dest in zip(cached, outfiles):
+            copy_file(src, dest)
+
+        # Mark the entry as being recently used.
+        os.utime(entry)
+
+        v2(f"Using cached {toolname} output for {', '.join(outfiles)}")
+        self._record("hit", toolname)
+        return True
+
+    def store(self, key, outfiles):
+        """Add the outputs to the cache and then apply the size limit.
+
+        Parameters
+        ----------
+        key : str
+            The value from the key method.
+        outfiles : sequence of str
+            The output files (with no DM filter or block name).
+
+        """
+
+        entry = self._entry(key)
+        tmpentry = f"{entry}.{os.getpid()}.tmp"
+        os.makedirs(tmpentry, exist_ok=True)
+        for i, outfile in enumerate(outfiles):
+            copy_file(outfile, os.path.join(tmpentry, str(i)))
+
+        # Another process may have added the same entry.
+        try:
+            os.rename(tmpentry, entry)
+        except OSError:
+            shutil.rmtree(tmpentry, ignore_errors=True)
+
+        self.evict()
+
+    def entries(self):
+        """Return the cache entries as (last used, size, path), in order
+        of use (least-recently used first)."""
+
+        out = []
+        for name in os.listdir(self.cachedir):
+            path = os.path.join(self.cachedir, name)
+            if not os.path.isdir(path) or name.endswith(".tmp"):
+                continue
+
+            try:
+                size = sum(os.stat(os.path.join(path, f)).st_size
+                           for f in os.listdir(path))
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+            out.append((mtime, size, path))
+
+        out.sort()
+        return out
+
+    def evict(self):
+        """Remove the least-recently used entries until the cache fits
+        into maxsize."""
+
+        if self.maxsize is None:
+            return
+
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if total <= self.maxsize:
+                break
+
+            v3(f"Removing {path} from the cache")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self, since=None):
+        """Return the number of hits and misses.
+
+        Parameters
+        ----------
+        since : int or None, optional
+            The offset into the statistics file, as returned by
+            the mark method, from which to count.
+
+        Returns
+        -------
+        hits, misses : int, int
+
+        """
+
+        hits = 0
+        misses = 0
+        try:
+            with open(self._statsfile, "r") as fh:
+                if since is not None:
+                    fh.seek(since)
+
+                for line in fh:
+                    if line.startswith("hit "):
+                        hits += 1
+                    elif line.startswith("miss "):
+                        misses += 1
+
+        except FileNotFoundError:
+            pass
+
+        return hits, misses
+
+    def mark(self):
+        """Return the current position in the statistics file, so that
+        stats can report on a single run."""
+
+        try:
+            return os.stat(self._statsfile).st_size
+        except FileNotFoundError:
+            return 0
+
+    def report(self, since=None):
+        """Display the hit and miss counts."""
+
+        hits, misses = self.stats(since=since)
+        ntot = hits + misses
+        if ntot == 0:
+            return
+
+        v1(f"Product cache {self.cachedir}: {hits} hit(s) and {misses} miss(es) from {ntot} lookup(s).")
+
+
+def get_product_cache():
+    """Return the product cache, if set up by the user.
+
+    Returns
+    -------
+    cache : ProductCache or None
+        None is returned when the CIAO_CONTRIB_CACHE environment
+        variable is not set.
+
+    """
+
+    cachedir = os.getenv(CACHE_ENV)
+    if cachedir is None or cachedir.strip() == "":
+        return None
+
+    size = os.getenv(CACHE_SIZE_ENV)
+    if size is None or size.strip() == "":
+        size = DEFAULT_CACHE_SIZE
+    else:
+        try:
+            size = float(size)
+        except ValueError:
+            raise ValueError(f"The {CACHE_SIZE_ENV} environment variable must be a number, not '{size}'") from None
+
+    return ProductCache(cachedir, maxsize=int(size * 1024 * 1024))
+
+
+# End
@@ -0,0 +1,189 @@
+#
+#  Copyright (C) 2026
+#    Smithsonian Astrophysical Observatory
+#
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program; if not, write to the Free Software Foundation, Inc.,
+#  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Convert images from the HSV and HLS color systems to RGB.
+
+The conversions follow the colorsys module, and give the same
+values, but act on NumPy arrays rather than a single value.
+
+"""
+
+import numpy as np
+
+__all__ = ("hsv_to_rgb", "hls_to_rgb", "hisv_to_rgb", "my_hls_to_rgb",
+           "sys_to_rgb")
+
+
+ONE_THIRD = 1.0 / 3.0
+ONE_SIXTH = 1.0 / 6.0
+TWO_THIRD = 2.0 / 3.0
+
+# The number of pixels to convert at once in sys_to_rgb.
+TILE_SIZE = 1024 * 1024
+
+
+def hsv_to_rgb(hue, sat, value):
+    """Convert from HSV to RGB.
+
+    Parameters
+    ----------
+    hue, sat, value : array_like
+        The arrays must have the same shape.
+
+    Returns
+    -------
+    red, green, blue : ndarray
+
+    See Also
+    --------
+    colorsys.hsv_to_rgb
+
+    """
+
+    hue = np.asarray(hue, dtype=float)
+    sat = np.asarray(sat, dtype=float)
+    value = np.asarray(value, dtype=float)
+
+    hue6 = hue * 6.0
+    sector = np.trunc(hue6)
+    frac = hue6 - sector
+    p = value * (1.0 - sat)
+    q = value * (1.0 - sat * frac)
+    t = value * (1.0 - sat * (1.0 - frac))
+    sector = np.mod(np.nan_to_num(sector), 6).astype(int)
+
+    # The value for each sector, as used by colorsys.
+    choices = [(value, t, p), (q, value, p), (p, value, t),
+               (p, q, value), (t, p, value), (value, p, q)]
+
+    grey = sat == 0.0
+    out = []
+    for idx in range(3):
+        chan = np.choose(sector, [c[idx] for c in choices])
+        out.append(np.where(grey, value, chan))
+
+    return tuple(out)
+
+
+def _hls_channel(m1, m2, hue):
+    """Calculate the RGB channel for a hue (colorsys._v)."""
+
+    hue = np.mod(hue, 1.0)
+    rising = m1 + (m2 - m1) * hue * 6.0
+    falling = m1 + (m2 - m1) * (TWO_THIRD - hue) * 6.0
+    return np.where(hue < ONE_SIXTH, rising,
+                    np.where(hue < 0.5, m2,
+                             np.where(hue < TWO_THIRD, falling, m1)))
+
+
+def hls_to_rgb(hue, light, sat):
+    """Convert from HLS to RGB.
+
+    Parameters
+    ----------
+    hue, light, sat : array_like
+        The arrays must have the same shape.
+
+    Returns
+    -------
+    red, green, blue : ndarray
+
+    See Also
+    --------
+    colorsys.hls_to_rgb
+
+    """
+
+    hue = np.asarray(hue, dtype=float)
+    light = np.asarray(light, dtype=float)
+    sat = np.asarray(sat, dtype=float)
+
+    m2 = np.where(light <= 0.5, light * (1.0 + sat),
+                  light + sat - (light * sat))
+    m1 = 2.0 * light - m2
+
+    grey = sat == 0.0
+    return tuple(np.where(grey, light, _hls_channel(m1, m2, h))
+                 for h in [hue + ONE_THIRD, hue, hue - ONE_THIRD])
+
+
+def hisv_to_rgb(hue, saturation, value):
+    "Same as hsv_to_rgb, but reverse saturation"
+    return hsv_to_rgb(hue, 1.0 - np.asarray(saturation, dtype=float), value)
+
+
+def my_hls_to_rgb(hue, saturation, lightness):
+    "Same as hls_to_rgb, but swap l and s"
+    return hls_to_rgb(hue, lightness, saturation)
+
+
+def sys_to_rgb(hue, sat, value, func, tile_size=None):
+    """Convert the images to RGB values in the range 0 to 255.
+
+    Pixels where any of the inputs is NaN are set to 0. The images
+    are converted in blocks of rows, to limit the memory used by the
+    intermediate arrays for large images.
+
+    Parameters
+    ----------
+    hue, sat, value : ndarray
+        The images, which must have the same shape.
+    func : callable
+        The conversion routine, such as hsv_to_rgb or my_hls_to_rgb,
+        which is called with the hue, sat, and value arrays.
+    tile_size : int or None, optional
+        The approximate number of pixels to convert at once. If
+        not set then TILE_SIZE is used.
+
+    Returns
+    -------
+    red, green, blue : ndarray
+
+    """
+
+    hue = np.asarray(hue, dtype=float)
+    sat = np.asarray(sat, dtype=float)
+    value = np.asarray(value, dtype=float)
+    if hue.shape != sat.shape or hue.shape != value.shape:
+        raise ValueError("The hue, sat, and value arrays must have the same shape")
+
+    if tile_size is None:
+        tile_size = TILE_SIZE
+
+    out = [np.zeros(hue.shape) for _ in range(3)]
+    if hue.size == 0:
+        return tuple(out)
+
+    # Work with 2D views so that the tiles are blocks of rows.
+    shape2d = (-1, hue.shape[-1]) if hue.ndim > 1 else (1, -1)
+    ins = [x.reshape(shape2d) for x in (hue, sat, value)]
+    outs = [x.reshape(shape2d) for x in out]
+
+    nrows = max(1, tile_size // ins[0].shape[1])
+    for start in range(0, ins[0].shape[0], nrows):
+        rows = slice(start, start + nrows)
+        hh, ss, vv = [x[rows] for x in ins]
+        good = ~(np.isnan(hh) | np.isnan(ss) | np.isnan(vv))
+        rgb = func(hh[good], ss[good], vv[good])
+        for chan, vals in zip(outs, rgb):
+            chan[rows][good] = vals * 255
+
+    return tuple(out)
@@ -1,5 +1,5 @@
 #
-#  Copyright (C) 2010-2016, 2019, 2020, 2023
+#  Copyright (C) 2010-2016, 2019, 2020, 2023, 2026
 #            Smithsonian Astrophysical Observatory
 #
 #
@@ -24,6 +24,7 @@ File I/O utility routines: intended for processing FIS/data files.
 
 import glob
 import os
+import stat
 import tempfile
 
 import numpy as np
@@ -53,6 +54,8 @@ __all__ = (
     "get_keys_from_file",
     "get_keys_cols_from_file",
     "get_column_unique",
+    "get_file_metadata",
+    "clear_metadata_cache",
     "outfile_clobber_checks",
     "rename_file_extension",
     "remove_path",
@@ -164,8 +167,8 @@ def get_obsid_object(infile):
 
     """
 
-    cr = pycrates.read_file(infile)
-    obsid = cr.get_key_value("OBS_ID")
+    keys = get_file_metadata(infile).keys
+    obsid = keys.get("OBS_ID")
 
     if obsid is None:
         raise IOError("OBS_ID keyword is missing from '{}'.".format(infile))
@@ -173,7 +176,7 @@ def get_obsid_object(infile):
     # Do not need to validate the value here, but it results in a
     # better error message than if ObsId fails.
     #
-    cycle = cr.get_key_value("CYCLE")
+    cycle = keys.get("CYCLE")
     if cycle is not None and cycle.strip() == '':
         cycle = None
         v3("Changing blank CYCLE keyword from {} to None.".format(infile))
@@ -181,7 +184,7 @@ def get_obsid_object(infile):
     elif cycle not in [None, 'P', 'S']:
         raise IOError("Invalid CYCLE={} keyword in '{}'.".format(cycle, infile))
 
-    obi = cr.get_key_value("OBI_NUM")
+    obi = keys.get("OBI_NUM")
     return utils.ObsId(obsid, cycle=cycle, obi=obi)
 
 
@@ -190,8 +193,7 @@ def get_obsid(infile):
     is raised if the keyword does not exist in the file.
     """
 
-    cr = pycrates.read_file(infile)
-    val = cr.get_key_value("OBS_ID")
+    val = get_file_metadata(infile).keys.get("OBS_ID")
     if val is None:
         raise IOError("OBS_ID keyword is missing from '{}'".format(infile))
 
@@ -244,6 +246,141 @@ def _get_key_values(blockinfo):
     return keys
 
 
+class FileMetadata:
+    """The header, column, and subspace information for a file.
+
+    Each item is read from the file the first time it is requested
+    and then remembered, so the file is only re-opened when a new
+    type of information is needed. Use get_file_metadata() rather
+    than creating the object directly, so that the information is
+    shared between all the users of the file.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._values = {}
+
+    def _get(self, name, reader):
+        """Return the stored value, calling reader() to create it
+        if necessary. Errors are not remembered."""
+
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        v4("Reading {} from {}".format(name, self.fname))
+        val = reader()
+        self._values[name] = val
+        return val
+
+    @property
+    def blockinfo(self):
+        "The block information for the most-interesting block."
+        return self._get("blockinfo",
+                         lambda: cw.get_block_info_from_file(self.fname)[1])
+
+    @property
+    def keys(self):
+        """The keyword values for the most-interesting block,
+        as returned by get_keys_from_file(). This should not
+        be changed."""
+        return self._get("keys", lambda: _get_key_values(self.blockinfo))
+
+    @property
+    def cols(self):
+        """The column information for the most-interesting block,
+        as returned by get_keys_cols_from_file(). This should not
+        be changed."""
+        return self._get("cols", lambda: _get_column_list(self.fname,
+                                                          self.blockinfo,
+                                                          self.keys))
+
+    @property
+    def aimpoint(self):
+        "The aim-point ccd_id/chip value (see get_aimpoint)."
+        return self._get("aimpoint", lambda: _read_aimpoint(self.fname))
+
+    @property
+    def tangent_point(self):
+        "The (ra, dec) tangent point (see get_tangent_point)."
+        return self._get("tangent_point",
+                         lambda: _read_tangent_point(self.fname))
+
+    @property
+    def subspace(self):
+        """The lo and hi dictionaries, with keys x and y, giving the
+        sky range of the subspace (see get_subspace)."""
+        return self._get("subspace", lambda: _read_subspace(self.fname))
+
+    def column_unique(self, colname):
+        "The unique values of the column (see get_column_unique)."
+        return self._get("unique:{}".format(colname.lower()),
+                         lambda: _read_column_unique(self.fname, colname))
+
+
+# The metadata for each file, indexed by the absolute path of the
+# file and the DM filter (if any). Each value is the tuple
+# (signature, metadata), where the signature records the inode,
+# size, and modification time of the file when it was read, so
+# that changed files are re-read.
+#
+_METADATA_CACHE = {}
+
+
+def _metadata_signature(fname):
+    """Return the (cache key, signature) for the file, or None if
+    the file can not be cached (e.g. it does not exist)."""
+
+    plain = get_file(fname)
+    try:
+        st = os.stat(plain)
+    except (OSError, ValueError):
+        return None
+
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    key = (os.path.realpath(plain), fname[len(plain):])
+    return (key, (st.st_ino, st.st_size, st.st_mtime_ns))
+
+
+def get_file_metadata(fname):
+    """Return the FileMetadata object for the file.
+
+    The same object is returned each time the routine is called
+    for a file, unless the size or modification time of the file
+    has changed, so that the header and column information is only
+    read once per process. Files which can not be found on disk
+    (such as those using CFITSIO syntax) are not cached.
+    """
+
+    sig = _metadata_signature(fname)
+    if sig is None:
+        v4("Not caching the metadata for {}".format(fname))
+        return FileMetadata(fname)
+
+    (key, signature) = sig
+    try:
+        (oldsig, meta) = _METADATA_CACHE[key]
+        if oldsig == signature:
+            return meta
+
+        v3("The file {} has changed since it was read".format(fname))
+    except KeyError:
+        pass
+
+    meta = FileMetadata(fname)
+    _METADATA_CACHE[key] = (signature, meta)
+    return meta
+
+
+def clear_metadata_cache():
+    """Remove all the information stored by get_file_metadata."""
+
+    _METADATA_CACHE.clear()
+
+
 def get_keys_from_file(fname):
     """Return a dictionary of keyword values for the
     'most-interesting-block' of the given file.
@@ -254,8 +391,26 @@ def get_keys_from_file(fname):
     __SHAPE keyword.
     """
 
-    (bname, bi) = cw.get_block_info_from_file(fname)
-    return _get_key_values(bi)
+    return dict(get_file_metadata(fname).keys)
+
+
+def _get_column_list(fname, blockinfo, keys):
+    """Return the column info, in file order, or None if the
+    block is not a table."""
+
+    if blockinfo['type'] not in ['TABLE', 'EMPTY-TABLE']:
+        return None
+
+    # get_block_info_from_file loses the ordering
+    # of the columns, so need to reconstruct it
+    colinfo = [None] * keys['__NCOLS']
+    try:
+        for cinfo in blockinfo['columns'].values():
+            colinfo[cinfo.pos - 1] = cinfo
+    except IndexError as exc:
+        raise IndexError(f"check if '{fname}' has duplicate column names!") from exc
+
+    return colinfo
 
 
 def get_keys_cols_from_file(fname):
@@ -273,23 +428,13 @@ def get_keys_cols_from_file(fname):
     - amongst others - column name, type, and size.
     """
 
-    (bname, bi) = cw.get_block_info_from_file(fname)
-    keys = _get_key_values(bi)
+    meta = get_file_metadata(fname)
+    keys = dict(meta.keys)
+    cols = meta.cols
+    if cols is not None:
+        cols = list(cols)
 
-    if bi['type'] in ['TABLE', 'EMPTY-TABLE']:
-        # get_block_info_from_file loses the ordering
-        # of the columns, so need to reconstruct it
-        colinfo = [None] * keys['__NCOLS']
-        try:
-            for cinfo in bi['columns'].values():
-                colinfo[cinfo.pos - 1] = cinfo
-        except IndexError as exc:
-            raise IndexError(f"check if '{fname}' has duplicate column names!") from exc
-
-    else:
-        colinfo = None
-
-    return (keys, colinfo)
+    return (keys, cols)
 
 
 # It is likely that this routine is inefficient, since it
@@ -353,6 +498,12 @@ def get_aimpoint(infile):
     starts with GTI.
     """
 
+    return get_file_metadata(infile).aimpoint
+
+
+def _read_aimpoint(infile):
+    """Read the aim-point value from the file (see get_aimpoint)."""
+
     v3("Looking for aimpoint CCD in {}".format(infile))
     try:
         ds = cxcdm.dmDatasetOpen(infile)
@@ -401,6 +552,16 @@ def get_column_unique(infile, colname):
     If the file is empty the routine returns None.
     """
 
+    vals = get_file_metadata(infile).column_unique(colname)
+    if vals is None:
+        return None
+
+    return vals.copy()
+
+
+def _read_column_unique(infile, colname):
+    """Read the unique column values (see get_column_unique)."""
+
     cr = pycrates.read_file("{}[cols {}]".format(infile, colname))
     try:
         if cr.get_nrows() == 0:
@@ -495,10 +656,19 @@ def get_subspace(infile, binsize):
 
     This may also be used with unfiltered images too"""
 
+    v4("get_subspace: infile={} binsize={}".format(infile, binsize))
+    (lo, hi) = get_file_metadata(infile).subspace
+    return (AxisRange(lo["x"], hi["x"], binsize),
+            AxisRange(lo["y"], hi["y"], binsize))
+
+
+def _read_subspace(infile):
+    """Return the lo and hi dictionaries of the sky range of the
+    subspace (see get_subspace)."""
+
     lo = {"x": None, "y": None}
     hi = {"x": None, "y": None}
 
-    v4("get_subspace: infile={} binsize={}".format(infile, binsize))
     bl = cxcdm.dmBlockOpen(infile)
     try:
         num_compt = cxcdm.dmBlockGetNoSubspaceCpts(bl)
@@ -537,8 +707,7 @@ def get_subspace(infile, binsize):
     finally:
         cxcdm.dmBlockClose(bl)
 
-    return (AxisRange(lo["x"], hi["x"], binsize),
-            AxisRange(lo["y"], hi["y"], binsize))
+    return (lo, hi)
 
 
 def fov_limits(fov_file, binsize):
@@ -911,6 +1080,12 @@ def get_tangent_point(filename):
     a number of assumptions.
     """
 
+    return get_file_metadata(filename).tangent_point
+
+
+def _read_tangent_point(filename):
+    """Read the tangent point from the file (see get_tangent_point)."""
+
     bl = cxcdm.dmBlockOpen(filename)
     try:
         btype = cxcdm.dmBlockGetType(bl)
@@ -66,6 +66,7 @@ from ciao_contrib.runtool import new_pfiles_environment
 from ciao_contrib.runtool import add_tool_history
 
 from ciao_contrib._tools import fileio
+from ciao_contrib._tools.cache import get_product_cache
 from ciao_contrib._tools.obsinfo import ObsInfo
 from ciao_contrib._tools import utils
 
@@ -90,14 +91,46 @@ v3 = lgr.verbose3
 v4 = lgr.verbose4
 
 #################################################################################
+def expmap_memory(filesize:int, nchips:int) -> int:
+    """
+    estimated memory, in bytes, used to create an observation's exposure
+    map, where filesize is the size of an image in bytes
+    """
+
+    file_buffer = 27_262_976 # buffer of 26 Mb in bytes
+
+    ## mosaicking an observation's per-CCD exposure maps (parallelized) ##
+    expmap_limit = 6
+    if nchips > 1:
+        expmap_limit += nchips
+
+    img_mem_use = (expmap_limit * filesize) + file_buffer
+
+    return img_mem_use
+
+
+def psfmap_memory(filesize:int, nchips:int) -> int:
+    """
+    regardless of number of CCDs, memory used to generate an observation's
+    PSF map is a little less than 7*filesize
+    """
+
+    psfmap_limit = 7.285 + (0.03 * nchips)
+
+    psfmap_mem = psfmap_limit * filesize
+
+    return psfmap_mem
+
+
 class Project_Memory_Use:
     """
     Estimate memory usage to generate exposure maps and PSF maps and when
     stacking counts maps and PSF maps, which are the most memory intensive
     steps in fluximage and flux_obs, which may lead the exhausting system
     memory.  Return a chunk size for stacking purposes that hopefully avoids
-    using too much memory or error message with a suggestion on limiting the
-    number of logical cores used for parallel proceses to avoid memory exhaustion.
+    using too much memory. The exposure-map and PSF-map tasks declare their
+    memory use to the task runner (see expmap_memory and psfmap_memory),
+    which throttles them to fit into the available memory.
     """
 
     def __init__(self, evtfiles:list|tuple, filesize:int, ncore:int|str|None):
@@ -134,29 +167,11 @@ class Project_Memory_Use:
 
 
     def _expmap_memory(self, nchips:int) -> int:
-        file_buffer = 27_262_976 # buffer of 26 Mb in bytes
-
-        ## mosaicking an observation's per-CCD exposure maps (parallelized) ##
-        expmap_limit = 6
-        if nchips > 1:
-            expmap_limit += nchips
-
-        img_mem_use = (expmap_limit * self.filesize) + file_buffer
-
-        return img_mem_use
+        return expmap_memory(self.filesize, nchips)
 
 
     def _psfmap_memory(self, nchips:int) -> int:
-        """
-        regardless of number of CCDs, memory used to generate an observation's
-        PSF map is a little less than 7*filesize
-        """
-
-        psfmap_limit = 7.285 + (0.03 * nchips)
-
-        psfmap_mem = psfmap_limit * self.filesize
-
-        return psfmap_mem
+        return psfmap_memory(self.filesize, nchips)
 
 
     def project_parallel_memory(self):
@@ -206,12 +221,11 @@ class Project_Memory_Use:
             if ncore_mem_lim == 0:
                 raise MemoryError("There is insufficient system memory available to run processes to completion on a single core.")
 
-            if ncore_mem_lim == 1:
-                ncore_str = f"{ncore_mem_lim}"
-            else:
-                ncore_str = f"{ncore_mem_lim} or less"
-
-            raise MemoryError(f"There is insufficient system memory available to run processes in parallel, consider reducing the number of cores used to {ncore_str}.")
+            # The task runner only starts the exposure-map and PSF-map
+            # tasks when they fit into the available memory, so this
+            # is no-longer an error.
+            #
+            v2(f"The available memory is only sufficient to create {ncore_mem_lim} exposure or PSF maps at a time, so these will be throttled.")
 
 
     def check_stk_counts_memory(self):
@@ -731,6 +745,32 @@ but it does not seem to help too much.
 """
 
 
+def run_cached(toolname, params, infiles, outfiles, func,
+               clobber=False):
+    """Call func, unless the outputs can be taken from the product cache.
+
+    The cache is only used when set up by the user (see
+    ciao_contrib._tools.cache). The params argument lists the
+    settings, other than the file names, that change the output,
+    infiles are the input files, and outfiles the files created by
+    func. The cache is not used when an output file exists and
+    clobber is False, so that the tool reports the error.
+    """
+
+    cache = get_product_cache()
+    if cache is None or \
+       (not clobber and any(os.path.exists(f) for f in outfiles)):
+        func()
+        return
+
+    key = cache.key(toolname, params, infiles)
+    if cache.fetch(key, toolname, outfiles):
+        return
+
+    func()
+    cache.store(key, outfiles)
+
+
 def run_asphist(outpath, asolobj, chip, evtfile, filt, dtffile,
                 nbins, res_xy,
                 message=None,
@@ -742,18 +782,26 @@ def run_asphist(outpath, asolobj, chip, evtfile, filt, dtffile,
     if message is not None:
         v1(message)
 
-    with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
-        # punlearn("asphist")
-
-        args = ["infile=" + asolobj.name,
-                "outfile=" + name_asphist(outpath, chip),
-                f"evtfile={evtfile}[{filt}={chip}]",
-                "dtffile=" + dtffile,
-                f"max_bin={nbins}",
-                f"res_xy={res_xy}",
-                "mode=h"]
-        add_defargs(args, clobber, verbose)
-        run.run("asphist", args)
+    outfile = name_asphist(outpath, chip)
+    evtarg = f"{evtfile}[{filt}={chip}]"
+
+    def runtool():
+        with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
+            # punlearn("asphist")
+
+            args = ["infile=" + asolobj.name,
+                    "outfile=" + outfile,
+                    "evtfile=" + evtarg,
+                    "dtffile=" + dtffile,
+                    f"max_bin={nbins}",
+                    f"res_xy={res_xy}",
+                    "mode=h"]
+            add_defargs(args, clobber, verbose)
+            run.run("asphist", args)
+
+    run_cached("asphist", [nbins, res_xy],
+               [asolobj.name, evtarg, dtffile], [outfile],
+               runtool, clobber=clobber)
 
 
 def make_asphist(taskrunner, labelconv,
@@ -1524,29 +1572,41 @@ def run_mkinstmap(outfile, mfile, obsfile, detsubsys, grating,
     if message is not None:
         v1(message)
 
-    with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
+    def runtool():
+        with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
+
+            # punlearn("ardlib")
+            if ardlib is not None:
+                run.run("pset", ["ardlib", ardlib])
+
+            # punlearn("mkinstmap")
+            args = ["pixelgrid=" + pixelgrid,
+                    "outfile=" + outfile,
+                    "maskfile=" + mfile,
+                    "obsfile=" + obsfile,
+                    "detsubsys=" + detsubsys,
+                    "grating=" + grating,
+                    f"spectrumfile={weightfile}",
+                    f"monoenergy={monoenergy}",
+                    "mirror=" + mirror,
+                    "dafile=" + dafile,
+                    "mode=h"
+                    ]
+            add_defargs(args, clobber, verbose)
+            run.run("mkinstmap", args)
+            if units == "time":
+                dmhedit_key(outfile, 'BUNIT', "", verbose=verbose)
 
-        # punlearn("ardlib")
-        if ardlib is not None:
-            run.run("pset", ["ardlib", ardlib])
+    # The ardlib setting is "name=filename".
+    infiles = [mfile, obsfile, weightfile, dafile]
+    if ardlib is not None:
+        infiles.append(ardlib.split("=", 1)[1])
 
-        # punlearn("mkinstmap")
-        args = ["pixelgrid=" + pixelgrid,
-                "outfile=" + outfile,
-                "maskfile=" + mfile,
-                "obsfile=" + obsfile,
-                "detsubsys=" + detsubsys,
-                "grating=" + grating,
-                f"spectrumfile={weightfile}",
-                f"monoenergy={monoenergy}",
-                "mirror=" + mirror,
-                "dafile=" + dafile,
-                "mode=h"
-                ]
-        add_defargs(args, clobber, verbose)
-        run.run("mkinstmap", args)
-        if units == "time":
-            dmhedit_key(outfile, 'BUNIT', "", verbose=verbose)
+    run_cached("mkinstmap",
+               [pixelgrid, detsubsys, grating, monoenergy, mirror, units,
+                ardlib],
+               infiles, [outfile],
+               runtool, clobber=clobber)
 
 
 def make_instrument_maps(taskrunner, labelconv, preconditions,
@@ -1633,74 +1693,89 @@ def make_instrument_maps(taskrunner, labelconv, preconditions,
     return etask
 
 
-def run_mkexpmap(outfile, instmap, asphist, matchfile, normalize,
-                 message=None,
-                 hackunits=True,
-                 verbose=0,
-                 tmpdir="/tmp",
-                 clobber=False):
-    "Create the given exposure map using a separate PFILES environment."
+def get_sky_grid(matchfile, tmpdir="/tmp"):
+    """Return the xygrid value from get_sky_limits for the image.
 
-    if message is not None:
-        v1(message)
+    It is wasteful to re-calculate the grid each time, but we do this
+    to avoid having to pass information between processes when
+    running in parallel. Ideally this grid would be imposed at the
+    time the images are created, so that it can be sent to further
+    processes.
 
-    with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
-        # punlearn("mkexpmap")
+    We assume the same limits are used whatever the energy band or
+    chip, so we only need to call get_sky_limits once.
 
-        # It is wasteful to re-calculate the grid each time,
-        # but we do this to avoid having to pass information
-        # between processes when running in parallel. Ideally
-        # this grid would be imposed at the time the images are
-        # created, so that it can be sent to further processes.
-        #
+    If the grid does not 'fully fill' the image (i.e. if the last
+    row/column is part-filled due to the binning size) then we do not
+    want to use get_sky_limits here, since it assumes all
+    rows/columns are fully filled. However, if we do use a grid that
+    does not fill the columns then you can get warning messages from
+    mkexpmap, along the lines of
 
-        # We assume the same limits are used whatever the energy band or chip,
-        # so we only need to call get_sky_limits once.
-        #
-        # if the grid does not 'fully fill' the image (i.e. if the last row/column
-        # is part-filled due to the binning size) then we do not want to use get_sky_limits
-        # here, since it assumes all rows/columns are fully filled. However, if we
-        # do use a grid that does not fill the columns then you can get warning
-        # messages from mkexpmap, along the lines of
-        #
-        #    ****** WARNING: The range [4470:5670:32,1810:3200:32] does not correspond to a
-        #       whole number of pixels.  The following range will be used instead:
-        #          [4470:5686:32]
-        #       In the future, you should use the [min:max:#num] syntax to avoid this
-        #       ambiguity.
-        #
-        # so we do in fact use the get_sky_limits approach and live with the fact
-        # that this will result in over-correction for the image data.
-        #
+       ****** WARNING: The range [4470:5670:32,1810:3200:32] does not correspond to a
+          whole number of pixels.  The following range will be used instead:
+             [4470:5686:32]
+          In the future, you should use the [min:max:#num] syntax to avoid this
+          ambiguity.
+
+    so we do in fact use the get_sky_limits approach and live with the
+    fact that this will result in over-correction for the image data.
+    """
+
+    with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
         punlearn("get_sky_limits")
         run.run("get_sky_limits",
                 [f"image={matchfile}",
                  "verbose=0",
                  "mode=h"]
                 )
-        xygrid = paramio.pgetstr("get_sky_limits", "xygrid")
-
-        args = ["outfile=" + outfile,
-                "instmapfile=" + instmap,
-                "asphistfile=" + asphist,
-                "xygrid=" + xygrid,
-                "normalize=" + normalize,
-                "useavgaspect=no",
-                "mode=h"
-                ]
-        add_defargs(args, clobber, verbose)
-        run.run("mkexpmap", args)
-
-        # copy over a few keywords. In CIAO 4.4 mkexpmap does not copy over the
-        # GRATING keyword, instead just setting it to NONE. I believe this
-        # has been fixed in a later release but have not checked this.
-        copy_keywords(instmap, outfile,
-                      ["SPECTRUM", "WGTFILE", "ENERG_LO", "ENERG_HI",
-                       "GRATING"],
-                      tmpdir=tmpdir)
+        return paramio.pgetstr("get_sky_limits", "xygrid")
+
+
+def run_mkexpmap(outfile, instmap, asphist, matchfile, normalize,
+                 message=None,
+                 hackunits=True,
+                 verbose=0,
+                 tmpdir="/tmp",
+                 clobber=False):
+    "Create the given exposure map using a separate PFILES environment."
+
+    if message is not None:
+        v1(message)
 
-        if hackunits:
-            dmhedit_key(outfile, 'BUNIT', 's', verbose=verbose)
+    xygrid = get_sky_grid(matchfile, tmpdir=tmpdir)
+
+    def runtool():
+        with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir):
+            # punlearn("mkexpmap")
+            args = ["outfile=" + outfile,
+                    "instmapfile=" + instmap,
+                    "asphistfile=" + asphist,
+                    "xygrid=" + xygrid,
+                    "normalize=" + normalize,
+                    "useavgaspect=no",
+                    "mode=h"
+                    ]
+            add_defargs(args, clobber, verbose)
+            run.run("mkexpmap", args)
+
+            # copy over a few keywords. In CIAO 4.4 mkexpmap does not copy over the
+            # GRATING keyword, instead just setting it to NONE. I believe this
+            # has been fixed in a later release but have not checked this.
+            copy_keywords(instmap, outfile,
+                          ["SPECTRUM", "WGTFILE", "ENERG_LO", "ENERG_HI",
+                           "GRATING"],
+                          tmpdir=tmpdir)
+
+            if hackunits:
+                dmhedit_key(outfile, 'BUNIT', 's', verbose=verbose)
+
+    # The grid, rather than matchfile, is used for the cache since
+    # the counts image is re-created on each run.
+    #
+    run_cached("mkexpmap", [xygrid, normalize, hackunits],
+               [instmap, asphist], [outfile],
+               runtool, clobber=clobber)
 
 
 def make_expmap_indiv(taskrunner, labelconv, preconditions,
@@ -1711,13 +1786,18 @@ def make_expmap_indiv(taskrunner, labelconv, preconditions,
                       verbose="0",
                       tmpdir="/tmp",
                       clobber=False,
-                      cleanup=True):
+                      cleanup=True,
+                      filesize=None):
     """Create the per-chip, per obsid exposure maps.
 
     The energy bands are assumed to have unique monochromatic energies.
 
     If cleanup=True then the aspect histograms and instrument maps will be deleted
     once the exposure map has been created.
+
+    If filesize is not None then it is the size of the output image, in
+    bytes, and is used to tell the task runner the memory use of each
+    task.
     """
 
     nruns = len(enbands) * len(chips)
@@ -1747,6 +1827,8 @@ def make_expmap_indiv(taskrunner, labelconv, preconditions,
                                 verbose=verbose,
                                 clobber=clobber
                                 )
+            if filesize is not None:
+                taskrunner.set_task_memory(task, expmap_memory(filesize, 1))
 
             smsg = None
             atasks.append(task)
@@ -1862,10 +1944,15 @@ def combine_expmap_chips(taskrunner, labelconv, preconditions,
                          parallel=True,
                          verbose=0,
                          clobber=False,
-                         cleanup=True):
+                         cleanup=True,
+                         filesize=None):
     """Combine per-chip exposure maps for each energy.
 
     The energy bands are assumed to have unique monochromatic energies.
+
+    If filesize is not None then it is the size of the output image, in
+    bytes, and is used to tell the task runner the memory use of each
+    task.
     """
 
     # setup arguments to reproject images
@@ -1896,6 +1983,8 @@ def combine_expmap_chips(taskrunner, labelconv, preconditions,
                             lookup_table, detnam,
                             message=smsg,
                             verbose=verbose, clobber=clobber, tmpdir=tmpdir)
+        if filesize is not None:
+            taskrunner.set_task_memory(task, expmap_memory(filesize, nchips))
 
         smsg = None
 
@@ -1924,7 +2013,8 @@ def make_exposure_maps(taskrunner, labelconv, preconditions,
                        parallel=True,
                        verbose="0",
                        clobber=False,
-                       cleanup=True
+                       cleanup=True,
+                       filesize=None
                        ):
     """Create exposure maps per chip and per band, and then for
     each band create a single exposure map (a copy if only one chip
@@ -1939,6 +2029,9 @@ def make_exposure_maps(taskrunner, labelconv, preconditions,
     If cleanup=True then the aspect solution, instrument maps,
     and per-chip exposure maps are deleted once they are finished
     with.
+
+    If filesize is not None then it is the size of the output image,
+    in bytes, and is used to estimate the memory use of the tasks.
     """
 
     if hackunits and normalize == "yes":
@@ -1958,7 +2051,8 @@ def make_exposure_maps(taskrunner, labelconv, preconditions,
                               tmpdir=tmpdir,
                               verbose=verbose,
                               clobber=clobber,
-                              cleanup=cleanup)
+                              cleanup=cleanup,
+                              filesize=filesize)
 
     if len(chips) == 1:
         return single_expmap_chips(taskrunner, labelconv, [etask],
@@ -1981,7 +2075,8 @@ def make_exposure_maps(taskrunner, labelconv, preconditions,
                                 parallel=parallel,
                                 verbose=verbose,
                                 clobber=clobber,
-                                cleanup=cleanup)
+                                cleanup=cleanup,
+                                filesize=filesize)
 
 
 def run_mkpsfmap(outfile, matchfile, energy, wgtfile, ecf,
@@ -2024,27 +2119,45 @@ def run_mkpsfmap(outfile, matchfile, energy, wgtfile, ecf,
         infile = f"{matchfile}[sky=MASK({maskfile})]"
 
 
-    with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir), tempfile.NamedTemporaryFile(dir=tmpdir, suffix='.psfmap') as mapfile:
-        punlearn("mkpsfmap")
-        args = [f"infile={infile}",
-                f"outfile={mapfile.name}[PSFMAP]",
-                f"energy={enarg}",
-                f"spectrum={sparg}",
-                f"ecf={ecf}",
-                "mode=h"
-                ]
+    def runtool():
+        with new_pfiles_environment(ardlib=False, copyuser=False, tmpdir=tmpdir), tempfile.NamedTemporaryFile(dir=tmpdir, suffix='.psfmap') as mapfile:
+            punlearn("mkpsfmap")
+            args = [f"infile={infile}",
+                    f"outfile={mapfile.name}[PSFMAP]",
+                    f"energy={enarg}",
+                    f"spectrum={sparg}",
+                    f"ecf={ecf}",
+                    "mode=h"
+                    ]
 
-        add_defargs(args, True, verbose)
+            add_defargs(args, True, verbose)
 
-        # mkpsfmap has no verbose argument, so drop it
-        args = args[:-1]
+            # mkpsfmap has no verbose argument, so drop it
+            args = args[:-1]
 
-        run.run("mkpsfmap", args)
+            run.run("mkpsfmap", args)
 
-        # Remove any spatial filters
-        #
-        run.dmcopy(f"{mapfile.name}[subspace -sky]",
-                   outfile, clobber=clobber, verbose="0")
+            # Remove any spatial filters
+            #
+            run.dmcopy(f"{mapfile.name}[subspace -sky]",
+                       outfile, clobber=clobber, verbose="0")
+
+    if get_product_cache() is None:
+        runtool()
+        return
+
+    # As with run_mkexpmap, the grid of the counts image is used
+    # rather than the file itself.
+    #
+    infiles = [wgtfile]
+    if maskfile is not None:
+        infiles.append(maskfile)
+
+    run_cached("mkpsfmap",
+               [get_sky_grid(matchfile, tmpdir=tmpdir), enarg, sparg, ecf,
+                maskfile is None],
+               infiles, [outfile],
+               runtool, clobber=clobber)
 
 
 def make_psf_maps(taskrunner, labelconv, preconditions,
@@ -2058,9 +2171,13 @@ def make_psf_maps(taskrunner, labelconv, preconditions,
                   tmpdir="/tmp",
                   parallel=True,
                   verbose="0",
-                  clobber=False):
+                  clobber=False,
+                  filesize=None):
     """Create per-band PSF maps, filtered by the FOV.
 
+    If filesize is not None then it is the size of the output image, in
+    bytes, and is used to tell the task runner the memory use of each
+    task.
     """
 
     # Create a PSF map per band
@@ -2103,6 +2220,8 @@ def make_psf_maps(taskrunner, labelconv, preconditions,
                             message=smsg,
                             verbose=verbose,
                             clobber=clobber)
+        if filesize is not None:
+            taskrunner.set_task_memory(task, psfmap_memory(filesize, len(chips)))
 
         tasks.append(task)
         smsg = None
@@ -2892,7 +3011,8 @@ def run_fluximage_tasks(taskrunner, labelconv,
                         clobber=False,
                         cleanup=True,
                         parallel=False,
-                        pathfrom=None
+                        pathfrom=None,
+                        filesize=None
                         ):
     """Run the various stages.
 
@@ -2910,6 +3030,10 @@ def run_fluximage_tasks(taskrunner, labelconv,
     pathfrom : str or None, optional
         The location of the script (i.e. it's __file__ value) as this
         is used to find the lookup table,
+    filesize : int or None, optional
+        The size of the output images, in bytes. If set, it is used to
+        estimate the memory use of the exposure-map and PSF-map tasks,
+        so that the task runner can limit how many are run at once.
 
     """
 
@@ -2998,7 +3122,8 @@ def run_fluximage_tasks(taskrunner, labelconv,
                                   parallel=parallel,
                                   verbose=verbose,
                                   clobber=clobber,
-                                  cleanup=cleanup
+                                  cleanup=cleanup,
+                                  filesize=filesize
                                   )
 
     fluxtask = make_fluxed_images(taskrunner, labelconv,
@@ -3029,7 +3154,8 @@ def run_fluximage_tasks(taskrunner, labelconv,
                              tmpdir=tmpdir,
                              parallel=parallel,
                              verbose=verbose,
-                             clobber=clobber)
+                             clobber=clobber,
+                             filesize=filesize)
 
     return pmaptask
 
@@ -27,9 +27,11 @@ methods, and having output to text for tools that need it.
 
 import math
 
+import pycrates
+
 import ciao_contrib.logger_wrapper as lw
 
-__all__ = ("HeaderMerge", )
+__all__ = ("HeaderMerge", "adjust_headers")
 
 lgr = lw.initialize_module_logger('_tools.merging')
 v2 = lgr.verbose2
@@ -578,4 +580,41 @@ class HeaderMerge:
             return rule.merge(values)
 
 
+def adjust_headers(rules, cr, keys, headers):
+    """Apply the header merging rules to the headers.
+
+    Parameters
+    ----------
+    rules : HeaderMerge instance
+    cr : pycrates.TABLECrate or pycrates.IMAGECrate instance
+    keys : sequence of keywords
+        These are all the keys seen in the headers list.
+    headers : sequence of dicts
+        The headers to merge. Each file is represented as a dict,
+        and the items in these are the key,value pairs from the
+        file. Every key from the dict is expected to be in the
+        keys parameter, but not every key has to appear in all
+        dicts.
+
+    """
+
+    for key in keys:
+        def getkey(d):
+            try:
+                return d[key]
+            except KeyError:
+                return None
+
+        vals = [getkey(d) for d in headers]
+        newval = rules.apply(key, vals)
+        has_key = cr.key_exists(key)
+        if newval is None:
+            if has_key:
+                cr.delete_key(key)
+        else:
+            # does this lose comments/units/description if the key already
+            # exists?
+            pycrates.set_key(cr, key, newval)
+
+
 # End
@@ -25,6 +25,7 @@ Routines used when merging and combining data.
 import os
 import tempfile
 import resource
+import warnings
 
 import numpy as np
 
@@ -39,6 +40,7 @@ from ciao_contrib.region.fov import AxisRange
 import ciao_contrib.cxcdm_wrapper as cw
 import ciao_contrib.logger_wrapper as lw
 import ciao_contrib.runtool as rt
+from ciao_contrib.parallel_wrapper import parallel_pool_futures
 
 import coords.format
 import coords.utils
@@ -49,7 +51,7 @@ from ciao_contrib._tools.obsinfo import ObsInfo
 from ciao_contrib._tools import run
 from ciao_contrib._tools import utils
 
-from ciao_contrib._tools.headers import HeaderMerge
+from ciao_contrib._tools.headers import HeaderMerge, adjust_headers
 from ciao_contrib.stacklib import TemporaryStack
 
 __all__ = (
@@ -2469,8 +2471,13 @@ def which_obsids_overlap(obsinfos,
 
 def merge_files(imgfiles, expmap_files, imgfile, expmap, fluxmap,
                 lookupTable, toolname, pars, toolversion,
-                verbose=1, clobber=False, tmpdir="/tmp/", nchunk=100):
-    """Combine the images"""
+                verbose=1, clobber=False, tmpdir="/tmp/", nchunk=100,
+                nproc=1):
+    """Combine the images.
+
+    When there are more than nchunk files the images are summed
+    using nproc processes.
+    """
 
     run.dmimgcalc_add(imgfiles,
                       imgfile + '[EVENTS_IMAGE]',
@@ -2479,7 +2486,8 @@ def merge_files(imgfiles, expmap_files, imgfile, expmap, fluxmap,
                       lookupTab=lookupTable,
                       tmpdir=tmpdir,
                       nchunk=nchunk,
-                      bigN_smallNchunk_bypass=True)
+                      bigN_smallNchunk_bypass=True,
+                      nproc=nproc)
 
     run.dmimgcalc_add(expmap_files,
                       expmap + '[EXPMAP]',
@@ -2488,7 +2496,8 @@ def merge_files(imgfiles, expmap_files, imgfile, expmap, fluxmap,
                       lookupTab=lookupTable,
                       tmpdir=tmpdir,
                       nchunk=nchunk,
-                      bigN_smallNchunk_bypass=True)
+                      bigN_smallNchunk_bypass=True,
+                      nproc=nproc)
 
     run.fix_bunit(expmap_files[0], expmap, verbose=verbose)
 
@@ -2530,43 +2539,6 @@ def shape_to_string(shape):
     return ' x '.join([str(s) for s in shapes])
 
 
-def adjust_headers(rules, cr, keys, headers):
-    """Apply the header merging rules to the headers.
-
-    Parameters
-    ----------
-    rules : HeaderMerge instance
-    cr : pycrates.TABLECrate or pycrates.IMAGECrate instance
-    keys : sequence of keywords
-        These are all the keys seen in the headers list.
-    headers : sequence of dicts
-        The headers to merge. Each file is represented as a dict,
-        and the items in these are the key,value pairs from the
-        file. Every key from the dict is expected to be in the
-        keys parameter, but not every key has to appear in all
-        dicts.
-
-    """
-
-    for key in keys:
-        def getkey(d):
-            try:
-                return d[key]
-            except KeyError:
-                return None
-
-        vals = [getkey(d) for d in headers]
-        newval = rules.apply(key, vals)
-        has_key = cr.key_exists(key)
-        if newval is None:
-            if has_key:
-                cr.delete_key(key)
-        else:
-            # does this lose comments/units/description if the key already
-            # exists?
-            pycrates.set_key(cr, key, newval)
-
-
 # NOTE: exposure_weight and expmap_weight have very-similar structure,
 #       so there is currently a lot of repeated code.
 #
@@ -2851,14 +2823,216 @@ def expmap_weight(infiles, expmaps, outfile, lookupTable,
     basecr.write(outfile, clobber=clobber)
 
 
+def _median_tile(args):
+    """Calculate the per-pixel median of the stacked images for a tile.
+
+    The argument is a tuple of (stackfiles, start, end), where
+    stackfiles are .npy files and the tile covers rows start to
+    end - 1 (i.e. the first axis of the image), so that it can be
+    used with parallel_pool_futures.
+    """
+
+    stackfiles, start, end = args
+    tile = np.stack([np.load(stackfile, mmap_mode='r')[start:end]
+                     for stackfile in stackfiles])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmedian(tile, axis=0)
+
+
+def combine_images(infiles, outfile, function, lookupTable,
+                   nchunk=None, nproc=1, clobber=False, tmpdir="/tmp/"):
+    """Combine the images pixel-by-pixel, similar to dmimgfilt.
+
+    Parameters
+    ----------
+    infiles : list of str
+        The files to combine. They are assumed to have any spatial
+        subspace filtered out of them, and be on the same grid (and
+        be the same size).
+    outfile : str
+        The file to create. This is assumed to include any rename of
+        the output block if required.
+    function : {'min', 'max', 'mean', 'median', 'mid'}
+        The combination, where mid is the average of the minimum and
+        maximum values.
+    lookupTable : str
+        The name of the lookup table used to merge headers.
+    nchunk : int or None, optional
+        The memory budget for the median calculation, given as the
+        number of images that can be held in memory at once. If None
+        then the budget is the number of input images.
+    nproc : int or None, optional
+        The number of processes to use for the median calculation.
+        The default is 1; None is treated as 1.
+    clobber : bool, optional
+        Is the output file over-written if it already exists?
+    tmpdir : str, optional
+        The directory used to store the images for the median
+        calculation.
+
+    Notes
+    -----
+    Each file is read in once. The min, max, mean, and mid values
+    are calculated as the files are read in. For the median the
+    pixel values are written to tmpdir and then memory-mapped, so
+    that the median can be calculated exactly for tiles of rows,
+    with the tile size set by nchunk. The tiles can be processed in
+    parallel.
+
+    Non-finite pixel values are ignored, and a pixel with no finite
+    values is set to NaN. The output has the same data type as the
+    first file.
+
+    The output header is close to what the DataModel merging rules would
+    give, but it is not exact. No history items are added for this
+    step.
+
+    """
+
+    if len(infiles) == 0:
+        raise ValueError("Input files is empty")
+
+    if function not in ['min', 'max', 'mean', 'median', 'mid']:
+        raise ValueError(f"Unsupported function={function}")
+
+    mergerules = HeaderMerge(lookupTable)
+
+    basecr = None
+    minvals = None
+    maxvals = None
+    total = None
+    count = None
+
+    headers = []
+    keys = set()
+
+    stackfiles = []
+    try:
+        for infile in infiles:
+            cr = pycrates.read_file(infile)
+            if not isinstance(cr, pycrates.IMAGECrate):
+                raise ValueError(f"Not an image: {infile}")
+
+            ivals = cr.get_image().values
+            if basecr is None:
+                shape = ivals.shape
+            elif ivals.shape != shape:
+                expected = shape_to_string(shape)
+                got = shape_to_string(ivals.shape)
+                raise ValueError(f"Expected {expected} but found {got} in {infile}")
+
+            ivals = ivals.astype(np.float64)
+            good = np.isfinite(ivals)
+            ivals[~good] = np.nan
+
+            if function == 'median':
+                fh, stackfile = tempfile.mkstemp(dir=tmpdir, suffix='.npy')
+                os.close(fh)
+                stackfiles.append(stackfile)
+                np.save(stackfile, ivals)
+
+            elif function == 'mean':
+                if total is None:
+                    total = np.zeros(shape)
+                    count = np.zeros(shape, dtype=np.int64)
+
+                total += np.where(good, ivals, 0)
+                count += good
+
+            else:
+                if minvals is None:
+                    minvals = ivals
+                    maxvals = ivals.copy()
+                else:
+                    np.fmin(minvals, ivals, out=minvals)
+                    np.fmax(maxvals, ivals, out=maxvals)
+
+            # store the header names and values
+            #
+            names = cr.get_keynames()
+            headers.append({k: cr.get_key_value(k) for k in names})
+            keys.update(set(names))
+
+            if basecr is None:
+                basecr = cr
+
+        if function == 'median':
+            nfiles = len(stackfiles)
+            if nproc is None:
+                nproc = 1
+
+            if nchunk is None:
+                nchunk = nfiles
+
+            # Ensure that all the tiles being processed fit into
+            # nchunk images. A pixel in a tile is stored as 8 bytes,
+            # and nanmedian makes a copy, whereas the images are
+            # taken to be 4 bytes per pixel. There is no point in
+            # having more tiles than processes when the budget allows.
+            #
+            nrows = shape[0]
+            tilesize = (nchunk * nrows) // (4 * nfiles * nproc)
+            tilesize = min(tilesize, int(np.ceil(nrows / nproc)))
+            tilesize = max(1, tilesize)
+            args = [(stackfiles, start, min(start + tilesize, nrows))
+                    for start in range(0, nrows, tilesize)]
+            v3(f"Calculating the median of {nfiles} images in {len(args)} tiles")
+
+            if nproc > 1 and len(args) > 1:
+                tiles = parallel_pool_futures(_median_tile, args, ncores=nproc)
+            else:
+                tiles = [_median_tile(arg) for arg in args]
+
+            newvals = np.concatenate(tiles)
+
+        elif function == 'mean':
+            res = np.seterr(invalid='ignore')
+            try:
+                newvals = total / count
+            finally:
+                np.seterr(**res)
+
+        elif function == 'min':
+            newvals = minvals
+
+        elif function == 'max':
+            newvals = maxvals
+
+        else:
+            newvals = (minvals + maxvals) / 2
+
+    finally:
+        for stackfile in stackfiles:
+            try:
+                os.remove(stackfile)
+            except OSError:
+                pass
+
+    otype = basecr.get_image().values.dtype
+    basecr.get_image().values = newvals.astype(otype)
+
+    # Adjust the header for each key we have seen.
+    #
+    adjust_headers(mergerules, basecr, keys, headers)
+
+    basecr.write(outfile, clobber=clobber)
+
+
 def merge_psfmaps(mergetype, psfmap, psfmap_files, expmap_files,
                   lookupTable, toolname, pars, toolversion,
-                  verbose=1, clobber=False, tmpdir="/tmp", nchunk=None):
+                  verbose=1, clobber=False, tmpdir="/tmp", nchunk=None,
+                  nproc=1):
     """Combine the PSF maps.
 
     It is assumed that the PSF maps have no spatial subspace filters
     (e.g. they were created by fluximage.run_mkpsfmap which explicitly
     removes any spatial filter).
+
+    If nchunk is set then the min, max, mean, median, and mid options
+    are calculated with combine_images, using nproc processes, rather
+    than dmimgfilt.
     """
 
     dmfilttypes = ['min', 'max', 'mean', 'median', 'mid']
@@ -2902,43 +3076,13 @@ def merge_psfmaps(mergetype, psfmap, psfmap_files, expmap_files,
         combine_psfmap(psfmap_files, expmap_files, outfile, mergetype, lookupTable)
 
     else:
-        chunks = int(np.ceil( len(psfmap_files)/nchunk ))
-        datachunks = [ list(zip(*[psfmap_files,expmap_files]))[i::chunks] for i in range(chunks) ]
-        tmplist = []
-
-        for d in datachunks:
-            pmaps, emaps = zip(*d)
-
-            tmplist.append( _tmp := tempfile.NamedTemporaryFile(dir=tmpdir) )
-
-            combine_psfmap(pmaps, emaps, f"{_tmp.name}[PSFMAP]", mergetype, lookupTable)
-
-        tmp_fn = [t.name for t in tmplist]
-        _iter = 0
-
-        while chunks > nchunk:
-            chunks = int(np.ceil( chunks/nchunk ))
-            _datachunks = [ tmplist[i::chunks] for i in range(chunks) ]
-            _tmplist = []
-
-            for d in _datachunks:
-                _tmplist.append( _tmp := tempfile.NamedTemporaryFile(dir=tmpdir) )
-
-                dmfilt_stk([_d.name for _d in d], f"{_tmp.name}[PSFMAP]", mergetype)
-
-                for _d in d:
-                    _d.close()
-
-            _iter += 1
-            tmplist = _tmplist
-
-        if _iter > 0:
-            tmp_fn = [t.name for t in _tmplist]
-
-        dmfilt_stk(tmp_fn, outfile, mergetype)
-
-        for t in tmplist:
-            t.close()
+        # Rather than use dmimgfilt on chunks of files, which is not
+        # exact for the median or mid options, combine the maps
+        # directly with a memory budget of nchunk maps.
+        #
+        combine_images(psfmap_files, outfile, mergetype, lookupTable,
+                       nchunk=nchunk, nproc=nproc, clobber=clobber,
+                       tmpdir=tmpdir)
 
     run.fix_bunit(psfmap_files[0], psfmap, verbose=verbose)
 
@@ -2960,7 +3104,8 @@ def merge(process,
           pathfrom=None,
           tmpdir="/tmp/",
           counts_nchunk : int|None=100,
-          psfmap_nchunk : int|None=None):
+          psfmap_nchunk : int|None=None,
+          nproc : int|None=1):
     """Combine the fluximage outputs into single images.
     outfiles is the output of setup_output_names().
 
@@ -2974,6 +3119,11 @@ def merge(process,
     pathfrom : str or None, optional
         The location of the script (i.e. it's __file__ value) as this
         is used to find the lookup table,
+    nproc : int or None, optional
+        The number of processes used to sum the images and exposure
+        maps (when there are more than counts_nchunk of them) and to
+        combine the PSF maps when psfmap_nchunk is set. The default
+        is 1, so the work is done serially.
 
     """
 
@@ -3041,7 +3191,8 @@ def merge(process,
                     imgfile, expmap, fluxmap,
                     ltable, toolname, pars, toolversion,
                     verbose=verbose, clobber=clobber,
-                    tmpdir=tmpdir, nchunk=counts_nchunk)
+                    tmpdir=tmpdir, nchunk=counts_nchunk,
+                    nproc=nproc)
 
     if psfmerge is not None:
         psfmaps = outfiles['psfmaps']
@@ -3050,7 +3201,8 @@ def merge(process,
             merge_psfmaps(psfmerge, psfmap, psfmaps[eband], expmaps[eband],
                           ltable, toolname, pars, toolversion,
                           verbose=verbose, clobber=clobber,
-                          tmpdir=tmpdir, nchunk=psfmap_nchunk)
+                          tmpdir=tmpdir, nchunk=psfmap_nchunk,
+                          nproc=nproc)
 
     try:
         rt.add_tool_history(outfiles['mergedevtfile'], toolname, pars,
@@ -1,5 +1,5 @@
 #
-# Copyright (C) 2013, 2014, 2015, 2016, 2021
+# Copyright (C) 2013, 2014, 2015, 2016, 2021, 2026
 #           Smithsonian Astrophysical Observatory
 #
 #
@@ -94,10 +94,14 @@ class ObsInfo:
         observation.
         """
 
-        # This is not designed to be efficient, since file(s)
-        # may be opened multiple times.
+        # The header, column, and WCS information come from the
+        # per-file metadata cache in fileio, so the file is only
+        # read once even when the same file is used to create
+        # several objects, or by other fileio routines.
         #
-        (keys, cols) = fileio.get_keys_cols_from_file(infile)
+        meta = fileio.get_file_metadata(infile)
+        keys = meta.keys
+        cols = meta.cols
         if cols is None:
             raise IOError(f"{infile} is an image, not a table!")
 
@@ -115,17 +119,12 @@ class ObsInfo:
 
         self._obsid = utils.make_obsid_from_headers(keys, infile=infile)
 
-        # Note this re-opens the file, so is wasteful but we assume that since
-        # the file has just been opened it is in some cache so access time
-        # should not be too bad
-        # (and the routine is not optimised for speed anyway).
-        #
         if self._instrument == 'ACIS':
-            self._aimpoint = fileio.get_aimpoint(infile)
+            self._aimpoint = meta.aimpoint
         else:
             self._aimpoint = None
 
-        self._tangent = fileio.get_tangent_point(infile)
+        self._tangent = meta.tangent_point
 
         # Store the absolute path
         # NOTE: for the directory we strip out any DM filter, since
@@ -135,8 +134,8 @@ class ObsInfo:
         #
         self._evtfile = os.path.normpath(os.path.abspath(infile))
         self._evtdir = os.path.dirname(_remove_dmfilter(self._evtfile))
-        self._header = keys
-        self._cols = cols
+        self._header = dict(keys)
+        self._cols = list(cols)
         self._colnames = [col.name.upper() for col in cols]
         self._nrows = keys['__NROWS']
 
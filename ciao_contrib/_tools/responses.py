@@ -0,0 +1,508 @@
+#
+#  Copyright (C) 2026
+#    Smithsonian Astrophysical Observatory
+#
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program; if not, write to the Free Software Foundation, Inc.,
+#  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Combine ARF and RMF files without running addresp.
+
+The combination follows addresp: with exposure times t_i and
+effective areas A_i(E), the output ARF is
+
+    A(E) = sum_i t_i A_i(E) / T
+
+where T is the sum (method=sum) or mean (method=avg) of the t_i, and
+the output RMF is the weighted sum of the input RMFs, with
+
+    w_i(E) = t_i A_i(E) / sum_j t_j A_j(E)
+
+(falling back to t_i / sum_j t_j for energies where all the effective
+areas are zero).
+
+The RMFs are used in their compressed form (the N_GRP, F_CHAN,
+N_CHAN, and MATRIX columns) and combined as sparse (energy, channel)
+arrays, so the full matrix is never created. The RMFs are read in
+groups, and each group is added to the running total, so the memory
+use depends on the group size and not the number of RMFs.
+
+The output files are based on the first ARF and RMF, so they retain
+their header keywords and the EBOUNDS block, with the NUMGRP and
+NUMELT keywords updated to match the new matrix.
+"""
+
+import numpy as np
+
+import ciao_contrib.logger_wrapper as lw
+
+__all__ = ("ResponseGridError", "combine_responses")
+
+lgr = lw.initialize_module_logger('_tools.responses')
+v2 = lgr.verbose2
+v3 = lgr.verbose3
+
+# The number of RMFs to read before adding them to the total.
+GROUP_SIZE = 8
+
+
+class ResponseGridError(ValueError):
+    """The responses can not be combined, e.g. because their energy
+    or channel grids do not match."""
+
+
+class SparseRMF:
+    """The matrix of a RMF, stored as (row, channel, value) triples.
+
+    Parameters
+    ----------
+    elo, ehi : ndarray
+        The energy grid of the matrix.
+    nchan : int
+        The number of channels (DETCHANS).
+    offset : int
+        The first channel number (normally 0 or 1).
+    rows, chans : ndarray
+        The energy-grid index and the channel index (starting at 0)
+        of each element.
+    values : ndarray
+        The matrix values.
+
+    """
+
+    def __init__(self, elo, ehi, nchan, offset, rows, chans, values):
+        self.elo = elo
+        self.ehi = ehi
+        self.nchan = nchan
+        self.offset = offset
+        self.rows = rows
+        self.chans = chans
+        self.values = values
+
+    @property
+    def nrows(self):
+        return len(self.elo)
+
+    def keys(self):
+        """The position of each element in the flattened matrix."""
+        return self.rows.astype(np.int64) * self.nchan + self.chans
+
+
+def flatten_rows(values, counts):
+    """Concatenate the first counts[i] elements of each row.
+
+    Parameters
+    ----------
+    values : ndarray
+        The column values, which can be a variable-length column
+        (an object array), a 2D array, or a 1D array (when each row
+        has at most one element).
+    counts : ndarray of int
+        The number of elements to use from each row.
+
+    Returns
+    -------
+    flat : ndarray
+
+    """
+
+    counts = np.asarray(counts, dtype=int)
+    if values.dtype == object:
+        rows = [np.atleast_1d(v)[:c] for v, c in zip(values, counts)]
+        if len(rows) == 0:
+            return np.zeros(0)
+
+        return np.concatenate(rows)
+
+    vals = np.asarray(values)
+    if vals.ndim == 1:
+        vals = vals[:, None]
+
+    mask = np.arange(vals.shape[1])[None, :] < counts[:, None]
+    return vals[mask]
+
+
+def expand_groups(n_grp, f_chan, n_chan, matrix, offset):
+    """Convert the compressed form of a RMF into (row, channel, value)
+    triples.
+
+    Parameters
+    ----------
+    n_grp : ndarray
+        The number of groups in each row.
+    f_chan, n_chan : ndarray
+        The first channel and number of channels for each group,
+        in row order (i.e. already flattened).
+    matrix : ndarray
+        The matrix values, in row order.
+    offset : int
+        The first channel number.
+
+    Returns
+    -------
+    rows, chans, values : ndarray
+        The channel values start at 0.
+
+    """
+
+    n_grp = np.asarray(n_grp, dtype=int)
+    n_chan = np.asarray(n_chan, dtype=int)
+    grow = np.repeat(np.arange(n_grp.size), n_grp)
+
+    rows = np.repeat(grow, n_chan)
+    start = np.repeat(np.cumsum(n_chan) - n_chan, n_chan)
+    chans = np.repeat(np.asarray(f_chan, dtype=int) - offset, n_chan) + \
+        np.arange(rows.size) - start
+
+    return rows, chans, np.asarray(matrix)[:rows.size]
+
+
+def compress_groups(rows, chans, nrows, offset):
+    """Create the groups for the sorted (row, channel) positions.
+
+    A group is a run of consecutive channels in a row.
+
+    Returns
+    -------
+    n_grp, f_chan, n_chan, row_bounds : ndarray
+        The row_bounds array gives the start of each row in the
+        element arrays (it has nrows + 1 elements).
+
+    """
+
+    nelem = rows.size
+    newgrp = np.ones(nelem, dtype=bool)
+    newgrp[1:] = (rows[1:] != rows[:-1]) | (chans[1:] != chans[:-1] + 1)
+
+    gidx = np.flatnonzero(newgrp)
+    f_chan = chans[gidx] + offset
+    n_chan = np.diff(np.append(gidx, nelem))
+    n_grp = np.bincount(rows[gidx], minlength=nrows)
+
+    row_bounds = np.searchsorted(rows, np.arange(nrows + 1))
+    return n_grp, f_chan, n_chan, row_bounds
+
+
+def arf_weights(specresp, exposures):
+    """Return the RMF weights for each ARF and energy bin.
+
+    Parameters
+    ----------
+    specresp : ndarray
+        The effective areas, with shape (nfiles, nenergy).
+    exposures : ndarray
+        The exposure times, with shape (nfiles,).
+
+    Returns
+    -------
+    weights : ndarray
+        The weights, with shape (nfiles, nenergy).
+
+    """
+
+    exposures = np.asarray(exposures, dtype=float)
+    weighted = specresp * exposures[:, None]
+    total = weighted.sum(axis=0)
+
+    weights = exposures[:, None] / exposures.sum() * np.ones_like(weighted)
+    good = total > 0
+    weights[:, good] = weighted[:, good] / total[good]
+    return weights
+
+
+def combine_sparse(rmfs, weights):
+    """Add the weighted matrices to the running total.
+
+    Parameters
+    ----------
+    rmfs : sequence of SparseRMF
+        The first element is the running total (its values are not
+        re-weighted, so use None for the weight).
+    weights : sequence of ndarray or None
+        The weight for each row of the matrix.
+
+    Returns
+    -------
+    total : SparseRMF
+
+    """
+
+    first = rmfs[0]
+    keys = []
+    vals = []
+    for rmf, wgt in zip(rmfs, weights):
+        keys.append(rmf.keys())
+        if wgt is None:
+            vals.append(rmf.values)
+        else:
+            vals.append(rmf.values * wgt[rmf.rows])
+
+    keys = np.concatenate(keys)
+    vals = np.concatenate(vals)
+
+    ukeys, idx = np.unique(keys, return_inverse=True)
+    total = np.bincount(idx, weights=vals, minlength=ukeys.size)
+
+    return SparseRMF(first.elo, first.ehi, first.nchan, first.offset,
+                     ukeys // first.nchan, ukeys % first.nchan, total)
+
+
+def check_grid(rmf, elo, ehi, label):
+    """Check the energy grid matches."""
+
+    if rmf.nrows != len(elo) or \
+       not (np.allclose(rmf.elo, elo) and np.allclose(rmf.ehi, ehi)):
+        raise ResponseGridError(f"The energy grid of {label} does not match")
+
+
+def _find_blocks(dataset, infile):
+    """Return the MATRIX and EBOUNDS blocks of the RMF."""
+
+    matrix = None
+    ebounds = None
+    for idx in range(1, dataset.get_ncrates() + 1):
+        cr = dataset.get_crate(idx)
+        if not hasattr(cr, "column_exists"):
+            continue
+
+        if cr.column_exists("MATRIX"):
+            if matrix is not None:
+                raise ResponseGridError(f"{infile} contains multiple MATRIX blocks")
+            matrix = cr
+        elif cr.column_exists("E_MIN"):
+            ebounds = cr
+
+    if matrix is None:
+        raise ResponseGridError(f"Unable to find the MATRIX block in {infile}")
+
+    return matrix, ebounds
+
+
+def _get_offset(ebounds):
+    """The first channel number, taken from EBOUNDS (default 1)."""
+
+    if ebounds is None or not ebounds.column_exists("CHANNEL"):
+        return 1
+
+    return int(ebounds.get_column("CHANNEL").values[0])
+
+
+def read_sparse_rmf(rmffile):
+    """Read in the RMF.
+
+    Parameters
+    ----------
+    rmffile : str
+
+    Returns
+    -------
+    rmf : SparseRMF
+
+    """
+
+    import pycrates
+
+    ds = pycrates.read_rmf(rmffile)
+    matrix, ebounds = _find_blocks(ds, rmffile)
+
+    def getcol(name):
+        return matrix.get_column(name).values
+
+    n_grp = np.asarray(getcol("N_GRP"), dtype=int)
+    f_chan = flatten_rows(getcol("F_CHAN"), n_grp)
+    n_chan = flatten_rows(getcol("N_CHAN"), n_grp).astype(int)
+
+    grow = np.repeat(np.arange(n_grp.size), n_grp)
+    nelem = np.bincount(grow, weights=n_chan, minlength=n_grp.size).astype(int)
+    mvals = flatten_rows(getcol("MATRIX"), nelem)
+
+    offset = _get_offset(ebounds)
+    rows, chans, values = expand_groups(n_grp, f_chan, n_chan, mvals,
+                                        offset)
+
+    nchan = matrix.get_key_value("DETCHANS")
+    if nchan is None:
+        nchan = ebounds.get_nrows()
+
+    return SparseRMF(np.asarray(getcol("ENERG_LO"), dtype=float),
+                     np.asarray(getcol("ENERG_HI"), dtype=float),
+                     int(nchan), offset, rows, chans,
+                     values.astype(float))
+
+
+def _to_column(template, rows):
+    """Convert the per-row arrays to match the template column, which
+    is either variable length or a 2D array."""
+
+    dtype = template.dtype if template.dtype != object else \
+        np.atleast_1d(template[0]).dtype
+
+    if template.dtype == object:
+        out = np.empty(len(rows), dtype=object)
+        for idx, row in enumerate(rows):
+            out[idx] = np.asarray(row, dtype=dtype)
+        return out
+
+    width = max(1, max(len(row) for row in rows))
+    out = np.zeros((len(rows), width), dtype=dtype)
+    for idx, row in enumerate(rows):
+        out[idx, :len(row)] = row
+
+    return out
+
+
+def write_sparse_rmf(rmf, template, outfile):
+    """Write out the RMF, using template for the header and EBOUNDS.
+
+    Parameters
+    ----------
+    rmf : SparseRMF
+    template : str
+        The RMF file to copy.
+    outfile : str
+
+    """
+
+    import pycrates
+
+    ds = pycrates.read_rmf(template)
+    matrix, _ = _find_blocks(ds, template)
+
+    nrows = rmf.nrows
+    n_grp, f_chan, n_chan, row_bounds = compress_groups(rmf.rows, rmf.chans,
+                                                        nrows, rmf.offset)
+    grp_bounds = np.append(0, np.cumsum(n_grp))
+
+    def per_row(vals, bounds):
+        return [vals[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    col = matrix.get_column("N_GRP")
+    col.values = n_grp.astype(col.values.dtype)
+
+    for name, vals, bounds in [("F_CHAN", f_chan, grp_bounds),
+                               ("N_CHAN", n_chan, grp_bounds),
+                               ("MATRIX", rmf.values, row_bounds)]:
+        col = matrix.get_column(name)
+        col.values = _to_column(col.values, per_row(vals, bounds))
+
+    for key, val in [("NUMGRP", n_grp.sum()), ("NUMELT", n_chan.sum())]:
+        if matrix.key_exists(key):
+            matrix.get_key(key).value = int(val)
+
+    v3(f"Writing RMF with {int(n_grp.sum())} groups to {outfile}")
+    ds.write(outfile, clobber=True)
+
+
+def read_arf(arffile):
+    """Return the energy grid and effective area of the ARF."""
+
+    import pycrates
+
+    cr = pycrates.read_file(arffile)
+    return (np.asarray(cr.get_column("ENERG_LO").values, dtype=float),
+            np.asarray(cr.get_column("ENERG_HI").values, dtype=float),
+            np.asarray(cr.get_column("SPECRESP").values, dtype=float))
+
+
+def write_arf(specresp, template, outfile):
+    """Write out the ARF, using template for the header."""
+
+    import pycrates
+
+    cr = pycrates.read_file(template)
+    col = cr.get_column("SPECRESP")
+    col.values = specresp.astype(col.values.dtype)
+    cr.write(outfile, clobber=True)
+
+
+def combine_responses(arffiles, rmffiles, exposures, outarf, outrmf,
+                      method="sum", group_size=GROUP_SIZE):
+    """Combine the ARFs and, optionally, RMFs.
+
+    Parameters
+    ----------
+    arffiles : sequence of str
+        The ARF files.
+    rmffiles : sequence of str or None
+        The RMF files, which must match arffiles. If None then only
+        the ARF is created.
+    exposures : sequence of float
+        The exposure time for each response.
+    outarf, outrmf : str
+        The output file names; outrmf is ignored if rmffiles is None.
+    method : {'sum', 'avg'}, optional
+        Is the exposure time of the combined response the sum or mean
+        of the exposures?
+    group_size : int, optional
+        The number of RMFs to read in before adding them to the
+        running total.
+
+    Raises
+    ------
+    ResponseGridError
+        The energy or channel grids do not match. No output files
+        are written in this case.
+
+    """
+
+    exposures = np.asarray(exposures, dtype=float)
+    if method == 'sum':
+        texp = exposures.sum()
+    elif method == 'avg':
+        texp = exposures.mean()
+    else:
+        raise ValueError(f"Unknown option method value '{method}'")
+
+    elo = None
+    ehi = None
+    specresp = []
+    for arffile in arffiles:
+        a_lo, a_hi, area = read_arf(arffile)
+        if elo is None:
+            elo = a_lo
+            ehi = a_hi
+        elif len(a_lo) != len(elo) or \
+                not (np.allclose(a_lo, elo) and np.allclose(a_hi, ehi)):
+            raise ResponseGridError(f"The energy grid of {arffile} does not match {arffiles[0]}")
+
+        specresp.append(area)
+
+    specresp = np.asarray(specresp)
+    out_specresp = (specresp * exposures[:, None]).sum(axis=0) / texp
+
+    if rmffiles is not None:
+        weights = arf_weights(specresp, exposures)
+
+        total = None
+        for start in range(0, len(rmffiles), group_size):
+            group = [] if total is None else [total]
+            gweights = [] if total is None else [None]
+            for idx in range(start, min(start + group_size, len(rmffiles))):
+                v2(f"Reading RMF {rmffiles[idx]}")
+                rmf = read_sparse_rmf(rmffiles[idx])
+                check_grid(rmf, elo, ehi, rmffiles[idx])
+                if group and (rmf.nchan != group[0].nchan or
+                              rmf.offset != group[0].offset):
+                    raise ResponseGridError(f"The channel grid of {rmffiles[idx]} does not match {rmffiles[0]}")
+
+                group.append(rmf)
+                gweights.append(weights[idx])
+
+            total = combine_sparse(group, gweights)
+
+        write_sparse_rmf(total, rmffiles[0], outrmf)
+
+    write_arf(out_specresp, arffiles[0], outarf)
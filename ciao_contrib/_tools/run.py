@@ -38,6 +38,7 @@ moved to using the runtool module.
 
 import functools
 import os
+import re
 import subprocess as sbp
 import tempfile
 
@@ -45,6 +46,7 @@ import numpy as np
 
 import cxcdm
 import paramio
+import pycrates
 from region import CXCRegion
 import stk
 
@@ -52,7 +54,9 @@ import ciao_contrib.logger_wrapper as lw
 
 from ciao_contrib.stacklib import make_stackfile
 import ciao_contrib.runtool as rt
+from ciao_contrib.parallel_wrapper import parallel_pool_futures
 from ciao_contrib._tools import fileio
+from ciao_contrib._tools.headers import HeaderMerge, adjust_headers
 
 
 __all__ = (
@@ -62,6 +66,7 @@ __all__ = (
     "update_column_range",
     "dmmerge",
     "dmimgcalc2", "dmimgcalc", "dmimgcalc_add",
+    "sum_images",
     "dmkeypar",
     "dmhedit_key", "dmhedit_file",
     "get_lookup_table",
@@ -280,25 +285,23 @@ def dmimgcalc_add(infiles, outfile,
                   lookupTab=None,
                   tmpdir="/tmp/",
                   nchunk=100,
-                  bigN_smallNchunk_bypass=False):
-    """Add up all the images in infiles (an array) to create outfile,
-    using dmimgcalc.
+                  bigN_smallNchunk_bypass=False,
+                  nproc=1):
+    """Add up all the images in infiles (an array) to create outfile.
 
-    If lookupTab is not None it is passed to dmimgcalc.
+    If lookupTab is not None it is used to merge the headers.
+
+    When there are at most nchunk files then dmimgcalc is used. It's
+    not obvious when the length of the command causes a problem but
+    we have had crashes when ~160 files have been combined - see
+    #481 - so for larger numbers of files the images are summed
+    directly with sum_images, which has no limit on the number of
+    files and can use nproc processes (the default is to sum them
+    serially).
 
-    To avoid problems with the command argument getting too long we
-    chunk the data up into nchunk files at a maximum, and sum up the
-    individual chunks. It's not obvious when it's a problem but we
-    have had crashes when ~160 files have been combined even though I
-    can combine a larger number of files, which suggests that it's the
-    length of the total command string - see #481. So pick a
-    hopefully-safe chunk size. There is however a limit: 100**2, just
-    because I can't be bothered with recursion here. If we are trying
-    to add this many files we are probably going to have problems
-    anyway! This can be ameliorated in CIAO 4.15 and later by taking
-    advantage of the stack support for the operation parameter to
-    dmimgcalc, but we do not try here as we still have this workaround
-    (and we may benefit from not loading all the data in at once).
+    The bigN_smallNchunk_bypass argument is no-longer used, since
+    there is no limit on the number of files, and is retained for
+    backwards compatibility.
 
     """
 
@@ -315,44 +318,184 @@ def dmimgcalc_add(infiles, outfile,
                   lookupTab=lookupTab)
         return
 
-    # Try to use an equal number of files per chunk
-    chunking = int(np.ceil(nfiles / nchunk))
+    if lookupTab is None:
+        lookupTab = get_lookup_table("dmimgcalc")
+
+    sum_images(infiles, outfile, lookupTab,
+               clobber=clobber, tmpdir=tmpdir, nproc=nproc)
+
+
+def _read_image(infile):
+    """Return the crate, pixel values, and header for an image.
+
+    The header is returned as a dictionary of keyword values.
+    """
+
+    cr = pycrates.read_file(infile)
+    if not isinstance(cr, pycrates.IMAGECrate):
+        raise ValueError(f"Not an image: {infile}")
+
+    names = cr.get_keynames()
+    header = {k: cr.get_key_value(k) for k in names}
+    return cr, cr.get_image().values, header
+
+
+def _sum_dtype(dtype):
+    """The type used to accumulate images of the given type.
+
+    Integer images are summed using at least 32-bit integers and
+    floating-point images using 64-bit values.
+    """
+
+    if np.issubdtype(dtype, np.floating):
+        return np.dtype(np.float64)
+
+    return np.result_type(dtype, np.int32)
+
+
+def _sum_image_group(args):
+    """Sum up a list of images, saving the result as a .npy file.
+
+    The argument is a tuple of (infiles, outfile), so that it can be
+    used with parallel_pool_futures. The return value is a tuple of
+    the input data type and the header of each file.
+    """
+
+    infiles, outfile = args
+
+    total = None
+    intype = None
+    headers = []
+    for infile in infiles:
+        _, ivals, header = _read_image(infile)
+        headers.append(header)
+
+        if total is None:
+            intype = ivals.dtype
+            total = ivals.astype(_sum_dtype(intype))
+            continue
 
-    v3(f"Summing up {nfiles} files into {chunking} chunks: {outfile}")
+        if total.shape != ivals.shape:
+            raise ValueError(f"Expected shape {total.shape} but found {ivals.shape} in {infile}")
 
-    # We could recurse, but let's error out if we have too-many
-    # files.
-    if chunking >= nchunk and not bigN_smallNchunk_bypass:
-        raise ValueError(f"Sent too many images to add: {nfiles}")
+        intype = np.result_type(intype, ivals.dtype)
+        total += ivals
 
-    start = 0
-    tmpfiles = []
+    np.save(outfile, total)
+    return intype.str, headers
+
+
+def sum_images(infiles, outfile, lookupTable,
+               clobber=False, tmpdir="/tmp/", nproc=1):
+    """Add up the images to create outfile.
+
+    Parameters
+    ----------
+    infiles : list of str
+        The images to add. They are assumed to be on the same grid
+        (and be the same size).
+    outfile : str
+        The file to create. This can include a rename of the output
+        block, e.g. "out.img[EXPMAP]".
+    lookupTable : str
+        The name of the lookup table used to merge headers.
+    clobber : bool, optional
+        Is the output file over-written if it already exists?
+    tmpdir : str, optional
+        The directory used for the partial sums.
+    nproc : int or None, optional
+        The number of processes to use. The default is 1, so the
+        files are summed serially; None is treated as 1.
+
+    Notes
+    -----
+    The files are split into contiguous groups, one per process,
+    and each group is summed up with Crates and saved to tmpdir.
+    The partial sums are then memory-mapped and added together, so
+    at most one image per process is held in memory, along with the
+    running totals.
+
+    As with dmimgcalc, a NaN in any input results in a NaN in the
+    output. The data subspace of the first file is used for the
+    output. Integer images create an integer image (of at least
+    32 bits) and floating-point images are summed with 64-bit values
+    but written out using the input type.
+
+    The output header is close to what the DataModel merging rules
+    would give, but it is not exact. No history items are added.
+
+    """
+
+    nfiles = len(infiles)
+    if nfiles == 0:
+        raise ValueError("Input files is empty")
+
+    if nproc is None:
+        nproc = 1
+
+    ngroups = max(1, min(nproc, nfiles))
+    groups = [list(g) for g in np.array_split(infiles, ngroups)]
+    v3(f"Summing up {nfiles} files in {ngroups} groups: {outfile}")
+
+    mergerules = HeaderMerge(lookupTable)
+
+    tmpnames = []
+    try:
+        args = []
+        for group in groups:
+            fh, tmpname = tempfile.mkstemp(dir=tmpdir, suffix='.npy')
+            os.close(fh)
+            tmpnames.append(tmpname)
+            args.append((group, tmpname))
+
+        if ngroups > 1:
+            results = parallel_pool_futures(_sum_image_group, args,
+                                            ncores=ngroups)
+        else:
+            results = [_sum_image_group(args[0])]
+
+        intype = None
+        headers = []
+        total = None
+        for tmpname, (gtype, gheaders) in zip(tmpnames, results):
+            gtype = np.dtype(gtype)
+            intype = gtype if intype is None else np.result_type(intype, gtype)
+            headers.extend(gheaders)
+
+            partial = np.load(tmpname, mmap_mode='r')
+            if total is None:
+                total = np.array(partial)
+            elif total.shape != partial.shape:
+                raise ValueError(f"Expected shape {total.shape} but found {partial.shape} in partial sum")
+            else:
+                total += partial
+
+            del partial
+
+    finally:
+        for tmpname in tmpnames:
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
 
-    while start < nfiles:
-        filelist = infiles[start:start + nchunk]
-        v3(f" - summing chunk of {len(filelist)} files")
+    if np.issubdtype(intype, np.floating):
+        total = total.astype(intype)
 
-        tmpfile = tempfile.NamedTemporaryFile(dir=tmpdir, suffix='.img')
-        tmpfiles.append(tmpfile)
-        dmimgcalc_add(filelist, tmpfile.name,
-                      verbose=verbose, clobber=True,
-                      lookupTab=lookupTab, tmpdir=tmpdir,
-                      nchunk=nchunk,
-                      bigN_smallNchunk_bypass=bigN_smallNchunk_bypass)
+    keys = set()
+    for header in headers:
+        keys.update(header.keys())
 
-        start += nchunk
+    basecr, _, _ = _read_image(infiles[0])
+    basecr.get_image().values = total
+    adjust_headers(mergerules, basecr, keys, headers)
 
-    # Now add up the chunks
-    v3(f"-> summing up the chunks: {outfile}")
-    dmimgcalc_add([t.name for t in tmpfiles], outfile,
-                  verbose=verbose, clobber=clobber,
-                  lookupTab=lookupTab, tmpdir=tmpdir,
-                  nchunk=nchunk,
-                  bigN_smallNchunk_bypass=bigN_smallNchunk_bypass)
+    match = re.match(r"^(.+)\[([^\]\[]+)\]$", outfile)
+    if match is not None:
+        outfile = match.group(1)
+        basecr.name = match.group(2)
 
-    if not tmpfiles:
-        for t in tmpfiles:
-            t.close()
+    basecr.write(outfile, clobber=clobber)
 
 
 def dmkeypar(infile, key, rtype='string'):
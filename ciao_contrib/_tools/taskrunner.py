@@ -80,6 +80,7 @@ class TaskRunner:
 
         self._torun = {}
         self._names = set()
+        self._memory = {}
 
     def _seen(self, name):
         """Returns True if the runner has already been
@@ -161,7 +162,26 @@ class TaskRunner:
         self._torun[name] = (name, preconditions, msg)
         self._names.add(name)
 
-    def run_tasks(self, processes=None, label=True, context='fork'):
+    def set_task_memory(self, name, memory):
+        """Set the estimated memory use of a task, in bytes.
+
+        When run in parallel, a task is only started when its
+        memory estimate fits into the memory budget (after
+        accounting for the tasks that are already running), unless
+        no other task is running. Tasks with no estimate are taken
+        to use no memory.
+        """
+
+        if not self._seen(name):
+            raise ValueError("Task {} has not been added to this runner".format(name))
+
+        if memory < 0:
+            raise ValueError("The memory for task {} must be >= 0, not {}".format(name, memory))
+
+        self._memory[name] = memory
+
+    def run_tasks(self, processes=None, label=True, context='fork',
+                  memory=None):
         """Run the tasks, waiting until all the tasks have finished.
 
         The processes argument
@@ -178,6 +198,11 @@ class TaskRunner:
 
         The context argument decides how, when multiprocessing is
         in use, the multiprocessing is run.
+
+        The memory argument is the memory budget, in bytes, used to
+        decide when tasks with a memory estimate - see
+        set_task_memory - can be run in parallel. If None then the
+        available memory reported by psutil is used.
         """
 
         if len(self._torun) == 0:
@@ -194,12 +219,20 @@ class TaskRunner:
             self._run_serial()
         else:
             f("Running tasks in parallel with {} processors.".format(processes))
-            self._run_parallel(processes, context=context)
+            if memory is None and len(self._memory) > 0:
+                from psutil import virtual_memory
+                memory = virtual_memory().available
+
+            self._run_parallel(processes, context=context, memory=memory)
 
         self._clean()
 
-    def _run_parallel(self, processes, context='fork'):
-        "Run the tasks in parallel"
+    def _run_parallel(self, processes, context='fork', memory=None):
+        """Run the tasks in parallel.
+
+        If memory is not None then it is the memory budget for the
+        tasks, in bytes.
+        """
 
         stime = time.localtime()
         v4("TaskRunner (parallel, processes={}): started {}".format(processes, time.asctime(stime)))
@@ -285,31 +318,78 @@ class TaskRunner:
         queue = ctx.Queue()
         task_queue = ctx.JoinableQueue()
 
+        if memory is None:
+            memory = float("inf")
+        else:
+            v3("TaskRunner: memory budget is {} bytes".format(memory))
+
+        # The tasks whose preconditions have been met but which
+        # have not been sent to the workers, and the memory use of
+        # the tasks that have been sent to the workers.
+        #
+        pending = []
+        running = {}
+
+        def select_tasks():
+            "Move the tasks that can be run into the pending list."
+
+            deltasks = []
+            for v in self._torun.values():
+                name = v[0]
+                preconditions = v[1]
+                flag = True
+                for pname in preconditions:
+                    if pname not in finished:
+                        flag = False
+                        break
+
+                if not flag:
+                    continue
+
+                deltasks.append(name)
+
+                if len(v) == 3:
+                    v3("TaskRunner: selected barrier {}".format(name))
+                    taskarg = (name, v[2])
+                elif len(v) == 5:
+                    v3("TaskRunner: selected task {}".format(name))
+                    taskarg = (name, v[2], v[3], v[4])
+                else:
+                    raise ValueError("Internal error: task info = {}".format(v))
+
+                pending.append(taskarg)
+
+            for deltask in deltasks:
+                del self._torun[deltask]
+
+        def send_tasks():
+            """Send pending tasks to the workers, in order, when
+            there is a free worker and the task fits into the
+            memory budget. A task is always sent when nothing is
+            running, so a task larger than the budget runs on its
+            own."""
+
+            for taskarg in list(pending):
+                if len(running) >= processes:
+                    break
+
+                name = taskarg[0]
+                mem = self._memory.get(name, 0)
+                if len(running) > 0 and sum(running.values()) + mem > memory:
+                    v4("TaskRunner: task {} waiting for memory".format(name))
+                    continue
+
+                v3("TaskRunner: sending task {}".format(name))
+                task_queue.put(taskarg)
+                pending.remove(taskarg)
+                running[name] = mem
+
         # what tasks can be run now?
-        deltasks = []
-        for v in self._torun.values():
-            name = v[0]
-            preconditions = v[1]
-            if len(preconditions) > 0:
-                continue
-
-            deltasks.append(name)
-            if len(v) == 3:
-                v3("TaskRunner: selected barrier {}".format(name))
-                taskarg = (name, v[2])
-            elif len(v) == 5:
-                v3("TaskRunner: selected task {}".format(name))
-                taskarg = (name, v[2], v[3], v[4])
-            else:
-                raise ValueError("Internal error: task info = {}".format(v))
-
-            task_queue.put(taskarg)
-
-        if len(deltasks) == 0:
+        select_tasks()
+        if len(pending) == 0:
             raise ValueError("Unable to start since all the tasks have at least one precondition")
 
-        for deltask in deltasks:
-            del self._torun[deltask]
+        send_tasks()
 
         # If this process is starved of time then it may not
         # add a task to a queue, even if a process is idle.
@@ -361,6 +441,7 @@ class TaskRunner:
 
             # Can we stop the workers?
             finished.add(taskout)
+            running.pop(taskout, None)
             if len(finished) == ntasks:
                 v4("TaskRunner: all tasks completed; stopping.")
                 for i in range(processes):
@@ -369,34 +450,8 @@ class TaskRunner:
                 break
 
             # Can we run any new tasks?
-            deltasks = []
-            for v in self._torun.values():
-                name = v[0]
-                preconditions = v[1]
-                flag = True
-                for pname in preconditions:
-                    if pname not in finished:
-                        flag = False
-                        break
-
-                if not flag:
-                    continue
-
-                deltasks.append(name)
-
-                if len(v) == 3:
-                    v3("TaskRunner: selected barrier {}".format(name))
-                    taskarg = (name, v[2])
-                elif len(v) == 5:
-                    v3("TaskRunner: selected task {}".format(name))
-                    taskarg = (name, v[2], v[3], v[4])
-                else:
-                    raise ValueError("Internal error: task info = {}".format(v))
-
-                task_queue.put(taskarg)
-
-            for deltask in deltasks:
-                del self._torun[deltask]
+            select_tasks()
+            send_tasks()
 
         # Wait for everything to finish.
         #
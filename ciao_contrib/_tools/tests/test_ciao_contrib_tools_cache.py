@@ -0,0 +1,138 @@
+"""Check ciao_contrib._tools.cache"""
+
+import os
+
+import pytest
+
+from ciao_contrib._tools import cache
+
+
+@pytest.fixture
+def infile(tmp_path):
+    fname = tmp_path / "in.dat"
+    fname.write_text("input")
+    return str(fname)
+
+
+def test_strip_filter():
+    assert cache.strip_filter("evt2.fits[ccd_id=7][bin sky=1]") == "evt2.fits"
+    assert cache.strip_filter("evt2.fits") == "evt2.fits"
+
+
+def test_key_depends_on_params(tmp_path, infile):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+    k1 = pc.key("tool", ["a", 1], [infile])
+    k2 = pc.key("tool", ["a", 1], [infile])
+    k3 = pc.key("tool", ["a", 2], [infile])
+    k4 = pc.key("other", ["a", 1], [infile])
+    assert k1 == k2
+    assert k1 != k3
+    assert k1 != k4
+
+
+def test_key_depends_on_input(tmp_path, infile):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+    k1 = pc.key("tool", [], [infile + "[ccd_id=7]", "NONE"])
+
+    st = os.stat(infile)
+    os.utime(infile, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    k2 = pc.key("tool", [], [infile + "[ccd_id=7]", "NONE"])
+    assert k1 != k2
+
+
+def test_fetch_and_store(tmp_path, infile):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+    key = pc.key("tool", [], [infile])
+
+    outfile = str(tmp_path / "out.dat")
+    assert not pc.fetch(key, "tool", [outfile])
+    assert not os.path.exists(outfile)
+
+    with open(outfile, "w") as fh:
+        fh.write("output")
+
+    pc.store(key, [outfile])
+    os.remove(outfile)
+
+    assert pc.fetch(key, "tool", [outfile])
+    with open(outfile, "r") as fh:
+        assert fh.read() == "output"
+
+    assert pc.stats() == (1, 1)
+
+
+def test_edit_after_fetch_does_not_change_cache(tmp_path, infile):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+    key = pc.key("tool", [], [infile])
+
+    outfile = str(tmp_path / "out.dat")
+    with open(outfile, "w") as fh:
+        fh.write("output")
+
+    pc.store(key, [outfile])
+
+    # Editing the stored output does not change the cache
+    with open(outfile, "a") as fh:
+        fh.write(" + history")
+
+    os.remove(outfile)
+    assert pc.fetch(key, "tool", [outfile])
+
+    # and neither does editing the fetched version
+    with open(outfile, "a") as fh:
+        fh.write(" + history")
+
+    os.remove(outfile)
+    assert pc.fetch(key, "tool", [outfile])
+    with open(outfile, "r") as fh:
+        assert fh.read() == "output"
+
+
+def test_stats_since_mark(tmp_path, infile):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+    key = pc.key("tool", [], [infile])
+    outfile = str(tmp_path / "out.dat")
+
+    pc.fetch(key, "tool", [outfile])
+    mark = pc.mark()
+    pc.fetch(key, "tool", [outfile])
+    pc.fetch(key, "tool", [outfile])
+    assert pc.stats() == (0, 3)
+    assert pc.stats(since=mark) == (0, 2)
+
+
+def test_evict_least_recently_used(tmp_path):
+    pc = cache.ProductCache(str(tmp_path / "cache"))
+
+    keys = []
+    for i in range(3):
+        outfile = str(tmp_path / f"out{i}.dat")
+        with open(outfile, "w") as fh:
+            fh.write("x" * 10)
+
+        key = f"key{i}"
+        pc.store(key, [outfile])
+        keys.append(key)
+
+        # ensure the entries have different times
+        os.utime(os.path.join(pc.cachedir, key), (i, i))
+
+    # Use the first entry so that the second one is the oldest.
+    assert pc.fetch(keys[0], "tool", [str(tmp_path / "new.dat")])
+    pc.maxsize = 25
+    pc.evict()
+
+    assert os.path.isdir(os.path.join(pc.cachedir, keys[0]))
+    assert not os.path.isdir(os.path.join(pc.cachedir, keys[1]))
+    assert os.path.isdir(os.path.join(pc.cachedir, keys[2]))
+
+
+def test_get_product_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv(cache.CACHE_ENV, raising=False)
+    assert cache.get_product_cache() is None
+
+    monkeypatch.setenv(cache.CACHE_ENV, str(tmp_path / "cache"))
+    monkeypatch.setenv(cache.CACHE_SIZE_ENV, "2")
+    pc = cache.get_product_cache()
+    assert pc.cachedir == str(tmp_path / "cache")
+    assert pc.maxsize == 2 * 1024 * 1024
@@ -0,0 +1,76 @@
+"""Check ciao_contrib._tools.colorspace"""
+
+import colorsys
+
+import numpy as np
+
+import pytest
+
+from ciao_contrib._tools import colorspace
+
+
+def random_inputs(npts=5000, seed=1234):
+    """Random values, including some outside 0-1 and some zero
+    saturation values."""
+
+    rng = np.random.default_rng(seed)
+    hue = rng.uniform(-0.5, 1.5, npts)
+    sat = rng.uniform(0, 1, npts)
+    val = rng.uniform(0, 1, npts)
+    sat[::17] = 0.0
+    hue[::23] = np.round(hue[::23] * 6) / 6
+    return hue, sat, val
+
+
+@pytest.mark.parametrize("func,expected",
+                         [(colorspace.hsv_to_rgb, colorsys.hsv_to_rgb),
+                          (colorspace.hls_to_rgb, colorsys.hls_to_rgb)])
+def test_matches_colorsys(func, expected):
+    hue, sat, val = random_inputs()
+    got = np.column_stack(func(hue, sat, val))
+    exp = np.asarray([expected(*x) for x in zip(hue, sat, val)])
+    assert np.array_equal(got, exp)
+
+
+def test_hisv_to_rgb():
+    hue, sat, val = random_inputs(seed=42)
+    got = np.column_stack(colorspace.hisv_to_rgb(hue, sat, val))
+    exp = np.asarray([colorsys.hsv_to_rgb(h, 1.0 - s, v)
+                      for h, s, v in zip(hue, sat, val)])
+    assert np.array_equal(got, exp)
+
+
+def test_my_hls_to_rgb():
+    hue, sat, val = random_inputs(seed=7)
+    got = np.column_stack(colorspace.my_hls_to_rgb(hue, sat, val))
+    exp = np.asarray([colorsys.hls_to_rgb(h, v, s)
+                      for h, s, v in zip(hue, sat, val)])
+    assert np.array_equal(got, exp)
+
+
+@pytest.mark.parametrize("tile_size", [1, 7, 100, None])
+def test_sys_to_rgb_tiles_and_nan(tile_size):
+    hue, sat, val = [x.reshape(50, 100) for x in random_inputs()]
+    hue[3, 4] = np.nan
+    sat[10, :] = np.nan
+    val[49, 99] = np.nan
+
+    red, grn, blu = colorspace.sys_to_rgb(hue, sat, val,
+                                          colorspace.hsv_to_rgb,
+                                          tile_size=tile_size)
+    assert red.shape == (50, 100)
+    for ii in range(50):
+        for jj in range(100):
+            vals = [hue[ii, jj], sat[ii, jj], val[ii, jj]]
+            if np.isnan(vals).any():
+                exp = (0, 0, 0)
+            else:
+                exp = [x * 255 for x in colorsys.hsv_to_rgb(*vals)]
+
+            assert (red[ii, jj], grn[ii, jj], blu[ii, jj]) == tuple(exp)
+
+
+def test_sys_to_rgb_shape_check():
+    with pytest.raises(ValueError):
+        colorspace.sys_to_rgb(np.ones(3), np.ones(3), np.ones(4),
+                              colorspace.hsv_to_rgb)
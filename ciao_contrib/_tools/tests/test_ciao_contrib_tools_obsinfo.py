@@ -3,9 +3,11 @@
 import os
 from pathlib import Path
 
+import numpy as np
+
 import pytest
 
-from ciao_contrib._tools import obsinfo
+from ciao_contrib._tools import fileio, obsinfo
 
 
 def test_normalize_path_not_absolute():
@@ -49,3 +51,122 @@ def test_obsinfo_not_a_file():
 
     # error message is not nice!
     assert str(oe.value) == "Unable to open infile='not-a-file'\n  dmImageOpen() file does not exist. 'not-a-file'"
+
+
+def fits_header(cards):
+    """Convert the cards to a FITS header block."""
+
+    out = "".join(f"{card:80s}" for card in cards + ["END"])
+    nblocks = (len(out) + 2879) // 2880
+    return out.ljust(nblocks * 2880).encode("ascii")
+
+
+def write_hrc_evtfile(fname):
+    """Write a minimal HRC event file, with a TAN projection for sky."""
+
+    def card(key, value):
+        if isinstance(value, str):
+            value = f"'{value:8s}'"
+        elif isinstance(value, bool):
+            value = "T" if value else "F"
+
+        return f"{key:8s}= {value:>20}"
+
+    data = np.zeros(3, dtype=[("time", ">f8"), ("chip_id", ">i4"),
+                              ("x", ">f4"), ("y", ">f4")])
+    data["time"] = [1.0e8, 1.0e8 + 10, 1.0e8 + 20]
+    data["x"] = [16384.5, 16000, 17000]
+    data["y"] = [16384.5, 16100, 16900]
+
+    primary = [card("SIMPLE", True), card("BITPIX", 8), card("NAXIS", 0),
+               card("EXTEND", True)]
+
+    table = [card("XTENSION", "BINTABLE"), card("BITPIX", 8),
+             card("NAXIS", 2), card("NAXIS1", data.itemsize),
+             card("NAXIS2", data.size), card("PCOUNT", 0),
+             card("GCOUNT", 1), card("TFIELDS", 4),
+             card("EXTNAME", "EVENTS"),
+             card("TTYPE1", "time"), card("TFORM1", "1D"),
+             card("TTYPE2", "chip_id"), card("TFORM2", "1J"),
+             card("TTYPE3", "x"), card("TFORM3", "1E"),
+             card("TCTYP3", "RA---TAN"), card("TCRPX3", 16384.5),
+             card("TCRVL3", 150.1), card("TCDLT3", -0.0001318),
+             card("TTYPE4", "y"), card("TFORM4", "1E"),
+             card("TCTYP4", "DEC--TAN"), card("TCRPX4", 16384.5),
+             card("TCRVL4", 2.3), card("TCDLT4", 0.0001318),
+             card("MTYPE1", "sky"), card("MFORM1", "x,y"),
+             card("INSTRUME", "HRC"), card("DETNAM", "HRC-I"),
+             card("GRATING", "NONE"), card("OBS_ID", "1234"),
+             card("TSTART", 1.0e8), card("TSTOP", 1.0e8 + 30)]
+
+    raw = data.tobytes()
+    raw += b"\0" * (-len(raw) % 2880)
+    with open(fname, "wb") as fh:
+        fh.write(fits_header(primary))
+        fh.write(fits_header(table))
+        fh.write(raw)
+
+
+@pytest.fixture
+def count_opens(monkeypatch):
+    """Count the number of times files are opened by fileio."""
+
+    opens = []
+
+    def wrap(module, name):
+        orig = getattr(module, name)
+
+        def opener(*args, **kwargs):
+            opens.append(name)
+            return orig(*args, **kwargs)
+
+        monkeypatch.setattr(module, name, opener)
+
+    wrap(fileio.cw, "open_block_from_file")
+    for name in ["dmBlockOpen", "dmDatasetOpen"]:
+        wrap(fileio.cxcdm, name)
+
+    wrap(fileio.pycrates, "read_file")
+
+    fileio.clear_metadata_cache()
+    yield opens
+    fileio.clear_metadata_cache()
+
+
+def test_obsinfo_uses_metadata_cache(tmp_path, count_opens):
+    infile = str(tmp_path / "evt.fits")
+    write_hrc_evtfile(infile)
+
+    obs = obsinfo.ObsInfo(infile)
+    assert obs.instrument == "HRC"
+    assert obs.get_header()["__NROWS"] == 3
+    assert obs.tangentpoint == pytest.approx((150.1, 2.3))
+
+    # The header and the tangent point
+    nopen = len(count_opens)
+    assert nopen == 2
+
+    obsinfo.ObsInfo(infile)
+    assert str(fileio.get_obsid_object(infile)) == "1234"
+    assert fileio.get_keys_from_file(infile)["INSTRUME"] == "HRC"
+    assert fileio.get_tangent_point(infile) == pytest.approx((150.1, 2.3))
+    assert len(count_opens) == nopen
+
+    # The chip values are only read once
+    assert fileio.get_chips(infile) == pytest.approx([0])
+    assert fileio.get_chips(infile) == pytest.approx([0])
+    assert len(count_opens) == nopen + 1
+
+
+def test_metadata_cache_notices_changes(tmp_path, count_opens):
+    infile = str(tmp_path / "evt.fits")
+    write_hrc_evtfile(infile)
+
+    assert fileio.get_keys_from_file(infile)["__NROWS"] == 3
+    assert fileio.get_keys_from_file(f"{infile}[time>1e8]")["__NROWS"] == 2
+    assert len(count_opens) == 2
+
+    st = os.stat(infile)
+    os.utime(infile, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert fileio.get_keys_from_file(infile)["__NROWS"] == 3
+    assert len(count_opens) == 3
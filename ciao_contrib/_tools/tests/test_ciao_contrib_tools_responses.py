@@ -0,0 +1,103 @@
+"""Check ciao_contrib._tools.responses"""
+
+import numpy as np
+
+import pytest
+
+from ciao_contrib._tools import responses
+
+
+def make_rmf(rng, nrows=20, nchan=15, offset=1):
+    """A random, compressed, RMF with up to 3 groups per row."""
+
+    dense = np.zeros((nrows, nchan))
+    for row in range(nrows):
+        for _ in range(rng.integers(0, 4)):
+            lo = rng.integers(0, nchan)
+            hi = min(nchan, lo + rng.integers(1, 5))
+            dense[row, lo:hi] = rng.uniform(0.1, 1, hi - lo)
+
+    rows, chans = np.nonzero(dense)
+    elo = np.arange(nrows) * 0.1 + 0.3
+    rmf = responses.SparseRMF(elo, elo + 0.1, nchan, offset, rows, chans,
+                              dense[rows, chans])
+    return rmf, dense
+
+
+def test_flatten_rows_varlen():
+    vals = np.empty(3, dtype=object)
+    vals[0] = np.asarray([1, 2, 3])
+    vals[1] = np.asarray([4])
+    vals[2] = np.asarray([5, 6])
+    got = responses.flatten_rows(vals, [2, 0, 2])
+    assert got == pytest.approx([1, 2, 5, 6])
+
+
+def test_flatten_rows_fixed():
+    vals = np.arange(12).reshape(3, 4)
+    got = responses.flatten_rows(vals, [1, 3, 0])
+    assert got == pytest.approx([0, 4, 5, 6])
+
+
+def test_flatten_rows_scalar():
+    got = responses.flatten_rows(np.asarray([3, 4, 5]), [1, 0, 1])
+    assert got == pytest.approx([3, 5])
+
+
+@pytest.mark.parametrize("offset", [0, 1])
+def test_compress_expand_roundtrip(offset):
+    rng = np.random.default_rng(42)
+    rmf, dense = make_rmf(rng, offset=offset)
+
+    n_grp, f_chan, n_chan, bounds = responses.compress_groups(
+        rmf.rows, rmf.chans, rmf.nrows, offset)
+    assert n_grp.sum() == len(f_chan)
+    assert n_chan.sum() == len(rmf.values)
+    assert bounds[-1] == len(rmf.values)
+
+    rows, chans, vals = responses.expand_groups(n_grp, f_chan, n_chan,
+                                                rmf.values, offset)
+    out = np.zeros_like(dense)
+    out[rows, chans] = vals
+    assert out == pytest.approx(dense)
+
+
+def test_compress_groups_splits_runs():
+    rows = np.asarray([0, 0, 0, 2, 2])
+    chans = np.asarray([1, 2, 4, 0, 1])
+    n_grp, f_chan, n_chan, bounds = responses.compress_groups(rows, chans,
+                                                              3, 1)
+    assert list(n_grp) == [2, 0, 1]
+    assert list(f_chan) == [2, 5, 1]
+    assert list(n_chan) == [2, 1, 2]
+    assert list(bounds) == [0, 3, 3, 5]
+
+
+def test_arf_weights():
+    specresp = np.asarray([[1.0, 0.0, 2.0], [3.0, 0.0, 0.0]])
+    weights = responses.arf_weights(specresp, [1.0, 3.0])
+    assert weights[:, 0] == pytest.approx([0.1, 0.9])
+    assert weights[:, 1] == pytest.approx([0.25, 0.75])
+    assert weights[:, 2] == pytest.approx([1, 0])
+
+
+def test_combine_sparse_matches_dense():
+    rng = np.random.default_rng(7)
+    rmfs = []
+    denses = []
+    for _ in range(5):
+        rmf, dense = make_rmf(rng)
+        rmfs.append(rmf)
+        denses.append(dense)
+
+    weights = rng.uniform(0, 1, (5, rmfs[0].nrows))
+    expected = sum(w[:, None] * d for w, d in zip(weights, denses))
+
+    # Add them in two groups, to check the running total is handled.
+    total = responses.combine_sparse(rmfs[:3], weights[:3])
+    total = responses.combine_sparse([total] + rmfs[3:],
+                                     [None] + list(weights[3:]))
+
+    out = np.zeros_like(expected)
+    out[total.rows, total.chans] = total.values
+    assert out == pytest.approx(expected)
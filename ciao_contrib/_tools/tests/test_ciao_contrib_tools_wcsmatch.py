@@ -0,0 +1,97 @@
+"""Check ciao_contrib._tools.wcsmatch"""
+
+from math import nan
+
+import numpy as np
+
+import pytest
+
+from ciao_contrib._tools import wcsmatch
+
+
+LOG = """
+Source Residuals
+----------------
+ Match Ref# Dup#    Ref RA      Ref Dec.    Prior Resid           Transfm Resid         Resid  Incl
+ Index              (deg.)      (deg.)      RSS (x,y)             RSS (x,y)             Ratio
+                                            (arcsec)              (arcsec)
+   0    0     0    151.19409    41.24728    2.82 ( 1.78,-2.19)    0.42 ( 0.40, 0.15)    4.50    Y
+   1    2     2    151.14583    41.21164    1.07 ( 0.67, 0.83)    3.25 (-0.71, 3.17)  149.77    N
+   2    1     2    151.14241    41.21432    2.83 ( 1.14,-2.59)    0.35 (-0.24,-0.26)   12.13    Y
+
+Source Residuals, before/after transform (arcsec), and percentage improvement:
+
+   Average Residuals:         2.729282   0.323143   88.16%
+   Maximum Residuals:         2.834052   0.424523   85.02%
+   RMS Residuals:             1.932289   0.238326   87.67%
+
+Source Residual Ratios, before/after transform, and percentage improvement:
+
+   Average Residual Ratios:   48.269081   5.973321   87.62%
+   Maximum Residual Ratios:   98.152332   nan   nan%
+   RMS Ratios:                42.441137   5.308480   87.49%
+"""
+
+
+class Column:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+
+class Table:
+    """Mimic the parts of a TABLECrate used by the parser."""
+
+    def __init__(self, **cols):
+        self.cols = cols
+
+    def get_column(self, name):
+        return Column(self.cols[name])
+
+    def column_exists(self, name):
+        return name in self.cols
+
+    def get_nrows(self):
+        return len(self.cols["ra"])
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    files = {"src.fits": Table(ra=[1.0, 2.0, 3.0], dec=[4.0, 5.0, 6.0]),
+             "ref.fits": Table(ra=[10.0, 20.0, 30.0], dec=[40.0, 50.0, 60.0],
+                               ra_err=[0.1, 0.2, 0.3],
+                               dec_err=[0.4, 0.5, 0.6])}
+    monkeypatch.setattr(wcsmatch, "read_file", lambda fname: files[fname])
+    return files
+
+
+def test_parse_line():
+    line = "   3   10    10    151.12798    41.23552    2.54 ( 1.22,-2.23)    0.19 (-0.16, 0.11)    1.29    Y"
+    vals = wcsmatch.ParseWcsMatchVerbosity.parse_line(line)
+    assert vals["ref_num"] == "10"
+    assert vals["prior_resid_y"] == "-2.23"
+    assert vals["xform_resid_x"] == "-0.16"
+    assert vals["include"] == "Y"
+
+
+def test_parse_line_not_a_match():
+    assert wcsmatch.ParseWcsMatchVerbosity.parse_line("   RMS Ratios:  1 2 3%") is None
+
+
+def test_parse_wcs_match_log(tables):
+    tab = wcsmatch.parse_wcs_match_log("src.fits", "ref.fits", LOG)
+
+    # The third line repeats source 2, so it is added at the end
+    assert tab.src_idx == [0, 1, 2, 2]
+    assert tab.ref_idx == [0, -999, 2, 1]
+    assert tab.ra == pytest.approx([1, 2, 3, 3])
+    assert tab.ra_ref[0] == pytest.approx(10)
+    assert tab.dec_ref_err[2] == pytest.approx(0.6)
+    assert np.isnan(tab.ra_ref[1])
+    assert tab.xform_resid_rss == pytest.approx([0.42, nan, 3.25, 0.35],
+                                                nan_ok=True)
+    assert tab.include == [True, False, False, True]
+
+    assert tab.keys["avg_resid_before"] == pytest.approx(2.729282)
+    assert tab.keys["avg_resid_perc"] == pytest.approx(0.8816)
+    assert tab.keys["max_resid_ratio_after"] == "NaN"
+    assert tab.keys["max_resid_ratio_perc"] == "NaN"
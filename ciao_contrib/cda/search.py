@@ -49,8 +49,15 @@ Example
 >>> print(obsinfo['obsid'])
 >>> write_columns('search.dat', obsinfo, kernel='simple')
 
+Many positions can be searched with search_chandra_archive_batch,
+which groups nearby positions into a single query:
+
+>>> srs = search_chandra_archive_batch(ras, decs, size=0)
+
 """
 
+import concurrent.futures
+
 import numpy as np
 
 from xml.etree import ElementTree
@@ -71,6 +78,7 @@ v5 = logger.verbose5
 
 __all__ = (
     "search_chandra_archive",
+    "search_chandra_archive_batch",
     "get_chandra_obs",
 )
 
@@ -216,8 +224,8 @@ def read_chandra_siap_table(fname):
     Parameters
     ----------
     fname : file-like object
-        The stream - which is passed to ElementTree.parse - is assumed
-        to contain a VOTABLE returned from a SIAP query.
+        The stream - which is passed to ElementTree.iterparse - is
+        assumed to contain a VOTABLE returned from a SIAP query.
 
     Returns
     -------
@@ -232,27 +240,61 @@ def read_chandra_siap_table(fname):
     such as those from the Hubble footprint service.
 
     Metadata from the table is currently not returned.
+
+    The table is parsed incrementally: each row is converted as
+    soon as it has been read and then removed from the document
+    tree, so the memory use does not depend on the size of the
+    XML representation of the table.
     """
 
+    # The cell values, keyed by the TABLE element they belong to.
+    tables = {}
+    stack = []
     try:
-        vot = ElementTree.parse(fname)
+        for (event, elem) in ElementTree.iterparse(fname,
+                                                   events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                if elem.tag == _mkl('TABLE'):
+                    tables[elem] = {'cols': [], 'rows': []}
+
+                continue
+
+            stack.pop()
+            if elem.tag == _mkl('FIELD'):
+                if len(stack) > 0 and stack[-1] in tables:
+                    tables[stack[-1]]['cols'].append(_get_col_info(elem))
+
+            elif elem.tag == _mkl('TR'):
+                # stack is [..., TABLE, DATA, TABLEDATA]
+                if len(stack) < 3 or stack[-3] not in tables:
+                    continue
+
+                tinfo = tables[stack[-3]]
+                cols = tinfo['cols']
+                rowctr = len(tinfo['rows']) + 1
+                tds = _get_children(elem, 'TD')
+                if len(tds) != len(cols):
+                    raise ValueError("Expected {} columns in row #{} but found {}".format(len(cols), rowctr, len(tds)))
+
+                tinfo['rows'].append([_valconv(col.text, colinfo['format'])
+                                      for (col, colinfo) in zip(tds, cols)])
+                stack[-1].remove(elem)
+
     except ElementTree.ParseError as exc:
         raise OSError("Input is not an XML file.\n{}".format(exc))
 
-    root = vot.getroot()
+    root = elem
     if root.tag != _mkl('VOTABLE'):
         raise IOError("Expected VOTABLE but found {} as the root element".format(root.tag))
 
-    res = _get_child(vot, 'RESOURCE', attr=('type', 'results'))
+    res = _get_child(root, 'RESOURCE', attr=('type', 'results'))
 
     # Check download status
     st = _get_child(res, 'INFO', attr=('name', 'QUERY_STATUS'))
     if st.get('value') != 'OK':
         raise ValueError("Query failed: {}".format(st.text))
 
-    # Coordnate mapping
-    coosys = res.findall('COOSYS')
-
     # Get column info
     tbl = _get_child(res, 'TABLE', attr=('name', 'SIAP_KEYWORDS'))
 
@@ -263,29 +305,14 @@ def read_chandra_siap_table(fname):
         return None
     else:
         nrows = int(nrows)
-    cols = [_get_col_info(f, csys=coosys) for f in _get_children(tbl, 'FIELD')]
-    ncols = len(cols)
 
-    # Extract the data into Python lists and then convert
-    # to NumPy types. Not the most memory efficient but it is assumed
-    # that the number of rows is small.
-    #
-    coldata = {c['name']: [] for c in cols}
-    rowctr = 0
-    for row in tbl.findall(_combl('DATA', 'TABLEDATA', 'TR')):
-        rowctr += 1
-        tds = _get_children(row, 'TD')
-        if len(tds) != ncols:
-            raise ValueError("Expected {} columns in row #{} but found {}".format(ncols, rowctr, len(tds)))
-
-        for (col, colinfo) in zip(tds, cols):
-            coldata[colinfo['name']].append(_valconv(col.text,
-                                                     colinfo['format']))
+    cols = tables[tbl]['cols']
+    rows = tables[tbl]['rows']
 
     out = OrderedDict()
-    for colinfo in cols:
+    for (i, colinfo) in enumerate(cols):
         cname = colinfo['name']
-        out[cname] = np.asarray(coldata[cname])
+        out[cname] = np.asarray([row[i] for row in rows])
         nr = out[cname].shape[0]
         if nr != nrows:
             raise ValueError("Expected {} rows in column {} but found {}".format(nrows, cname, nr))
@@ -452,26 +479,38 @@ def search_chandra_archive(ra, dec, size=0.1,
 
     url = construct_query(ra, dec, size,
                           instrument=instrument)
+    gfilters = _grating_filters(grating)
+    out = _make_query(url)
+    return _filter_grating(out, gfilters)
 
-    if grating is not None:
-        # we don't use grating in the query but want to validate
-        # the value before making a query
-        gfilters = [_fconv("grating", i) for i in set(grating)]
-    else:
-        gfilters = None
 
-    out = _make_query(url)
+def _grating_filters(grating):
+    """Validate the grating argument of search_chandra_archive.
 
-    # It appears you can not filter on grating using the SIA
-    # interface, so do it manually (if there is any filtering
-    # needed).
-    #
-    nsearch = len(out)
-    if out is None or nsearch == 0:
+    We don't use grating in the query but want to validate
+    the value before making a query.
+    """
+
+    if grating is None:
+        return None
+
+    return [_fconv("grating", i) for i in set(grating)]
+
+
+def _filter_grating(out, gfilters):
+    """Apply the grating filter to the search results.
+
+    It appears you can not filter on grating using the SIA
+    interface, so do it manually (if there is any filtering
+    needed).
+    """
+
+    if out is None or len(out) == 0:
         v3("Search returned no matches")
         return None
 
-    if grating is None:
+    nsearch = len(out)
+    if gfilters is None:
         v3(f"Search returned {nsearch} rows")
         return out
 
@@ -490,6 +529,192 @@ def search_chandra_archive(ra, dec, size=0.1,
     return None
 
 
+def _group_positions(ras, decs, maxsize):
+    """Group positions into cones of radius (approximately) maxsize.
+
+    Parameters
+    ----------
+    ras, decs : ndarray
+        The positions, in decimal degrees.
+    maxsize : float
+        The approximate radius of each group, in degrees. If 0
+        then each position is its own group.
+
+    Returns
+    -------
+    groups : list of (ra, dec, radius, idx)
+        The center and radius of each cone, in decimal degrees,
+        along with the indexes of the positions it contains.
+
+    """
+
+    npos = ras.size
+    if maxsize <= 0:
+        return [(ras[i], decs[i], 0.0, np.asarray([i]))
+                for i in range(npos)]
+
+    # Bin the positions on to a cartesian grid where the separation
+    # of any two points within a cell is at most maxsize.
+    #
+    xyz = cutils.spherical_to_cartesian(cutils.degtorad(ras),
+                                        cutils.degtorad(decs))
+    cellsize = cutils.degtorad(maxsize) / np.sqrt(3)
+    cells = np.floor(xyz / cellsize).astype(np.int64)
+    (_, labels) = np.unique(cells, axis=1, return_inverse=True)
+    labels = labels.reshape(-1)
+
+    out = []
+    for label in np.unique(labels):
+        idx = np.where(labels == label)[0]
+        if idx.size == 1:
+            i = idx[0]
+            out.append((ras[i], decs[i], 0.0, idx))
+            continue
+
+        (ra0, dec0) = cutils.calculate_nominal_position(ras[idx],
+                                                        decs[idx])
+        radius = max(cutils.point_separation(ra0, dec0, ras[i], decs[i])
+                     for i in idx)
+        out.append((ra0, dec0, radius, idx))
+
+    return out
+
+
+# The maximum distance, in degrees, from the aim point of an
+# observation to the edge of its field of view. This is set by HRC-S,
+# which extends about 0.8 degrees from the aim point, with some room
+# for the offsets used with the ACIS-S array.
+#
+MAX_FOV_RADIUS = 1.0
+
+
+def _run_queries(urls, nthreads):
+    """Run the queries concurrently, returning the results in order."""
+
+    if len(urls) == 0:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+        return list(executor.map(_make_query, urls))
+
+
+def search_chandra_archive_batch(ras, decs, size=0.1,
+                                 instrument=None,
+                                 grating=None,
+                                 maxsize=0.5,
+                                 fovradius=MAX_FOV_RADIUS,
+                                 nthreads=4):
+    """Find Chandra observations which cover many locations.
+
+    Positions that lie close to each other are grouped into a
+    cone which covers them all, so that the footprint service is
+    queried once per group rather than once per position, and the
+    queries are run concurrently. Only those positions that lie
+    close enough to an observation returned for the group are then
+    queried individually, so the results are the same as calling
+    search_chandra_archive for each position.
+
+    Parameters
+    ----------
+    ras, decs : array of double
+        The locations to query, in decimal degrees.
+    size : double
+        The search radius around each point, in degrees. See
+        search_chandra_archive.
+    instrument : None or array of str, optional
+        If not None, then restrict the search to observations which
+        contain the given instrument. See search_chandra_archive.
+    grating : None or array of str, optional
+        If not None, then restrict the search to observations which
+        contain the given grating. See search_chandra_archive.
+    maxsize : double, optional
+        The maximum separation, in degrees, of positions that are
+        combined into a single query. A value of 0 means that each
+        position is queried separately.
+    fovradius : double, optional
+        The maximum distance, in degrees, from the aim point of an
+        observation to the edge of its field of view. Positions
+        further than size + fovradius from the aim points of all
+        the observations returned for their group are not queried
+        individually. It should not be set smaller than the default
+        value (MAX_FOV_RADIUS) unless the instrument argument
+        excludes the larger detectors.
+    nthreads : int, optional
+        The number of queries to run at the same time.
+
+    Returns
+    -------
+    ans : list of None or NumPy structured array
+        The search results for each position, in the same form as
+        search_chandra_archive.
+
+    Notes
+    -----
+    The footprint of an observation is not included in the search
+    results, only the aim point (the RA and Dec columns), which is
+    why the positions that may match an observation have to be
+    queried separately. The saving comes from the positions that
+    lie far from any observation, which are not queried at all.
+
+    Examples
+    --------
+
+    >>> ans = search_chandra_archive_batch(ras, decs, size=0)
+    >>> for (ra, dec, sr) in zip(ras, decs, ans):
+    ...     if sr is not None:
+    ...         print(ra, dec, len(sr))
+
+    """
+
+    ras = np.atleast_1d(np.asarray(ras, dtype=float))
+    decs = np.atleast_1d(np.asarray(decs, dtype=float))
+    if ras.shape != decs.shape or ras.ndim != 1:
+        raise ValueError("ras and decs must be 1D arrays of the same size")
+
+    npos = ras.size
+    gfilters = _grating_filters(grating)
+    groups = _group_positions(ras, decs, maxsize)
+    v3(f"Grouped {npos} positions into {len(groups)} queries")
+
+    urls = [construct_query(ra, dec, radius + size,
+                            instrument=instrument)
+            for (ra, dec, radius, _) in groups]
+    results = _run_queries(urls, nthreads)
+
+    out = [None] * npos
+    candidates = []
+    for ((_, _, radius, idx), res) in zip(groups, results):
+        res = _filter_grating(res, gfilters)
+        if res is None:
+            continue
+
+        # A single position has been queried exactly.
+        if radius == 0:
+            for i in idx:
+                out[i] = res
+
+            continue
+
+        # Use the aim-point distance to find the positions that may
+        # be covered by one of the observations.
+        #
+        (i1, _, _) = cutils.match_positions(ras[idx], decs[idx],
+                                            res['RA'], res['Dec'],
+                                            size + fovradius)
+        candidates.extend(idx[np.unique(i1)])
+
+    v3(f"Re-querying {len(candidates)} positions")
+    urls = [construct_query(ras[i], decs[i], size,
+                            instrument=instrument)
+            for i in candidates]
+    for (i, res) in zip(candidates, _run_queries(urls, nthreads)):
+        out[i] = _filter_grating(res, gfilters)
+
+    nmatch = sum(o is not None for o in out)
+    v3(f"Found matches for {nmatch} of {npos} positions")
+    return out
+
+
 # Why not return a sturctured array?
 
 def get_chandra_obs(sr, ra=None, dec=None, fmt=None):
@@ -18,6 +18,7 @@
 
 ##########################################################################################
 import glob
+import multiprocessing
 import os
 import shutil
 import time
@@ -32,11 +33,13 @@ from pycrates import (
 )
 from crates_contrib.utils import make_table_crate
 from ciao_contrib import runtool as rt
+from ciao_contrib.parallel_wrapper import parallel_pool_futures
 from .iocaldb import OSIP, Sky2Chandra, Cel2Chandra
-from ciao_contrib.psf_contrib import PSF
-from .widthofexclusion import counts_circle_band, pnt_src_masking_region
+from ciao_contrib.psf_contrib import get_psf
+from .widthofexclusion import EventIndex, counts_circle_band, pnt_src_masking_region
 from .constants import X_R, Period, mm_per_pix, arcsec_per_pix, hc, Alpha
 import ciao_contrib.logger_wrapper as lw
+from coords.utils import match_cartesian, match_positions
 
 TOOLNAME = 'crisscross'
 __revision__  = '28 May 2026'
@@ -411,37 +414,66 @@ def match_subset_to_main(RA_main, DEC_main, RA_sub, DEC_sub, match_offset=0.5):
 
     Notes
     -----
-    This implementation simply calculates all pairwise distances. A KD-Tree or
-    similar structure would be more efficient, but we expect that this will
-    be used for no more than a few thousand sources and thus the brute-force
-    approach is sufficient.
+    The candidate matches are found with `coords.utils.match_positions`, which only
+    compares each subset source to the main_list sources in neighbouring cells of a
+    grid, rather than calculating all pairwise distances, so this can be used for
+    large source lists.
 
     References
     ----------
     [1] https://en.wikipedia.org/wiki/Haversine_formula
     """
-    dlon = RA_main[None, :] - RA_sub[:, None]
-    dlat = DEC_main[None, :] - DEC_sub[:, None]
-    hav_theta = (1 / 2) * (
-        np.sin(np.deg2rad(dlat) / 2) ** 2
-        + np.cos(np.deg2rad(DEC_sub[:, None]))
-        * np.cos(np.deg2rad(DEC_main[None, :]))
-        * np.sin(np.deg2rad(dlon) / 2) ** 2
+    def haversine(RA_1, DEC_1, RA_2, DEC_2):
+        dlon = RA_2 - RA_1
+        dlat = DEC_2 - DEC_1
+        hav_theta = (1 / 2) * (
+            np.sin(np.deg2rad(dlat) / 2) ** 2
+            + np.cos(np.deg2rad(DEC_1))
+            * np.cos(np.deg2rad(DEC_2))
+            * np.sin(np.deg2rad(dlon) / 2) ** 2
+        )
+        return 2 * np.arcsin(np.sqrt(hav_theta))
+
+    RA_main = np.asarray(RA_main)
+    DEC_main = np.asarray(DEC_main)
+    RA_sub = np.asarray(RA_sub)
+    DEC_sub = np.asarray(DEC_sub)
+    n_sub = len(RA_sub)
+    max_theta = np.deg2rad(match_offset / 3600)
+
+    # The search radius for the candidates has to allow for the factor of
+    # 1/2 applied to hav_theta above.
+    search = 2 * np.arcsin(min(1, np.sqrt(2) * np.sin(max_theta / 2)))
+    i_sub, i_main, _ = match_positions(
+        RA_sub, DEC_sub, RA_main, DEC_main, np.rad2deg(search) * (1 + 1e-8)
     )
-    theta = 2 * np.arcsin(np.sqrt(hav_theta))
-    min_theta = np.min(theta, axis=1)
-    if np.any(min_theta > np.deg2rad(match_offset / 3600)):
-        ind = min_theta > np.deg2rad(match_offset / 3600)
+    theta = haversine(RA_sub[i_sub], DEC_sub[i_sub], RA_main[i_main], DEC_main[i_main])
+
+    # Sort by subset source and then by distance, so that the first match of
+    # each source is the closest (ties go to the lowest main_list index).
+    idx = np.lexsort((i_main, theta, i_sub))
+    i_sub = i_sub[idx]
+    i_main = i_main[idx]
+    theta = theta[idx]
+
+    n_match = np.bincount(i_sub[theta <= max_theta], minlength=n_sub)
+    if np.any(n_match == 0):
+        ind = n_match == 0
+        min_theta = np.min(
+            haversine(RA_sub[ind, None], DEC_sub[ind, None], RA_main[None, :], DEC_main[None, :]),
+            axis=1,
+        )
         raise ValueError(
-            f"No match in main list found for the sources with RA={RA_sub[ind]} and DEC={DEC_sub[ind]} with min distance {min_theta[ind]} arcsec. Please make sure RA and DEC value of source to clean matches a source in main_list."
+            f"No match in main list found for the sources with RA={RA_sub[ind]} and DEC={DEC_sub[ind]} with min distance {min_theta} arcsec. Please make sure RA and DEC value of source to clean matches a source in main_list."
         )
-    ind = theta < np.deg2rad(match_offset / 3600)
-    if np.any(ind.sum(axis=1) > 1):
-        ind_multi = ind.sum(axis=1) > 1
+    n_close = np.bincount(i_sub[theta < max_theta], minlength=n_sub)
+    if np.any(n_close > 1):
+        ind_multi = n_close > 1
         raise ValueError(
             f"Multiple matches in main list found for the sources with RA={RA_sub[ind_multi]} and DEC={DEC_sub[ind_multi]}. Please make sure there are no duplicate entries in main list or subset_list."
         )
-    return np.argmin(theta, axis=1)
+    first = np.searchsorted(i_sub, np.arange(n_sub))
+    return i_main[first]
 
 
 def calc_physical_coords(fits_par, RA, DEC):
@@ -469,16 +501,12 @@ def calc_physical_coords(fits_par, RA, DEC):
     src["n"] = len(src["x"])
     src["ID"] = np.arange(0, src["n"])
 
-    psf = PSF()
-    psf_size = np.zeros(src["n"])
-    for i in range(0,src["n"]):
-        psf_size[i] = psf.psfSize(
-            energy_keV=2.0,
-            theta_arcmin=src["theta"][i],
-            phi_deg=src["phi"][i],
-            ecf=0.9,
-        )
-    src["psf_size"] = psf_size
+    src["psf_size"] = get_psf().psfSize(
+        energy_keV=2.0,
+        theta_arcmin=np.asarray(src["theta"]),
+        phi_deg=np.asarray(src["phi"]),
+        ecf=0.9,
+    )
 
     return src
 
@@ -526,55 +554,45 @@ def find_closest_source(src, wave_file, max_offset=3.0):
         src["n"], dtype="float"
     )  # the final 0th_order counts array (NET_COUNTS) from the wavedetect table MATCHED to the user-provided source list.
 
-    # this loop determines the distance from the user-provided source to ALL the sources in the wavedetect table and
-    # only saves a non-bogus value if there is a source with separation < max_offset.
-    for i in range(0, src["n"]):
-        dist_arr = []
-        dist_arr = np.sqrt(
-            (src["x"][i] - src_wave_x_arr) ** 2 + (src["y"][i] - src_wave_y_arr) ** 2
-        )  # This calculates the physical distance from source [i] in the user-provided table to ALL sources in the
-        # wavedetect table. This is just the hypotenuse in the xy plane. Note, calculating the ENTIRE array here for
-        #  each [i] source and NOT each [i] and each [j] individually.
-
-        closest_dist = []
-        closest_dist = (
-            np.min(dist_arr) * arcsec_per_pix
-        )  # converted from sky coords to arsec
-
-        # if distance is > max offset then assign values of 99999 (bogus) and filter out in next loop. Otherwise,
-        # assign matched values.
-        if closest_dist <= src['psf_size'][i]:
-            closest_dist_arr[i] = closest_dist
-            closest_match_arr[i] = np.where(dist_arr == np.min(dist_arr))[0][0]  #
-        else:
-            closest_dist_arr[i] = 99999
-            closest_match_arr[i] = 99999
-
-    # this loop will remove 'double counting' where a single user-provided source might match to multiple wavedetect
-    #  sources. This will only match to the closest one and remove that from the pool of potential matches for other sources.
-    for i in range(0, src["n"]):
-        common_matches = np.where(
-            closest_match_arr == closest_match_arr[i]
-        )[
-            0
-        ]  # this will give an array of index values which all have the same closest matched source.
-        common_matches_dist = closest_dist_arr[
-            common_matches
-        ]  # this will provide an array of all of the distances for the closest matched sources. The idea is that
-        # only the closest distance can be assigned to a single source (no double counting).
-
-        if (
-            (closest_dist_arr[i] <= src['psf_size'][i])
-            and (closest_dist_arr[i] == np.min(common_matches_dist))
-        ):  # if the current source's closest distance is the closest of all the common matches then it is 'correct'
-            # and assigned the wavedetect number of counts. Otherwise, counts are set to 0 (not detected)
-            final_match_arr[i] = closest_match_arr[i]
-            final_dist_arr[i] = closest_dist_arr[i]
-            matched_0th_counts_arr[i] = counts_wave[closest_match_arr[i]]
-        else:
-            final_match_arr[i] = "no match"
-            final_dist_arr[i] = "no match"
-            matched_0th_counts_arr[i] = 0
+    # Find the closest wavdetect source to each user-provided source, only
+    # considering wavdetect sources within the largest PSF size, and only
+    # keep a match if the distance is within the PSF size of the source.
+    # The matches are sorted by source and then distance, so the first
+    # match of each source is the closest one (ties go to the lowest
+    # wavdetect index).
+    max_radius = np.nanmax(np.append(src["psf_size"], 0)) / arcsec_per_pix
+    i_src, i_wave, dist = match_cartesian(
+        np.asarray([src["x"], src["y"]]),
+        np.asarray([src_wave_x_arr, src_wave_y_arr]),
+        max_radius * (1 + 1e-8),
+    )
+    has_match = np.zeros(src["n"], dtype=bool)
+    has_match[i_src] = True
+    first = np.searchsorted(i_src, np.arange(src["n"]))[has_match]
+
+    closest_dist_arr[:] = 99999
+    closest_match_arr[:] = 99999
+    closest_dist = dist[first] * arcsec_per_pix  # converted from sky coords to arsec
+    ok = closest_dist <= src["psf_size"][has_match]
+    closest_dist_arr[np.where(has_match)[0][ok]] = closest_dist[ok]
+    closest_match_arr[np.where(has_match)[0][ok]] = i_wave[first][ok]
+
+    # Remove 'double counting' where a single wavdetect source is the closest match to multiple user-provided
+    # sources. Only the closest of these sources is assigned the wavdetect counts (if several sources are at
+    # exactly the same distance they are all assigned the counts).
+    matched = closest_match_arr != 99999
+    group_min = np.full(len(counts_wave), np.inf)
+    np.minimum.at(group_min, closest_match_arr[matched], closest_dist_arr[matched])
+    keep = np.zeros(src["n"], dtype=bool)
+    keep[matched] = closest_dist_arr[matched] == group_min[closest_match_arr[matched]]
+
+    final_match_arr[:] = "no match"
+    final_dist_arr[:] = "no match"
+    matched_0th_counts_arr[:] = 0
+    for i in np.where(keep)[0]:
+        final_match_arr[i] = closest_match_arr[i]
+        final_dist_arr[i] = closest_dist_arr[i]
+    matched_0th_counts_arr[keep] = counts_wave[closest_match_arr[keep]]
 
     return (final_match_arr, final_dist_arr, matched_0th_counts_arr)
 
@@ -777,7 +795,7 @@ def counts_scaled_by_arf(pos, order, band, evtcrates, skyconverter, arf, psffrac
         The order of the spectral arm for which to calculate the counts.
     band : list
         The first and last wavelength in Angstrom where mean response is taken in the ARF tables.
-    evtcrates : `pycrates.tablecrate.TABLECrate`
+    evtcrates : `pycrates.tablecrate.TABLECrate` or `ciao_contrib.criss_cross.widthofexclusion.EventIndex`
         A crates object holding an event file.
     skyconverter : `ciao_contrib.criss_cross.iocaldb.Sky2Chandra`
         Object that can convert Chandra coordiantes for the event file used.
@@ -868,7 +886,7 @@ def spec_confuse_wave(
         Object that can retrieve OSIP information for the event file used.
     skyconverter : `ciao_contrib.criss_cross.iocaldb.Sky2Chandra`
         Object that can convert Chandra coordiantes for the event file used.
-    evtcrates : `pycrates.tablecrate.TABLECrate`
+    evtcrates : `pycrates.tablecrate.TABLECrate` or `ciao_contrib.criss_cross.widthofexclusion.EventIndex`
         A crates object holding an event file.
     spec_confuse_limit : float
         Ratio of counts in the confusing/confused grating spectrum that triggers a
@@ -1173,7 +1191,7 @@ def pntsrc_confuse_wave(
         Object that can retrieve OSIP information for the event file used.
     skyconverter : `ciao_contrib.criss_cross.iocaldb.Sky2Chandra`
         Object that can convert Chandra coordiantes for the event file used.
-    evtcrates : `pycrates.tablecrate.TABLECrate`
+    evtcrates : `pycrates.tablecrate.TABLECrate` or `ciao_contrib.criss_cross.widthofexclusion.EventIndex`
         A crates object holding an event file.
     logfile_par : str
         Name of the logfile for capturing pnt_src_masking_region() log output.
@@ -1889,6 +1907,69 @@ class TimeLogger:
 
 
 
+# The work units for run_confusion_units. They are stored here, rather
+# than sent to the worker processes, so that the event index, OSIP and
+# coordinate-conversion objects are inherited by the forked processes
+# instead of being pickled.
+_confusion_units = {}
+
+
+def _run_confusion_unit(name):
+    """Run the calls in a work unit, returning the records and run time."""
+    start = time.time()
+    records = [func(**kwargs) for func, kwargs in _confusion_units[name]]
+    return records, time.time() - start
+
+
+def run_confusion_units(units, parallel=True, nproc=None):
+    """Run the confusion calculations, optionally in parallel.
+
+    Parameters
+    ----------
+    units : dict
+        The keys are the names of the work units and the values are a
+        list of (function, keyword arguments) pairs. Each unit must be
+        independent of the others, but the calls within a unit are run
+        in order.
+    parallel : bool
+        Should the units be run in parallel, using separate processes?
+    nproc : int or None
+        The number of processes to use when parallel is True. None means
+        use all the available processors, and a negative value is added
+        to this number.
+
+    Returns
+    -------
+    records : numpy.rec.array
+        The combined output of all the calls, in the order given by units.
+    """
+    names = list(units.keys())
+    ncpu = multiprocessing.cpu_count()
+    if nproc is None:
+        nproc = ncpu
+    elif nproc < 1:
+        nproc = max(1, ncpu + nproc)
+    nproc = min(nproc, ncpu, len(names))
+
+    _confusion_units.clear()
+    _confusion_units.update(units)
+    try:
+        if parallel and nproc > 1:
+            v2(f"Running the {len(names)} confusion calculations with {nproc} processes.")
+            results = parallel_pool_futures(_run_confusion_unit, names, ncores=nproc)
+        else:
+            results = [_run_confusion_unit(name) for name in names]
+    finally:
+        _confusion_units.clear()
+
+    records = []
+    for name, (recs, elapsed) in zip(names, results):
+        v2(f"Calculating {name} took {elapsed:.1f} seconds.")
+        records.extend(recs)
+
+    return rfn.stack_arrays(records)
+
+
 ######### MAIN CrissCross RUN FUNCTION ##############
 
 
@@ -1920,6 +2001,8 @@ def run_crisscross(
     highest_order=3,
     min_tg_d=-6.6e-04,
     max_tg_d=6.6e-04,
+    parallel=True,
+    nproc=None,
 ):
     """
     Main function for running criss cross. CrissCross identifies portions of a sources spectrum where events from other
@@ -2023,6 +2106,12 @@ def run_crisscross(
         Lower and upper bounds of the spectral extraction of a dispersed spectrum in cross-dispersion direction in degrees.
         These parameters should be set to the same values used in `tg_extract` and they default
         to the default used in `tg_extract`. Crisscross assumes rectangualr extraction regions.
+    parallel : bool
+        Run the spectral, point source, streak, and arm confusion calculations in parallel,
+        using separate processes (default: True).
+    nproc : int or None
+        The number of processes to use when parallel is True. None means use all the available
+        processors (default: None).
     """
 
     # sanitize clobber
@@ -2207,8 +2296,9 @@ def run_crisscross(
         }
         osip = OSIP(evt2_file[k])
         skyconverter = Sky2Chandra(evt2_file[k])
-        evtcrates = read_file(evt2_file[k])
-        records = []
+        # The confusion calculations make many counts_circle_band calls,
+        # so index the events once rather than scanning them each time.
+        evtcrates = EventIndex.from_crate(read_file(evt2_file[k]))
 
         #########SPECTRAL CONFUSION START ############
         # calculate relevant parameters for when two lines intersect in the Chandra FOV
@@ -2219,37 +2309,15 @@ def run_crisscross(
 
         orders = np.arange(-highest_order, highest_order + 1)
         orders = orders[orders != 0]  # exclude 0 order
-        intersect_info = {
+        spec_intersect_info = {
             "orders": orders,
             "heg_meg_intersects": heg_meg_intersects,
         }
-        intersect_info["mwave"] = {
+        spec_intersect_info["mwave"] = {
             "heg": k_heg * mm_per_pix / X_R["heg"] * Period["heg"],
             "meg": k_meg * mm_per_pix / X_R["meg"] * Period["meg"],
         }
 
-        for arm in ["heg", "meg"]:
-            records.append(
-                spec_confuse_wave(
-                    sources=src,
-                    subset_sources=subset_list,
-                    intersect_info=intersect_info,
-                    arm=arm,
-                    min_spec_counts=min_spec_counts,
-                    min_spec_confuser_counts=min_spec_confuser_counts,
-                    width_mask_pixel=120,
-                    osip_frac=osip_frac,
-                    arf_ratios_dir=arf_ratios_dir,
-                    cutoff=cutoff,
-                    osip=osip,
-                    skyconverter=skyconverter,
-                    evtcrates=evtcrates,
-                    spec_confuse_limit=spec_confuse_limit,
-                )
-            )
-
-        #timelogger("Finished calculating spectral confusion.")
-
         ######### Perpendicular distance
         # Point, arm, and streak confusion all depend on the distance of
         # a source perpendicular to the arm, so we can set up the same
@@ -2270,11 +2338,38 @@ def run_crisscross(
             intersect_info["mwave"][arm] = k_arm * mm_per_pix / X_R[arm] * Period[arm]
             intersect_info["point2arm"][arm] = np.abs(k_src)
 
-        #########POINT SOURCE CONFUSION START ############
-
+        # Each work unit is a list of (function, keyword arguments) calls.
+        # The point-source and streak calculations for both arms write to
+        # the same log file, so each of them is kept in a single unit.
+        units = {}
         for arm in ["heg", "meg"]:
-            records.append(
-                pntsrc_confuse_wave(
+            units[f"spectral confusion ({arm})"] = [
+                (
+                    spec_confuse_wave,
+                    dict(
+                        sources=src,
+                        subset_sources=subset_list,
+                        intersect_info=spec_intersect_info,
+                        arm=arm,
+                        min_spec_counts=min_spec_counts,
+                        min_spec_confuser_counts=min_spec_confuser_counts,
+                        width_mask_pixel=120,
+                        osip_frac=osip_frac,
+                        arf_ratios_dir=arf_ratios_dir,
+                        cutoff=cutoff,
+                        osip=osip,
+                        skyconverter=skyconverter,
+                        evtcrates=evtcrates,
+                        spec_confuse_limit=spec_confuse_limit,
+                    ),
+                )
+            ]
+
+        #########POINT SOURCE CONFUSION START ############
+        units["point source confusion"] = [
+            (
+                pntsrc_confuse_wave,
+                dict(
                     sources=src,
                     subset_sources=subset_list,
                     intersect_info=intersect_info,
@@ -2288,11 +2383,14 @@ def run_crisscross(
                     evtcrates=evtcrates,
                     logfile_par=f"{output_dir}/pnt_src_confuse_{obsid}_log.txt",
                     evt_frac_thresh=0.1,
-                )
+                ),
             )
-        for arm in ["heg", "meg"]:
-            records.append(
-                streak_confuse_wave(
+            for arm in ["heg", "meg"]
+        ]
+        units["streak confusion"] = [
+            (
+                streak_confuse_wave,
+                dict(
                     sources=src,
                     subset_sources=subset_list,
                     intersect_info=intersect_info,
@@ -2308,34 +2406,36 @@ def run_crisscross(
                     evt_frac_thresh=0.1,
                     min_tg_d=min_tg_d,
                     max_tg_d=max_tg_d,
-                )
+                ),
             )
-
-        #timelogger("Finished calculating point source confusion.")
+            for arm in ["heg", "meg"]
+        ]
 
         ##########ARM CONFUSION START ############################
         for arm in ["heg", "meg"]:
-            records.append(
-                arm_confuse_wave(
-                    sources=src,
-                    subset_sources=subset_list,
-                    intersect_info=intersect_info,
-                    arm=arm,
-                    min_arm_counts=min_arm_counts,
-                    max_arm_dist=max_arm_dist,
-                    arf_ratios_dir=arf_ratios_dir,
-                    cutoff=cutoff,
-                    skyconverter=skyconverter,
-                    evtcrates=evtcrates,
-                    arm_confuse_limit=arm_confuse_limit,
-                    nsig_par=arm_nsig,
+            units[f"arm confusion ({arm})"] = [
+                (
+                    arm_confuse_wave,
+                    dict(
+                        sources=src,
+                        subset_sources=subset_list,
+                        intersect_info=intersect_info,
+                        arm=arm,
+                        min_arm_counts=min_arm_counts,
+                        max_arm_dist=max_arm_dist,
+                        arf_ratios_dir=arf_ratios_dir,
+                        cutoff=cutoff,
+                        skyconverter=skyconverter,
+                        evtcrates=evtcrates,
+                        arm_confuse_limit=arm_confuse_limit,
+                        nsig_par=arm_nsig,
+                    ),
                 )
-            )
+            ]
 
-        #timelogger("Finished assigning arm confusion.")
+        records = run_confusion_units(units, parallel=parallel, nproc=nproc)
 
         ##### Table writing and cleanup ############
-        records = rfn.stack_arrays(records)
 
         for i in subset_list:
             # If users run cc with just a single source, allow them to name the confusion file. Otherwise a single root
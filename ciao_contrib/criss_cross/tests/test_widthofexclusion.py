@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+
+from ..widthofexclusion import EventIndex
+
+
+def brute_force_count(x, y, energy, pos, radius, en_low, en_high):
+    """The calculation used by counts_circle_band for a crate."""
+    ind = np.hypot(x - pos[0], y - pos[1]) < radius
+    ind = ind & (energy > en_low) & (energy < en_high)
+    return ind.sum()
+
+
+@pytest.mark.parametrize("cellsize", [8.0, 32.0, 500.0])
+def test_index_matches_brute_force(cellsize):
+    rng = np.random.default_rng(2387)
+    nevt = 20000
+    x = rng.uniform(3000, 5000, nevt)
+    y = rng.uniform(3500, 4500, nevt)
+    energy = rng.uniform(300, 10000, nevt)
+    idx = EventIndex(x, y, energy, cellsize=cellsize)
+
+    nq = 200
+    qx = rng.uniform(2900, 5100, nq)
+    qy = rng.uniform(3400, 4600, nq)
+    radius = rng.uniform(0.5, 80, nq)
+    en_low = rng.uniform(300, 6000, nq)
+    en_high = en_low + rng.uniform(0, 4000, nq)
+
+    expected = [brute_force_count(x, y, energy, (qx[i], qy[i]), radius[i],
+                                  en_low[i], en_high[i])
+                for i in range(nq)]
+
+    got = idx.count_many(qx, qy, radius, en_low, en_high)
+    assert list(got) == expected
+    assert sum(expected) > 0
+
+
+def test_index_band_edges_are_excluded():
+    x = np.array([10.0, 10.0, 10.0, 13.0])
+    y = np.array([10.0, 10.0, 10.0, 10.0])
+    energy = np.array([1000.0, 2000.0, 3000.0, 2000.0])
+    idx = EventIndex(x, y, energy)
+
+    assert idx.count(10, 10, 3, 1000, 3000) == 1
+    assert idx.count(10, 10, 3.01, 999, 3001) == 4
+
+
+def test_index_no_events():
+    idx = EventIndex([], [], [])
+    assert idx.count(10, 10, 3, 1000, 3000) == 0
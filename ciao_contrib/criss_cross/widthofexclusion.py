@@ -21,9 +21,132 @@ import numpy as np
 from sherpa.optmethods.optfcts import lmdif
 from .constants import arcsec_per_pix, wavelength_scale
 
-from ciao_contrib.psf_contrib import PSF
+from ciao_contrib.psf_contrib import get_psf
 
-psf = PSF()
+
+class EventIndex:
+    """Index an event list for repeated circle-in-band count queries.
+
+    The events are binned on to a grid of square cells in sky
+    coordinates and, within each cell, sorted by energy. A query
+    then only has to look at the events in the cells that overlap
+    the circle and, in each cell, only those events within the
+    energy band, rather than at the full event list.
+
+    Parameters
+    ----------
+    x, y : array
+        Sky coordinates of the events, in pixels.
+    energy : array
+        Event energies, in eV.
+    cellsize : float
+        The size of each cell, in pixels.
+    crate : crates object or None
+        The crate the events were read from. It is used to provide
+        the get_key_value method, so that the index can be used
+        where the crate is expected.
+    """
+
+    def __init__(self, x, y, energy, cellsize=32.0, crate=None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        energy = np.asarray(energy)
+        self.crate = crate
+        self.cellsize = cellsize
+        self.nevents = x.size
+
+        if x.size == 0:
+            self.x0 = self.y0 = 0.0
+            self.nx = self.ny = 1
+        else:
+            self.x0 = np.min(x)
+            self.y0 = np.min(y)
+            self.nx = int((np.max(x) - self.x0) // cellsize) + 1
+            self.ny = int((np.max(y) - self.y0) // cellsize) + 1
+
+        cell = self._cell(x, y)
+        order = np.lexsort((energy, cell))
+        self.x = x[order]
+        self.y = y[order]
+        self.energy = energy[order]
+        self.start = np.searchsorted(cell[order],
+                                     np.arange(self.nx * self.ny + 1))
+
+    @classmethod
+    def from_crate(cls, evt, cellsize=32.0):
+        """Create the index from an event file crate."""
+        return cls(evt.sky.x.values, evt.sky.y.values, evt.energy.values,
+                   cellsize=cellsize, crate=evt)
+
+    def get_key_value(self, key):
+        """Return the keyword value from the crate."""
+        return self.crate.get_key_value(key)
+
+    def _cell(self, x, y):
+        ix = ((x - self.x0) // self.cellsize).astype(int)
+        iy = ((y - self.y0) // self.cellsize).astype(int)
+        return iy * self.nx + ix
+
+    def count(self, x, y, radius, en_low, en_high):
+        """The number of events within the circle and energy band.
+
+        Parameters
+        ----------
+        x, y : float
+            The center of the circle, in sky pixels.
+        radius : float
+            The radius of the circle, in sky pixels. Events must be
+            closer than this distance.
+        en_low, en_high : float
+            The energy band, in eV. This is an open interval.
+
+        Returns
+        -------
+        n : int
+            The number of events.
+        """
+        if self.nevents == 0:
+            return 0
+
+        def limits(pos, origin, n):
+            lo = int(np.floor((pos - radius - origin) / self.cellsize))
+            hi = int(np.floor((pos + radius - origin) / self.cellsize))
+            return max(lo, 0), min(hi, n - 1)
+
+        ixlo, ixhi = limits(x, self.x0, self.nx)
+        iylo, iyhi = limits(y, self.y0, self.ny)
+
+        n = 0
+        for iy in range(iylo, iyhi + 1):
+            for ix in range(ixlo, ixhi + 1):
+                cell = iy * self.nx + ix
+                start, end = self.start[cell], self.start[cell + 1]
+                if start == end:
+                    continue
+
+                energy = self.energy[start:end]
+                lo = start + np.searchsorted(energy, en_low, side="right")
+                hi = start + np.searchsorted(energy, en_high, side="left")
+                if lo >= hi:
+                    continue
+
+                n += (np.hypot(self.x[lo:hi] - x, self.y[lo:hi] - y) < radius).sum()
+
+        return int(n)
+
+    def count_many(self, x, y, radius, en_low, en_high):
+        """Apply count to many circles and bands at once.
+
+        The arguments are broadcast against each other and the
+        return value is an integer array of the broadcast shape.
+        """
+        args = np.broadcast_arrays(x, y, radius, en_low, en_high)
+        out = np.zeros(args[0].shape, dtype=int)
+        flat = out.reshape(-1)
+        for i, vals in enumerate(zip(*[a.reshape(-1) for a in args])):
+            flat[i] = self.count(*vals)
+
+        return out
 
 
 def counts_circle_band(evt, pos, waveband, skyconverter, psffrac=0.9):
@@ -31,8 +154,11 @@ def counts_circle_band(evt, pos, waveband, skyconverter, psffrac=0.9):
 
     Parameters
     ----------
-    evt : crates object
-        Open crates object with the event file
+    evt : crates object or EventIndex
+        Open crates object with the event file, or an index created
+        from it. The index should be used when many calls are made
+        for the same event file, since the crate requires a pass
+        through the full event list for each call.
     pos : tuple
         (x, y) position in sky coordinates (in degrees) around which to count
     waveband : tuple
@@ -48,13 +174,16 @@ def counts_circle_band(evt, pos, waveband, skyconverter, psffrac=0.9):
     # Get position in MSC coordinates
     coo = skyconverter(pos[0], pos[1])
     # Note that this function expects input in keV, thus an extra "/1000" here
-    radius = psf.psfSize(
+    radius = get_psf().psfSize(
         np.mean([en_low / 1000, en_high / 1000]),
         coo["theta"][0],
         coo["phi"][0],
         psffrac,
     )
 
+    if isinstance(evt, EventIndex):
+        return evt.count(pos[0], pos[1], radius, en_low, en_high) / psffrac
+
     ind = np.hypot(evt.sky.x.values - pos[0], evt.sky.y.values - pos[1]) < radius
     ind = ind & (evt.energy.values > en_low) & (evt.energy.values < en_high)
     return ind.sum() / psffrac
@@ -107,6 +236,7 @@ def pntsrc_fluxlevel(r, maxlevel, energy, theta, phi, N, arm, cross_disp_pixel):
         expect this output format)
     """
     r = r[0]
+    psf = get_psf()
     dPSFdr = psf.psfFrac(energy, theta, phi, (r + 1) * arcsec_per_pix) - psf.psfFrac(
         energy, theta, phi, r * arcsec_per_pix
     )
@@ -132,8 +262,8 @@ def pnt_src_masking_region(
 
     Parameters
     ----------
-    evt : crates object
-        Open crates object with the event file
+    evt : crates object or EventIndex
+        Open crates object with the event file, or an index created from it
     osip : OSIP object
         Object that encapsulates the OSIP information for a particular event
         file
@@ -1,5 +1,5 @@
 #
-#  Copyright (C) 2020, 2022
+#  Copyright (C) 2020, 2022, 2026
 #            Smithsonian Astrophysical Observatory, MIT
 #
 #
@@ -29,14 +29,27 @@ For this module, the size of the PSF refers to the radius of a circular region
 that encloses a given fraction of the counts from a point source. The values
 are calculated by interpolating the values from the REEF file found in the
 CALDB. It is therefore an approximation to the true PSF.
+
+The psfFrac and psfSize routines, and the methods of the PSF class,
+accept either scalars or arrays for their arguments. Array arguments
+are broadcast against each other and the return value is an array
+with the broadcast shape.
+
+Setting up the PSF library requires a CALDB search and reading in
+the REEF file, so the module-level psfFrac and psfSize routines share
+a single PSF object, returned by get_psf, which is created the first
+time it is needed and closed when Python exits.
 """
+import atexit
 import contextlib
 
+import numpy as np
+
 import psf
 import caldb4
 
 
-__all__ = ['PSF', 'psfFrac', 'psfSize']
+__all__ = ['PSF', 'get_psf', 'psfFrac', 'psfSize']
 
 
 class PSF(contextlib.AbstractContextManager):
@@ -53,55 +66,112 @@ class PSF(contextlib.AbstractContextManager):
         self.close()
 
     def close(self):
+        """Release the PSF data. It is safe to call this multiple times."""
+        if self.pdata is None:
+            return
+
         psf.psfClose(self.pdata)
+        self.pdata = None
+
+    def _evaluate(self, func, *args):
+        """Call func for each element of the broadcast arguments.
+
+        Scalar arguments are passed straight through to func. For
+        array arguments the function is only called once for each
+        unique set of values.
+        """
+
+        if self.pdata is None:
+            raise ValueError("The PSF object has been closed")
+
+        if all(np.ndim(arg) == 0 for arg in args):
+            return func(self.pdata, *args)
+
+        bargs = np.broadcast_arrays(*[np.asarray(arg, dtype=float)
+                                      for arg in args])
+        out = np.zeros(bargs[0].shape)
+        flat = out.reshape(-1)
+        seen = {}
+        for (i, vals) in enumerate(zip(*[b.reshape(-1) for b in bargs])):
+            try:
+                flat[i] = seen[vals]
+            except KeyError:
+                flat[i] = seen[vals] = func(self.pdata, *vals)
+
+        return out
 
     def psfFrac(self, energy_keV, theta_arcmin, phi_deg, size_arcsec):
         """Return approximated enclosed count fraction of a PSF
 
         Parameters
         ----------
-        energy : float
+        energy : float or array
             Energy in keV
-        theta : float
+        theta : float or array
             off-axis angle in arcmin
             (see the MSC coordinate system described in "ahelp coords")
-        phi : float
+        phi : float or array
             angle in degrees
             (see the MSC coordinate system described in "ahelp coords")
-        size : float
+        size : float or array
             radius in arcsec
 
         Returns
         -------
-        eef : float
+        eef : float or array
             enclosed count fraction
         """
-        return psf.psfFrac(self.pdata, energy_keV, theta_arcmin,
-                           phi_deg, size_arcsec)
+        return self._evaluate(psf.psfFrac, energy_keV, theta_arcmin,
+                              phi_deg, size_arcsec)
 
     def psfSize(self, energy_keV, theta_arcmin, phi_deg, ecf):
         """Return approximated enclosed count fraction of a PSF
 
         Parameters
         ----------
-        energy : float
+        energy : float or array
             Energy in keV
-        theta : float
+        theta : float or array
             off-axis angle in arcmin
             (see the MSC coordinate system described in "ahelp coords")
-        phi : float
+        phi : float or array
             angle in degrees
             (see the MSC coordinate system described in "ahelp coords")
 
         Returns
         -------
-        size : float
+        size : float or array
             radius in arcsec
-        eef : float
+        eef : float or array
             enclosed count fraction
         """
-        return psf.psfSize(self.pdata, energy_keV,
-                           theta_arcmin, phi_deg, ecf)
+        return self._evaluate(psf.psfSize, energy_keV,
+                              theta_arcmin, phi_deg, ecf)
+
+
+_psf = None
+
+
+def get_psf():
+    """Return the PSF object used by psfFrac and psfSize.
+
+    The object is created, using the REEF file from the CALDB, on the
+    first call and then re-used, so the cost of setting up the PSF
+    library is only paid once per process. It should not be closed
+    by the caller (if it is, a new object is created by the next
+    call).
+
+    Returns
+    -------
+    psf : PSF instance
+    """
+
+    global _psf
+    if _psf is None or _psf.pdata is None:
+        _psf = PSF()
+        atexit.register(_psf.close)
+
+    return _psf
 
 
 def psfFrac(energy, theta, phi, size):
@@ -109,24 +179,23 @@ def psfFrac(energy, theta, phi, size):
 
     Parameters
     ----------
-    energy : float
+    energy : float or array
         Energy in keV
-    theta : float
+    theta : float or array
         off-axis angle in arcmin
         (see the MSC coordinate system described in "ahelp coords")
-    phi : float
+    phi : float or array
         angle in degrees
         (see the MSC coordinate system described in "ahelp coords")
-    size : float
+    size : float or array
         radius in arcsec
 
     Returns
     -------
-    ecf : float
+    ecf : float or array
         enclosed count fraction
     """
-    with PSF() as _psf:
-        return _psf.psfFrac(energy, theta, phi, size)
+    return get_psf().psfFrac(energy, theta, phi, size)
 
 
 def psfSize(energy_keV, theta_arcmin, phi_deg, ecf):
@@ -134,21 +203,20 @@ def psfSize(energy_keV, theta_arcmin, phi_deg, ecf):
 
     Parameters
     ----------
-    energy : float
+    energy : float or array
         Energy in keV
-    theta : float
+    theta : float or array
         off-axis angle in arcmin
         (see the MSC coordinate system described in "ahelp coords")
-    phi : float
+    phi : float or array
         angle in degrees
         (see the MSC coordinate system described in "ahelp coords")
-    ecf : float
+    ecf : float or array
         enclosed count fraction
 
     Returns
     -------
-    size : float
+    size : float or array
         radius in arcsec
     """
-    with PSF() as _psf:
-        return _psf.psfSize(energy_keV, theta_arcmin, phi_deg, ecf)
+    return get_psf().psfSize(energy_keV, theta_arcmin, phi_deg, ecf)
@@ -3363,7 +3363,7 @@ parinfo['make_psf_asymmetry_region'] = {
 parinfo['map2reg'] = {
     'istool': True,
     'req': [ParValue("infile","f","Input map image",None),ParValue("outfile","f","Output region file",None)],
-    'opt': [ParValue("parallel","b","Run processes in parallel?",True),ParValue("nproc","i","Number of processors to use (None:use all available)",None),ParRange("verbose","i","Tool chatter level",1,0,5),ParValue("clobber","b","Remove output file if it already exists?",False)],
+    'opt': [ParSet("method","s","Method used to create the polygons",'trace',["trace","lasso"]),ParValue("parallel","b","Run processes in parallel?",True),ParValue("nproc","i","Number of processors to use (None:use all available)",None),ParRange("verbose","i","Tool chatter level",1,0,5),ParValue("clobber","b","Remove output file if it already exists?",False)],
     }
 
 
@@ -1,5 +1,5 @@
 #
-#  Copyright (C) 2010, 2011, 2014, 2015, 2018
+#  Copyright (C) 2010, 2011, 2014, 2015, 2018, 2026
 #            Smithsonian Astrophysical Observatory
 #
 #
@@ -30,14 +30,61 @@ At present, limited to
   fsmooth - smooth by the contents of a file
 
   ismooth  - smooth image with an image
+  ismooth_many - smooth several images with an image
+
+The FFT of a kernel is remembered, so smoothing several images of
+the same shape with the same kernel only transforms the kernel once;
+clear_kernel_cache() removes the stored values.
 
 """
 
+from collections import OrderedDict
+from functools import partial
+import hashlib
+
 import numpy as np
 import sherpa.utils._psf as psf
+from sherpa.utils import parallel_map
 import pycrates as pyc
 
-__all__ = ("ismooth", "gsmooth", "bsmooth", "tsmooth", "fsmooth")
+__all__ = ("ismooth", "ismooth_many", "gsmooth", "bsmooth", "tsmooth",
+           "fsmooth", "clear_kernel_cache")
+
+
+# The maximum number of kernel FFTs to store. Each one is the size of
+# the padded image, so this is kept small.
+#
+KERNEL_CACHE_SIZE = 4
+
+# The Sherpa convolution objects, which hold on to the kernel FFT
+# once it has been calculated. The key is the kernel identifier,
+# image shape, kernel shape, and kernel center, since these define
+# the transformed (and padded) kernel.
+#
+_kernel_cache = OrderedDict()
+
+
+def clear_kernel_cache():
+    """Remove all the stored kernel FFTs."""
+
+    _kernel_cache.clear()
+
+
+def _get_convolver(key):
+    """Return the tcdData object to use for the key, re-using the
+    previous version (and so its kernel FFT) if possible."""
+
+    try:
+        tcd = _kernel_cache.pop(key)
+    except KeyError:
+        tcd = psf.tcdData()
+        tcd.clear_kernel_fft()
+
+    _kernel_cache[key] = tcd
+    while len(_kernel_cache) > KERNEL_CACHE_SIZE:
+        _kernel_cache.popitem(last=False)
+
+    return tcd
 
 
 # Create the kernels
@@ -118,6 +165,74 @@ def mk_boxcar(radius):
 
 # Smoothing routines
 #
+def _prepare_kernel(kernel, origin, norm, kernelid=None):
+    """Return the kernel information needed by _smooth_image.
+
+    The kernelid argument identifies the kernel for the FFT cache;
+    if None then it is calculated from the kernel values.
+    """
+
+    if kernel.ndim != 2:
+        raise ValueError("ismooth() input kernel must be 2D, send {0}D".format(kernel.ndim))
+
+    # convolve takes the dimensionality with X first not last
+    kshape = kernel.shape
+
+    knx = kshape[1]
+    kny = kshape[0]
+
+    ks2 = (knx, kny)
+
+    if norm:
+        nkernel = kernel * 1.0 / kernel.sum()
+    else:
+        nkernel = kernel * 1.0
+
+    if origin is None:
+        # We use the same center for even or odd image sizes
+        kcx = knx // 2
+        kcy = kny // 2
+        kcen = (kcx, kcy)
+    else:
+        kcen = (origin[1], origin[0])
+
+    kvals = np.nan_to_num(nkernel.flatten())
+    if kernelid is None:
+        kernelid = ("image", hashlib.sha1(kvals.tobytes()).hexdigest())
+
+    return (kvals, ks2, kcen, kernelid)
+
+
+def _smooth_image(image, kinfo):
+    """Convolve the 2D image with the kernel returned by
+    _prepare_kernel."""
+
+    (kvals, ks2, kcen, kernelid) = kinfo
+
+    # convolve takes the dimensionality with X first not last
+    ishape = image.shape
+    is2 = (ishape[1], ishape[0])
+
+    tcd = _get_convolver((kernelid, is2, ks2, kcen))
+
+    cimage = np.nan_to_num(image.flatten())
+    out = tcd.convolve(cimage, kvals, is2, ks2, kcen)
+
+    out = out.reshape(ishape)
+    out[np.isnan(image)] = np.nan
+    return out
+
+
+def _ismooth(image, kernel, origin=None, norm=True, kernelid=None):
+    """ismooth, where kernelid identifies the kernel for the FFT cache."""
+
+    if image.ndim != 2:
+        raise ValueError("ismooth() input image must be 2D, send {0}D".format(image.ndim))
+
+    kinfo = _prepare_kernel(kernel, origin, norm, kernelid=kernelid)
+    return _smooth_image(image, kinfo)
+
+
 def ismooth(image, kernel, origin=None, norm=True):
     """Convolve image with a kernel.
 
@@ -137,48 +252,53 @@ def ismooth(image, kernel, origin=None, norm=True):
     Any such pixels in the input image are set back to NaN in the output image,
     but the presence of such values in the kernel image are ignored.
 
+    The FFT of the kernel is re-used if the same kernel has recently
+    been used with an image of the same shape.
+
     """
 
-    if image.ndim != 2:
-        raise ValueError("ismooth() input image must be 2D, send {0}D".format(image.ndim))
-    if kernel.ndim != 2:
-        raise ValueError("ismooth() input kernel must be 2D, send {0}D".format(kernel.ndim))
+    return _ismooth(image, kernel, origin=origin, norm=norm)
 
-    # convolve takes the dimensionality with X first not last
-    ishape = image.shape
-    is2 = (ishape[1], ishape[0])
 
-    kshape = kernel.shape
+def ismooth_many(images, kernel, origin=None, norm=True, numcores=None):
+    """Convolve each image with the same kernel.
 
-    knx = kshape[1]
-    kny = kshape[0]
+    The images argument is either a list of 2D arrays or a 3D array,
+    where the first axis indexes the images. The return value is a
+    list of the smoothed images, or a 3D array if images is an array.
+    The results are the same as calling ismooth() on each image, and
+    the kernel, origin, and norm arguments are the same as ismooth(),
+    but the kernel is only prepared and transformed once for each
+    image shape.
 
-    ks2 = (knx, kny)
+    If numcores is not None then the images are smoothed in parallel
+    using up to numcores processes (using sherpa.utils.parallel_map).
+    The first image is smoothed before the processes are started so
+    that they can use its kernel FFT.
 
-    tcd = psf.tcdData()
-    tcd.clear_kernel_fft()
+    """
 
-    cimage = np.nan_to_num(image.flatten())
+    if isinstance(images, np.ndarray) and images.ndim != 3:
+        raise ValueError("ismooth_many() input images must be 3D, send {0}D".format(images.ndim))
 
-    if norm:
-        nkernel = kernel * 1.0 / kernel.sum()
-    else:
-        nkernel = kernel * 1.0
+    for image in images:
+        if image.ndim != 2:
+            raise ValueError("ismooth_many() input images must be 2D, send {0}D".format(image.ndim))
+
+    kinfo = _prepare_kernel(kernel, origin, norm)
+    out = []
+    todo = list(images)
+    if numcores is not None and len(todo) > 1:
+        out.append(_smooth_image(todo.pop(0), kinfo))
+        out.extend(parallel_map(partial(_smooth_image, kinfo=kinfo), todo,
+                                numcores=numcores))
 
-    if origin is None:
-        # We use the same center for even or odd image sizes
-        kcx = knx // 2
-        kcy = kny // 2
-        kcen = (kcx, kcy)
     else:
-        kcen = (origin[1], origin[0])
+        out.extend(_smooth_image(image, kinfo) for image in todo)
 
-    out = tcd.convolve(cimage,
-                       np.nan_to_num(nkernel.flatten()),
-                       is2, ks2, kcen)
+    if isinstance(images, np.ndarray):
+        return np.asarray(out).reshape(images.shape)
 
-    out = out.reshape(ishape)
-    out[np.isnan(image)] = np.nan
     return out
 
 
@@ -197,7 +317,8 @@ def gsmooth(image, sigma, hwidth=5):
     if image.ndim != 2:
         raise ValueError("gsmooth only works on 2D arrays, sent a {0}D array/".format(image.ndim))
 
-    return ismooth(image, mk_gauss(sigma, hwidth), norm=True)
+    return _ismooth(image, mk_gauss(sigma, hwidth), norm=True,
+                    kernelid=("gauss", sigma, hwidth))
 
 
 def tsmooth(image, radius):
@@ -214,7 +335,7 @@ def tsmooth(image, radius):
     if image.ndim != 2:
         raise ValueError("tsmooth only works on 2D arrays, sent a {0}D array/".format(image.ndim))
 
-    return ismooth(image, mk_tophat(radius))
+    return _ismooth(image, mk_tophat(radius), kernelid=("tophat", radius))
 
 
 def bsmooth(image, radius):
@@ -233,7 +354,7 @@ def bsmooth(image, radius):
     if image.ndim != 2:
         raise ValueError("bmooth only works on 2D arrays, sent a {0}D array".format(image.ndim))
 
-    return ismooth(image, mk_boxcar(radius))
+    return _ismooth(image, mk_boxcar(radius), kernelid=("boxcar", radius))
 
 
 def fsmooth(image, filename):
@@ -21,15 +21,16 @@
 #
 
 """
-Utility routines for handling coordinates. At present only one routine
-is exported.
+Utility routines for handling coordinates. At present only the
+point_separation, match_positions, and match_cartesian routines
+are exported.
 
 The interface is liable to change.
 """
 
 import numpy as np
 
-__all__ = ("point_separation",)
+__all__ = ("point_separation", "match_positions", "match_cartesian")
 
 
 def spherical_to_cartesian(longitude, latitude):
@@ -204,3 +205,168 @@ def point_separation(long1, lat1, long2, lat2):
     a = spherical_to_cartesian(args[0], args[1])
     b = spherical_to_cartesian(args[2], args[3])
     return radtodeg(angular_separation(a, b))
+
+
+def match_cartesian(pos1, pos2, radius):
+    """Find all pairs of points separated by at most radius.
+
+    The points are binned on to a regular grid of cells, with a size
+    set by the search radius, so that each point in the first set only
+    needs to be compared to the points of the second set in the cells
+    that surround it, rather than to every point.
+
+    Parameters
+    ----------
+    pos1, pos2 : array of float
+        The two sets of points, with shape (ndim, npoints). The
+        number of dimensions must match.
+    radius : float
+        The maximum separation. It must be 0 or greater.
+
+    Returns
+    -------
+    idx1, idx2, dist : ndarray
+        The indexes into the first and second sets of points for each
+        match, and the separation. The matches are sorted by idx1,
+        then by separation, and then by idx2.
+
+    """
+
+    if radius < 0:
+        raise ValueError("radius must be >= 0, not {}".format(radius))
+
+    pos1 = np.asarray(pos1, dtype=float)
+    pos2 = np.asarray(pos2, dtype=float)
+    if pos1.ndim != 2 or pos2.ndim != 2 or pos1.shape[0] != pos2.shape[0]:
+        raise ValueError("pos1 and pos2 must have shape (ndim, npoints)")
+
+    empty = (np.zeros(0, dtype=int), np.zeros(0, dtype=int),
+             np.zeros(0))
+    if pos1.shape[1] == 0 or pos2.shape[1] == 0:
+        return empty
+
+    ndim = pos1.shape[0]
+    lo = np.minimum(pos1.min(axis=1), pos2.min(axis=1))
+    extent = np.maximum(pos1.max(axis=1), pos2.max(axis=1)) - lo
+
+    # Increase the cell size, if needed, so that the combined cell
+    # key fits into an int64.
+    #
+    cellsize = radius
+    if cellsize == 0:
+        cellsize = max(extent.max(), 1.0) / 2**20
+
+    while True:
+        nbins = np.floor(extent / cellsize).astype(np.int64) + 3
+        if np.sum(np.log2(nbins)) < 62:
+            break
+
+        cellsize *= 2
+
+    strides = np.ones(ndim, dtype=np.int64)
+    for i in range(ndim - 2, -1, -1):
+        strides[i] = strides[i + 1] * nbins[i + 1]
+
+    # Add 1 so that the neighbouring cells are never negative.
+    lo = lo[:, np.newaxis]
+    cells1 = np.floor((pos1 - lo) / cellsize).astype(np.int64) + 1
+    cells2 = np.floor((pos2 - lo) / cellsize).astype(np.int64) + 1
+
+    keys2 = np.dot(strides, cells2)
+    order = np.argsort(keys2, kind='stable')
+    skeys2 = keys2[order]
+
+    n1 = pos1.shape[1]
+    i1 = []
+    i2 = []
+    for delta in np.ndindex(*([3] * ndim)):
+        qkeys = np.dot(strides, cells1 + np.asarray(delta)[:, np.newaxis] - 1)
+        start = np.searchsorted(skeys2, qkeys, side='left')
+        end = np.searchsorted(skeys2, qkeys, side='right')
+        nmatch = end - start
+        if nmatch.sum() == 0:
+            continue
+
+        # Expand each [start, end) range into the individual
+        # candidates.
+        src = np.repeat(np.arange(n1), nmatch)
+        offset = np.repeat(start - np.cumsum(nmatch) + nmatch, nmatch)
+        i1.append(src)
+        i2.append(order[np.arange(src.size) + offset])
+
+    if len(i1) == 0:
+        return empty
+
+    i1 = np.concatenate(i1)
+    i2 = np.concatenate(i2)
+
+    diff = pos1[:, i1] - pos2[:, i2]
+    dist = np.sqrt(np.sum(diff * diff, axis=0))
+
+    keep = dist <= radius
+    i1 = i1[keep]
+    i2 = i2[keep]
+    dist = dist[keep]
+
+    idx = np.lexsort((i2, dist, i1))
+    return (i1[idx], i2[idx], dist[idx])
+
+
+def match_positions(long1, lat1, long2, lat2, radius):
+    """Find all pairs of points separated by at most radius.
+
+    The positions are converted to unit vectors and matched with
+    match_cartesian, so each position is only compared to its
+    neighbours rather than to every position in the second set.
+
+    Parameters
+    ----------
+    long1, lat1 : array of float
+        The first set of positions, in decimal degrees.
+    long2, lat2 : array of float
+        The second set of positions, in decimal degrees.
+    radius : float
+        The maximum separation, in decimal degrees. It must be
+        0 or greater.
+
+    Returns
+    -------
+    idx1, idx2, sep : ndarray
+        The indexes into the first and second sets of positions
+        for each match, and the separation, in decimal degrees.
+        The matches are sorted by idx1, then by separation, and
+        then by idx2.
+
+    """
+
+    if radius < 0:
+        raise ValueError("radius must be >= 0, not {}".format(radius))
+
+    long1 = np.atleast_1d(np.asarray(long1, dtype=float))
+    lat1 = np.atleast_1d(np.asarray(lat1, dtype=float))
+    long2 = np.atleast_1d(np.asarray(long2, dtype=float))
+    lat2 = np.atleast_1d(np.asarray(lat2, dtype=float))
+
+    xyz1 = spherical_to_cartesian(degtorad(long1), degtorad(lat1))
+    xyz2 = spherical_to_cartesian(degtorad(long2), degtorad(lat2))
+
+    # Select the candidates using the chord length, with a small
+    # tolerance so that rounding does not remove pairs at the edge,
+    # and then use the angular separation to filter them.
+    #
+    rrad = degtorad(min(radius, 180.0))
+    chord = 2 * np.sin(rrad / 2) * (1 + 1e-8) + 1e-15
+    (i1, i2, _) = match_cartesian(xyz1, xyz2, chord)
+
+    cp = np.cross(xyz1[:, i1], xyz2[:, i2], axis=0)
+    s = np.sqrt(np.sum(cp * cp, axis=0))
+    c = np.sum(xyz1[:, i1] * xyz2[:, i2], axis=0)
+    sep = radtodeg(np.arctan2(s, c))
+
+    keep = sep <= radius
+    i1 = i1[keep]
+    i2 = i2[keep]
+    sep = sep[keep]
+
+    idx = np.lexsort((i2, sep, i1))
+    return (i1[idx], i2[idx], sep[idx])
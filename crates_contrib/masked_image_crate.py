@@ -148,3 +148,10 @@ class MaskedIMAGECrate(IMAGECrate):
         Is pixel at 0-based indices i, j valid?
         """
         return self._mask[j][i] == 1
+
+    def valid_mask(self):
+        """
+        Return a boolean array, matching the image shape, which is
+        True for the valid pixels.
+        """
+        return self._mask == 1
@@ -1,5 +1,5 @@
 #
-#  Copyright (C) 2020
+#  Copyright (C) 2020, 2026
 #  Smithsonian Astrophysical Observatory
 #
 #
@@ -31,35 +31,55 @@ and keep track of things running in the background to cleanup/etc.
 """
 
 
-import subprocess
+import io
+
+import numpy as np
+
+from dax.utils import DaxSession
 
 __all__ = ("blt_plot_data", "blt_plot_model", "blt_plot_delchisqr")
 
 
+def _session(access_point):
+    """Errors are ignored, as with earlier versions of this module, so a
+    command not supported by an older ds9 does not stop the plot.
+    """
+    return DaxSession(access_point, check=False)
+
+
 def xpa_plot_cmd(access_point, command):
-    """Wrapper around xpaset for plot commands"""
+    """Wrapper around xpaset for plot commands.
+
+    XPA processes a single command per call, so each command is a
+    separate xpaset call.
+    """
 
-    cc = ["xpaset", "-p", access_point, "plot"]
+    cc = ["plot"]
     cc.extend(command.split(' '))
-    with subprocess.Popen(cc) as xpa:
-        xpa.communicate()
+    _session(access_point).set(cc)
+
+
+def format_values(*cols):
+    """Convert the columns to text, one row per line.
+
+    This formats the whole array at once, rather than a line at a
+    time, which matters for spectra with many bins.
+    """
+
+    vals = np.column_stack([np.asarray(c, dtype=float) for c in cols])
+    buf = io.BytesIO()
+    np.savetxt(buf, vals, fmt="%.17g")
+    return buf.getvalue()
 
 
-def __pipe_values_to_plot(cmd, vals):
+def __pipe_values_to_plot(access_point, cmd, *cols):
+    _session(access_point).send(cmd, format_values(*cols))
 
-    with subprocess.Popen(cmd, stdin=subprocess.PIPE) as xpa:
-        for vv in vals:
-            pair = " ".join([str(x) for x in vv])+"\n"
-            pb = pair.encode()
-            xpa.stdin.write(pb)
-        xpa.communicate()
-    
 
 def blt_plot_data(access_point, xx, ex, yy, ey):
     """Plot the data"""
-    cmd = ["xpaset", access_point, "plot"]
-    cmd.extend(["data", "xyey"])
-    __pipe_values_to_plot(cmd, zip(xx, yy, ey))
+
+    __pipe_values_to_plot(access_point, ["plot", "data", "xyey"], xx, yy, ey)
 
     make_pretty(access_point)
     xpa_plot_cmd(access_point, "legend yes")
@@ -73,17 +93,15 @@ def blt_plot_model(access_point, x_vals, y_vals, title, x_label, y_label,
     if not new:
         xpa_plot_cmd(access_point, f"{winname} close")
 
-    cmd = ["xpaset", access_point, "plot", "new"]
+    cmd = ["plot", "new"]
     cmd.extend(["name", winname, "line",
                 f"{{{title}}}", f"{{{x_label} }}", f"{{{y_label} }}",
                 "xy"])
-    __pipe_values_to_plot(cmd, zip(x_vals, y_vals))
+    __pipe_values_to_plot(access_point, cmd, x_vals, y_vals)
 
-    xpa_plot_cmd(access_point, "shape none")
-    xpa_plot_cmd(access_point, "shape fill no")
-    xpa_plot_cmd(access_point, "color orange")
-    xpa_plot_cmd(access_point, "shape color orange")
-    xpa_plot_cmd(access_point, "width 2")
+    for plotcmd in ["shape none", "shape fill no", "color orange",
+                    "shape color orange", "width 2"]:
+        xpa_plot_cmd(access_point, plotcmd)
     if step:
         xpa_plot_cmd(access_point, "smooth step")
     xpa_plot_cmd(access_point, "name Model")
@@ -92,6 +110,10 @@ def blt_plot_model(access_point, x_vals, y_vals, title, x_label, y_label,
 def blt_plot_delchisqr(access_point, xx, ex, yy, ey, y_label):
     """Plot the residuals"""
 
+    xx = np.asarray(xx)
+    ex = np.asarray(ex)
+    yy = np.asarray(yy)
+
     # This requires ds9 v8.1
     xpa_plot_cmd(access_point, "add graph line")
     xpa_plot_cmd(access_point, "layout strip")
@@ -99,36 +121,27 @@ def blt_plot_delchisqr(access_point, xx, ex, yy, ey, y_label):
     # Add line through 0
     x0 = [xx[0]-2*ex[0], xx[-1]+2*ex[-1]]
     y0 = [0, 0]
-    cmd = ["xpaset", access_point, "plot", "data", "xy"]
-    __pipe_values_to_plot(cmd, zip(x0, y0))
+    __pipe_values_to_plot(access_point, ["plot", "data", "xy"], x0, y0)
 
-    xpa_plot_cmd(access_point, "shape none")
-    xpa_plot_cmd(access_point, "shape fill no")
-    xpa_plot_cmd(access_point, "color grey")
-    xpa_plot_cmd(access_point, "name zero")
-    xpa_plot_cmd(access_point, "width 1")
-    xpa_plot_cmd(access_point, "dash yes")
+    for plotcmd in ["shape none", "shape fill no", "color grey",
+                    "name zero", "width 1", "dash yes"]:
+        xpa_plot_cmd(access_point, plotcmd)
 
     # Plot the data
-    step_x = [x-2*e for x, e in zip(xx,ex)]
-    step_x.append(xx[-1]+2*ex[-1])
-
-    step_y = [y for y in yy]   # make a copy
-    step_y.append(yy[-1])
+    step_x = np.append(xx - 2 * ex, xx[-1] + 2 * ex[-1])
+    step_y = np.append(yy, yy[-1])
 
     # plot steps if binned data
     if not all(ex==0):
-        cmd = ["xpaset", access_point, "plot", "data", "xy"]
-        __pipe_values_to_plot(cmd, zip(step_x, step_y))
+        __pipe_values_to_plot(access_point, ["plot", "data", "xy"],
+                              step_x, step_y)
         make_pretty(access_point)
-        xpa_plot_cmd(access_point, "width 2")
-        xpa_plot_cmd(access_point, "line smooth step")
-        xpa_plot_cmd(access_point, "shape none")
-        xpa_plot_cmd(access_point, "shape fill no")
-        xpa_plot_cmd(access_point, "color cornflowerblue")
-    
-    cmd = ["xpaset", access_point, "plot", "data", "xyexey"]
-    __pipe_values_to_plot(cmd, zip(xx, yy, 2*ex, ey))
+        for plotcmd in ["width 2", "line smooth step", "shape none",
+                        "shape fill no", "color cornflowerblue"]:
+            xpa_plot_cmd(access_point, plotcmd)
+
+    __pipe_values_to_plot(access_point, ["plot", "data", "xyexey"],
+                          xx, yy, 2*ex, ey)
 
     make_pretty(access_point)
     xpa_plot_cmd(access_point, "title y {delta chisqr}")
@@ -137,16 +150,13 @@ def blt_plot_delchisqr(access_point, xx, ex, yy, ey, y_label):
     if not all(ex==0):
         xpa_plot_cmd(access_point, "shape none")
         xpa_plot_cmd(access_point, "shape fill no")
-        
 
 
 def make_pretty(access_point):
     """make pretty plots"""
-    xpa_plot_cmd(access_point, "shape circle")
-    xpa_plot_cmd(access_point, "shape fill yes")
-    xpa_plot_cmd(access_point, "shape color cornflowerblue")
-    xpa_plot_cmd(access_point, "error color cornflowerblue")
-    xpa_plot_cmd(access_point, "width 0")
-    xpa_plot_cmd(access_point, "name {Data }")
-    xpa_plot_cmd(access_point, "axis x grid no")
-    xpa_plot_cmd(access_point, "axis y grid no")
+
+    for plotcmd in ["shape circle", "shape fill yes",
+                    "shape color cornflowerblue",
+                    "error color cornflowerblue", "width 0",
+                    "name {Data }", "axis x grid no", "axis y grid no"]:
+        xpa_plot_cmd(access_point, plotcmd)
@@ -42,6 +42,10 @@ class ImageProcTask():
 
         self.xpa = xpa
 
+        from dax.utils import DaxSession
+        cachedir = os.path.join(os.environ["DAX_OUTDIR"], "dax_image_cache")
+        self.session = DaxSession(xpa, cachedir=cachedir)
+
         self.infile = self.save_ds9_image()
         self.keep_infiles = False
 
@@ -111,9 +115,11 @@ class ImageProcTask():
         # tcl command has to be a single command so it is wrapped in the
         # {}'s.
 
+        # The progress commands are sent in the background, since
+        # there is no need to wait for them.
         try:
-            self.xpaset_p(['tcl',
-                           '{{start_dax_progress {t}}}'.format(t=self.toolname)])
+            self.session.set_async(['tcl',
+                                    '{{start_dax_progress {t}}}'.format(t=self.toolname)])
             if hasattr(self.tool, "clobber") is True:
                 self.tool.clobber = True
 
@@ -130,8 +136,8 @@ class ImageProcTask():
                 print("Output file: {}".format(self.outfile.name))
 
         finally:
-            self.xpaset_p(['tcl',
-                           '{{stop_dax_progress {t}}}'.format(t=self.toolname)])
+            self.session.set_async(['tcl',
+                                    '{{stop_dax_progress {t}}}'.format(t=self.toolname)])
 
             if self.keep_infiles is True:
                 return
@@ -151,27 +157,11 @@ class ImageProcTask():
 
     def xpaset_p(self, args):
         'Run xpaset -p (nothing return)'
-        cmd = ["xpaset", "-p", self.xpa]
-
-        if isinstance(args, str):
-            cmd.extend(args.split())
-        else:
-            cmd.extend(args)
-
-        sp.run(cmd, check=True)
+        self.session.set(args)
 
     def xpaget(self, args, decode=True):
         'Run xpaget, return output as str'
-        cmd = ["xpaget", self.xpa]
-
-        if isinstance(args, str):
-            cmd.extend(args.split())
-        else:
-            cmd.extend(args)
-        retval = sp.run(cmd, check=True, stdout=sp.PIPE).stdout
-        if decode is True:
-            retval = retval.decode()
-        return retval
+        return self.session.get(args, decode=decode)
 
     def update_wcs_for_blocking(self, infile):
         'Update the WCS if image has been blocked'
@@ -229,19 +219,28 @@ class ImageProcTask():
         yhi = ymid+ylen/2.0
         filt = "[#1={}:{},#2={}:{}]".format(xlo, xhi, ylo, yhi)
 
+        ds9_file = NamedTemporaryFile(dir=os.environ["DAX_OUTDIR"],
+                                      suffix="_ds9.fits", delete=False)
+        ds9_file.close()
+
+        # Re-use the image from an earlier task if ds9 has not changed.
+        key = self.session.image_key()
+        if self.session.fetch_image(key, ds9_file.name):
+            return ds9_file.name
+
         # Get fits image from ds9
         fits = self.xpaget(["fits", ], decode=False)
 
         # Use dmcopy to filter on cropped region; pipe
         # fits file into dmcopy via stdin.
-        ds9_file = NamedTemporaryFile(dir=os.environ["DAX_OUTDIR"],
-                                      suffix="_ds9.fits", delete=False)
         cmd = ['dmcopy', '-{}'.format(filt), ds9_file.name, "clobber=yes"]
         dmc = sp.Popen(cmd, stdin=sp.PIPE)
         dmc.stdin.write(fits)
         dmc.communicate()
+        del fits
 
         self.update_wcs_for_blocking(ds9_file.name)
+        self.session.store_image(key, ds9_file.name)
 
         return ds9_file.name
 
@@ -1,4 +1,4 @@
-#  Copyright (C) 2022  Smithsonian Astrophysical Observatory
+#  Copyright (C) 2022, 2026  Smithsonian Astrophysical Observatory
 #
 #  This program is free software; you can redistribute it and/or modify
 #  it under the terms of the GNU General Public License as published by
@@ -19,10 +19,12 @@
 'Common dax utilities'
 
 
+import hashlib
+import os
 import subprocess as sp
 
 
-__all__ = [ 'xpaget', 'xpaset', 'xpaset_p', ]
+__all__ = [ 'xpaget', 'xpaset', 'xpaset_p', 'DaxSession', ]
 
 
 def xpaget(xpa, args):
@@ -50,3 +52,260 @@ def xpaset(xpa, command, args):
     doit.stdin.write(stdin_str.encode())
     doit.communicate()
 
+
+
+def _fits_hdus(path):
+    """Return the (XTENSION, EXTNAME, NAXIS) values of each HDU in
+    the FITS file, reading only the headers.
+
+    XTENSION is "" for the primary HDU.
+    """
+
+    hdus = []
+    with open(path, "rb") as fh:
+        while True:
+            cards = {}
+            done = False
+            while not done:
+                block = fh.read(2880)
+                if len(block) < 2880:
+                    return hdus
+
+                for idx in range(0, 2880, 80):
+                    card = block[idx:idx + 80].decode("ascii", "replace")
+                    key = card[:8].strip()
+                    if key == "END":
+                        done = True
+                        break
+
+                    if card[8:10] != "= ":
+                        continue
+
+                    val = card[10:].strip()
+                    if val.startswith("'"):
+                        val = val[1:].split("'")[0]
+                    else:
+                        val = val.split("/")[0]
+                    cards[key] = val.strip()
+
+            naxis = int(cards.get("NAXIS", 0))
+            hdus.append((cards.get("XTENSION", ""),
+                         cards.get("EXTNAME", "").upper(), naxis))
+
+            size = 0
+            if naxis > 0:
+                size = 1
+                for axis in range(1, naxis + 1):
+                    size *= int(cards[f"NAXIS{axis}"])
+
+                size = abs(int(cards["BITPIX"])) // 8 * \
+                    int(cards.get("GCOUNT", 1)) * \
+                    (int(cards.get("PCOUNT", 0)) + size)
+
+            fh.seek((size + 2879) // 2880 * 2880, os.SEEK_CUR)
+
+
+def _is_table(fname):
+    """Is the data ds9 loaded from fname (which may include an
+    extension) a table, so that the bin settings apply?
+
+    If the file can not be read then True is returned.
+    """
+
+    path, _, ext = fname.partition("[")
+    ext = ext.split("]")[0].split(",")[0].strip().upper()
+    try:
+        hdus = _fits_hdus(path)
+    except (OSError, ValueError, KeyError):
+        return True
+
+    if ext == "":
+        # ds9 loads the first image, if there is one.
+        return not any(naxis > 0 and xtension in ("", "IMAGE")
+                       for xtension, _, naxis in hdus)
+
+    for idx, (xtension, extname, _) in enumerate(hdus):
+        if ext in (extname, str(idx)):
+            return xtension != "IMAGE" and idx > 0
+
+    return True
+
+
+class DaxSession():
+    """Send XPA commands to ds9 for a single dax task.
+
+    XPA has no persistent connection, so each command is a separate
+    xpaget or xpaset process. The session reduces the number of
+    calls, and the amount of data sent, by:
+
+      - remembering the results of xpaget queries until the next
+        xpaset command (which may change the ds9 state), so that
+        settings queried by several steps are only asked for once;
+      - sending commands which do not need to be waited for, such as
+        the progress indicator, in the background;
+      - keeping the images extracted from ds9 in a cache directory,
+        so they can be re-used by later tasks.
+
+    The xpaget and xpaset arguments are the names of the programs to
+    run, which allows them to be replaced when testing. If check is
+    False then a failed xpaset command does not raise an error.
+    """
+
+    # The number of images to keep in the cache; two frames are
+    # needed by tasks like acrosscorr.
+    max_cached_images = 4
+
+    # The ds9 settings that determine the image returned by
+    # "xpaget fits". The bin settings are only used for tables,
+    # and the smooth settings when smoothing is on.
+    image_queries = ("frame", "crop image", "block")
+    bin_queries = ("bin factor", "bin about", "bin cols", "bin filter",
+                   "bin function", "bin buffersize")
+    smooth_queries = ("smooth function", "smooth radius")
+
+    def __init__(self, xpa, cachedir=None, xpaget="xpaget", xpaset="xpaset",
+                 check=True):
+        self.xpa = xpa
+        self.cachedir = cachedir
+        self.check = check
+        self._xpaget = xpaget
+        self._xpaset = xpaset
+        self._queries = {}
+        self._background = []
+
+    @staticmethod
+    def _to_list(args):
+        'Commands can be a string or list of strings'
+        if isinstance(args, str):
+            return args.split()
+        return list(args)
+
+    def get(self, args, decode=True):
+        'Run xpaget, returning the output (re-using earlier results)'
+
+        args = tuple(self._to_list(args))
+        key = (args, decode)
+        if key in self._queries:
+            return self._queries[key]
+
+        self.wait()
+        cmd = [self._xpaget, self.xpa]
+        cmd.extend(args)
+        retval = sp.run(cmd, check=True, stdout=sp.PIPE).stdout
+        if decode is True:
+            retval = retval.decode()
+
+        self._queries[key] = retval
+        return retval
+
+    def set(self, args):
+        'Run xpaset -p, after any background commands'
+
+        self.wait()
+        self._queries.clear()
+        cmd = [self._xpaset, "-p", self.xpa]
+        cmd.extend(self._to_list(args))
+        sp.run(cmd, check=self.check)
+
+    def send(self, args, data):
+        'Run xpaset, after any background commands, sending data via stdin'
+
+        self.wait()
+        self._queries.clear()
+        cmd = [self._xpaset, self.xpa]
+        cmd.extend(self._to_list(args))
+        sp.run(cmd, input=data, check=self.check)
+
+    def set_async(self, args):
+        """Run xpaset -p in the background.
+
+        Any earlier background commands are waited for first, so the
+        commands are still processed in order by ds9.
+        """
+
+        self.wait()
+        self._queries.clear()
+        cmd = [self._xpaset, "-p", self.xpa]
+        cmd.extend(self._to_list(args))
+        self._background.append(sp.Popen(cmd))
+
+    def wait(self):
+        'Wait for the background commands to finish'
+        for proc in self._background:
+            proc.wait()
+        self._background = []
+
+    def image_key(self):
+        """The cache key for the current ds9 image, or None if the
+        image can not be cached (it was not loaded from a file).
+
+        The key depends on the file (including its size and
+        modification time), the frame, and the crop and block
+        settings, along with the bin settings for a table and the
+        smooth settings when smoothing is on.
+        """
+
+        fname = self.get("file").strip()
+        path = fname.split("[")[0]
+        if fname == "" or not os.path.isfile(path):
+            return None
+
+        queries = list(self.image_queries)
+        if _is_table(fname):
+            queries.extend(self.bin_queries)
+
+        queries.append("smooth")
+        vals = [fname] + [self.get(q).strip() for q in queries]
+        if vals[-1] == "yes":
+            vals.extend(self.get(q).strip() for q in self.smooth_queries)
+
+        stat = os.stat(path)
+        vals.extend([str(stat.st_size), str(stat.st_mtime_ns)])
+        return hashlib.sha256("\0".join(vals).encode()).hexdigest()
+
+    def _cache_name(self, key):
+        return os.path.join(self.cachedir, f"{key}.fits")
+
+    def fetch_image(self, key, outfile):
+        """Link the cached image to outfile, if it exists.
+
+        Returns True if the image was found.
+        """
+
+        if self.cachedir is None or key is None:
+            return False
+
+        cached = self._cache_name(key)
+        if not os.path.exists(cached):
+            return False
+
+        tmpname = f"{outfile}.{os.getpid()}.tmp"
+        try:
+            os.link(cached, tmpname)
+        except OSError:
+            return False
+
+        os.replace(tmpname, outfile)
+        os.utime(cached)   # mark as recently used
+        return True
+
+    def store_image(self, key, infile):
+        'Add the image to the cache, removing the oldest images'
+
+        if self.cachedir is None or key is None:
+            return
+
+        os.makedirs(self.cachedir, exist_ok=True)
+        tmpname = f"{self._cache_name(key)}.{os.getpid()}.tmp"
+        try:
+            os.link(infile, tmpname)
+        except OSError:
+            return
+
+        os.replace(tmpname, self._cache_name(key))
+
+        cached = [os.path.join(self.cachedir, f)
+                  for f in os.listdir(self.cachedir) if f.endswith(".fits")]
+        cached.sort(key=os.path.getmtime, reverse=True)
+        for fname in cached[self.max_cached_images:]:
+            os.unlink(fname)
@@ -0,0 +1,91 @@
+"""Check the batched footprint search, using a fake footprint service"""
+
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+import pytest
+
+import coords.utils as cutils
+from ciao_contrib.cda import search
+
+
+# The fake observations: aim point and the distance from the aim
+# point to the edge of the field of view. The last one mimics HRC-S.
+OBS = np.asarray([(1, 10.0, 20.0, 0.15, "NONE"),
+                  (2, 10.3, 20.1, 0.15, "HETG"),
+                  (3, 11.0, 20.0, 0.8, "LETG"),
+                  (4, 30.0, -5.0, 0.15, "NONE")],
+                 dtype=[("ObsId", int), ("RA", float), ("Dec", float),
+                        ("fov", float), ("Grating", "U4")])
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """The footprint service returns the observations whose field of
+    view lies within SIZE degrees of POS."""
+
+    urls = []
+
+    def make_query(url):
+        urls.append(url)
+        query = parse_qs(urlparse(url).query)
+        (ra, dec) = [float(v) for v in query["POS"][0].split(",")]
+        size = float(query["SIZE"][0])
+        sep = np.asarray([cutils.point_separation(ra, dec, o["RA"], o["Dec"])
+                          for o in OBS])
+        idx = sep <= size + OBS["fov"]
+        if not idx.any():
+            return None
+
+        return OBS[idx]
+
+    monkeypatch.setattr(search, "_make_query", make_query)
+    return urls
+
+
+def check_same(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        if e is None:
+            assert g is None
+        else:
+            assert list(g["ObsId"]) == list(e["ObsId"])
+
+
+@pytest.mark.parametrize("grating", [None, ["NONE", "LETG"]])
+def test_batch_matches_single_queries(queries, grating):
+    rng = np.random.default_rng(3)
+    ras = np.concatenate([rng.uniform(9.5, 12.0, 40), [30.1, 100.0]])
+    decs = np.concatenate([rng.uniform(19.5, 20.5, 40), [-5.0, 60.0]])
+
+    expected = [search.search_chandra_archive(ra, dec, size=0.05,
+                                              grating=grating)
+                for ra, dec in zip(ras, decs)]
+
+    grouped = search.search_chandra_archive_batch(ras, decs, size=0.05,
+                                                  grating=grating,
+                                                  maxsize=0.5)
+    check_same(grouped, expected)
+
+    single = search.search_chandra_archive_batch(ras, decs, size=0.05,
+                                                 grating=grating,
+                                                 maxsize=0)
+    check_same(single, expected)
+
+    # HRC-S style observations are found well away from the aim point
+    assert any(e is not None and 3 in e["ObsId"] and
+               cutils.point_separation(ra, dec, 11.0, 20.0) > 0.5
+               for ra, dec, e in zip(ras, decs, expected))
+
+
+def test_batch_skips_distant_positions(queries):
+    ras = [100.0, 100.001, 100.002, 10.0, 10.001]
+    decs = [60.0, 60.0, 60.0, 20.0, 20.0]
+    ans = search.search_chandra_archive_batch(ras, decs, size=0.05)
+    assert ans[:3] == [None, None, None]
+    assert list(ans[3]["ObsId"]) == [1]
+    assert list(ans[4]["ObsId"]) == [1]
+
+    # one query per group and one per position near an observation
+    assert len(queries) == 4
@@ -0,0 +1,60 @@
+"""Check the dax plot commands, using a fake xpaset program"""
+
+import numpy as np
+
+import pytest
+
+import dax.dax_plot_utils as dpu
+from dax.utils import DaxSession
+
+
+@pytest.fixture
+def xpalog(tmp_path, monkeypatch):
+    """xpaset logs its arguments, and any data, to xpa.log"""
+
+    log = tmp_path / "xpa.log"
+    xpaset = tmp_path / "xpaset"
+    xpaset.write_text(f"""#!/bin/sh
+echo "set $*" >> {log}
+if [ "$1" != "-p" ]; then cat >> {log}; fi
+""")
+    xpaset.chmod(0o755)
+
+    def session(access_point):
+        return DaxSession(access_point, xpaset=str(xpaset), check=False)
+
+    monkeypatch.setattr(dpu, "_session", session)
+    return log
+
+
+def test_format_values():
+    x = np.asarray([0.1, 2.5e10, -3])
+    y = [1, 2, 3]
+    out = dpu.format_values(x, y)
+    assert out.decode().splitlines()[1] == "25000000000 2"
+    assert np.loadtxt(out.decode().splitlines()) == pytest.approx(
+        np.column_stack([x, y]))
+
+
+def test_blt_plot_model(xpalog):
+    dpu.blt_plot_model("ds9", [1, 2], [3, 4], "A title", "x", "y",
+                       new=False, step=False)
+    assert xpalog.read_text().splitlines() == [
+        "set -p ds9 plot dax close",
+        "set ds9 plot new name dax line {A title} {x } {y } xy",
+        "1 3", "2 4",
+        "set -p ds9 plot shape none",
+        "set -p ds9 plot shape fill no",
+        "set -p ds9 plot color orange",
+        "set -p ds9 plot shape color orange",
+        "set -p ds9 plot width 2",
+        "set -p ds9 plot name Model"]
+
+
+def test_blt_plot_delchisqr_steps(xpalog):
+    dpu.blt_plot_delchisqr("ds9", np.asarray([1.0, 2.0]),
+                           np.asarray([0.25, 0.25]),
+                           np.asarray([-1.0, 1.0]), np.ones(2), "")
+    lines = xpalog.read_text().splitlines()
+    idx = lines.index("set ds9 plot data xy", 4)
+    assert lines[idx + 1:idx + 4] == ["0.5 -1", "1.5 1", "2.5 1"]
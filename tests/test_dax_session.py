@@ -0,0 +1,197 @@
+"""Check the dax XPA session, using fake xpaget and xpaset programs"""
+
+import os
+import subprocess
+
+import pytest
+
+from dax.utils import DaxSession, _is_table
+
+
+@pytest.fixture
+def session(tmp_path):
+    """The fake programs log their arguments to xpa.log. xpaget
+    returns "value <last argument>" except for "file"."""
+
+    log = tmp_path / "xpa.log"
+    img = tmp_path / "img.fits"
+    img.write_text("image")
+
+    xpaget = tmp_path / "xpaget"
+    xpaget.write_text(f"""#!/bin/sh
+echo "get $*" >> {log}
+shift
+if [ "$*" = "file" ]; then echo {img}; else echo "value $*"; fi
+""")
+
+    xpaset = tmp_path / "xpaset"
+    xpaset.write_text(f"""#!/bin/sh
+echo "set $*" >> {log}
+""")
+
+    for prog in [xpaget, xpaset]:
+        prog.chmod(0o755)
+
+    return DaxSession("ds9", cachedir=str(tmp_path / "cache"),
+                      xpaget=str(xpaget), xpaset=str(xpaset))
+
+
+def read_log(session):
+    logfile = os.path.join(os.path.dirname(session._xpaget), "xpa.log")
+    try:
+        with open(logfile, "r") as fh:
+            return fh.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def test_get_is_remembered(session):
+    assert session.get("frame") == "value frame\n"
+    assert session.get("frame") == "value frame\n"
+    assert read_log(session) == ["get ds9 frame"]
+
+    # A set command may change the answer
+    session.set("frame 2")
+    assert session.get("frame") == "value frame\n"
+    assert read_log(session) == ["get ds9 frame", "set -p ds9 frame 2",
+                                 "get ds9 frame"]
+
+
+def fits_hdu(cards, nbytes=0):
+    """A FITS HDU with the given header cards and nbytes of data"""
+
+    hdr = "".join(f"{key:<8}= {val:>20}".ljust(80) for key, val in cards)
+    hdr = (hdr + "END".ljust(80)).encode()
+    hdr += b" " * (-len(hdr) % 2880)
+    return hdr + b"\0" * (nbytes + (-nbytes % 2880))
+
+
+IMAGE = fits_hdu([("SIMPLE", "T"), ("BITPIX", 16), ("NAXIS", 2),
+                  ("NAXIS1", 40), ("NAXIS2", 50)], 4000)
+
+EVENTS = fits_hdu([("SIMPLE", "T"), ("BITPIX", 8), ("NAXIS", 0)]) + \
+    fits_hdu([("XTENSION", "'BINTABLE'"), ("BITPIX", 8), ("NAXIS", 2),
+              ("NAXIS1", 16), ("NAXIS2", 300), ("PCOUNT", 0),
+              ("GCOUNT", 1), ("EXTNAME", "'EVENTS'")], 4800)
+
+MASK = fits_hdu([("XTENSION", "'IMAGE'"), ("BITPIX", -32), ("NAXIS", 2),
+                 ("NAXIS1", 10), ("NAXIS2", 10), ("EXTNAME", "'MASK'")], 400)
+
+
+def test_is_table_events(tmp_path):
+    infile = tmp_path / "evt.fits"
+    infile.write_bytes(EVENTS)
+    assert _is_table(str(infile))
+
+
+@pytest.mark.parametrize("ext,expected",
+                         [("", False), ("[EVENTS]", True),
+                          ("[events,ccd_id=7]", True), ("[1]", True),
+                          ("[MASK]", False), ("[2]", False)])
+def test_is_table_extension(tmp_path, ext, expected):
+    """Without an extension ds9 loads the first image"""
+
+    infile = tmp_path / "evt.fits"
+    infile.write_bytes(EVENTS + MASK)
+    assert _is_table(f"{infile}{ext}") == expected
+
+
+def test_is_table_image(tmp_path):
+    infile = tmp_path / "img.fits"
+    infile.write_bytes(IMAGE)
+    assert not _is_table(str(infile))
+
+
+def test_image_key_queries_for_image(session, tmp_path):
+    (tmp_path / "img.fits").write_bytes(IMAGE)
+    assert session.image_key() is not None
+    assert read_log(session) == ["get ds9 file", "get ds9 frame",
+                                 "get ds9 crop image", "get ds9 block",
+                                 "get ds9 smooth"]
+
+
+def test_image_key_queries_for_table(session, tmp_path):
+    (tmp_path / "img.fits").write_bytes(EVENTS)
+    assert session.image_key() is not None
+    assert read_log(session) == ["get ds9 file", "get ds9 frame",
+                                 "get ds9 crop image", "get ds9 block",
+                                 "get ds9 bin factor", "get ds9 bin about",
+                                 "get ds9 bin cols", "get ds9 bin filter",
+                                 "get ds9 bin function",
+                                 "get ds9 bin buffersize",
+                                 "get ds9 smooth"]
+
+
+@pytest.mark.parametrize("check", [True, False])
+def test_set_check(session, check):
+    """An error is only raised when check is set."""
+
+    with open(session._xpaset, "a") as fh:
+        fh.write('[ "$3" = "bad" ] && exit 1\nexit 0\n')
+
+    session.check = check
+    if check:
+        with pytest.raises(subprocess.CalledProcessError):
+            session.set("bad")
+    else:
+        session.set("bad")
+
+    assert read_log(session) == ["set -p ds9 bad"]
+
+
+def test_set_async_keeps_order(session):
+    session.set_async("prism")
+    session.set("tile yes")
+    session.set_async("prism close")
+    session.wait()
+    assert read_log(session) == ["set -p ds9 prism", "set -p ds9 tile yes",
+                                 "set -p ds9 prism close"]
+
+
+def test_image_cache(session, tmp_path):
+    key = session.image_key()
+    assert key is not None
+
+    outfile = str(tmp_path / "out.fits")
+    assert not session.fetch_image(key, outfile)
+
+    with open(outfile, "w") as fh:
+        fh.write("blocked image")
+
+    session.store_image(key, outfile)
+    os.unlink(outfile)
+
+    # The answer does not need xpaget to be re-run
+    nlog = len(read_log(session))
+    assert session.image_key() == key
+    assert len(read_log(session)) == nlog
+
+    assert session.fetch_image(key, outfile)
+    with open(outfile, "r") as fh:
+        assert fh.read() == "blocked image"
+
+    # Changing the input file changes the key
+    img = tmp_path / "img.fits"
+    img.write_text("a new image")
+    session.set("frame 1")
+    assert session.image_key() != key
+
+
+def test_image_cache_is_pruned(session, tmp_path):
+    # The cache uses hard links, so each image needs its own file.
+    def make_image(name):
+        infile = str(tmp_path / f"{name}.in")
+        with open(infile, "w") as fh:
+            fh.write(name)
+
+        return infile
+
+    for i in range(session.max_cached_images + 2):
+        session.store_image(f"key{i}", make_image(f"key{i}"))
+        os.utime(session._cache_name(f"key{i}"), (i, i))
+
+    session.store_image("last", make_image("last"))
+    cached = sorted(os.listdir(session.cachedir))
+    assert len(cached) == session.max_cached_images
+    assert "last.fits" in cached
+    assert "key0.fits" not in cached
@@ -0,0 +1,83 @@
+"""Check map2reg, which requires CIAO"""
+
+import numpy as np
+
+import pytest
+
+pytest.importorskip("pycrates")
+pytest.importorskip("region")
+
+from region import CXCRegion
+
+import ciao_contrib.runtool as rt
+from crates_contrib.utils import make_table_crate
+
+
+# The map, binned from events with a bin size of 2 starting at
+# x=4000 and y=4100, so that the physical and logical coordinates
+# differ. The groups are only connected along pixel edges, which
+# both methods agree on.
+#
+MAP = np.asarray([[1, 1, 2, 2, 2, 0],
+                  [1, 0, 0, 2, 3, 3],
+                  [1, 1, 0, 2, 3, 3],
+                  [4, 4, 4, 4, 3, 0]])
+
+X0 = 4000
+Y0 = 4100
+BINSIZE = 2
+
+
+@pytest.fixture
+def mapfile(tmp_path):
+    """Create the map by binning up events at the pixel centers"""
+
+    jj, ii = np.nonzero(MAP)
+    counts = MAP[jj, ii]
+    xpos = np.repeat(X0 + (ii + 0.5) * BINSIZE, counts)
+    ypos = np.repeat(Y0 + (jj + 0.5) * BINSIZE, counts)
+
+    evtfile = str(tmp_path / "evt.fits")
+    make_table_crate(xpos, ypos, colnames=["x", "y"]).write(evtfile)
+
+    ny, nx = MAP.shape
+    outfile = str(tmp_path / "map.fits")
+    dmcopy = rt.make_tool("dmcopy")
+    dmcopy(f"{evtfile}[bin x={X0}:{X0 + nx * BINSIZE}:{BINSIZE},"
+           f"y={Y0}:{Y0 + ny * BINSIZE}:{BINSIZE}]",
+           outfile, clobber=True)
+    return outfile
+
+
+def run_map2reg(infile, outfile, method):
+    map2reg = rt.make_tool("map2reg")
+    map2reg(infile, outfile, method=method, parallel=False, clobber=True)
+    return CXCRegion(outfile)
+
+
+def test_trace_matches_lasso_in_physical_coords(mapfile, tmp_path):
+    trace = run_map2reg(mapfile, str(tmp_path / "trace.reg"), "trace")
+    lasso = run_map2reg(mapfile, str(tmp_path / "lasso.reg"), "lasso")
+
+    assert len(trace.shapes) == len(lasso.shapes)
+
+    ny, nx = MAP.shape
+    expected = {"x0": X0, "y0": Y0,
+                "x1": X0 + nx * BINSIZE, "y1": Y0 + ny * BINSIZE}
+    assert trace.extent() == pytest.approx(expected)
+    assert lasso.extent() == pytest.approx(expected)
+
+    # Check points within each pixel, avoiding the pixel edges.
+    step = BINSIZE / 4
+    xgrid, ygrid = np.meshgrid(X0 + step / 2 + np.arange(4 * nx) * step,
+                               Y0 + step / 2 + np.arange(4 * ny) * step)
+    xgrid = xgrid.flatten()
+    ygrid = ygrid.flatten()
+
+    got = np.asarray(trace.is_inside(xgrid, ygrid), dtype=bool)
+    assert got.tolist() == np.asarray(lasso.is_inside(xgrid, ygrid),
+                                      dtype=bool).tolist()
+
+    ii = ((xgrid - X0) // BINSIZE).astype(int)
+    jj = ((ygrid - Y0) // BINSIZE).astype(int)
+    assert got.tolist() == (MAP[jj, ii] > 0).tolist()